@@ -2,10 +2,62 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from app.db import pool_metrics
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
 
-engine = create_engine(DATABASE_URL, future=True)
+
+def _env_bool(name: str, default: bool) -> bool:
+    val = os.getenv(name)
+    if val is None:
+        return default
+    return val.strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+# DB_ASYNC=1 — роутеры работают через AsyncSession (см. app/src/deps.py:db_route)
+DB_ASYNC = _env_bool("DB_ASYNC", False)
+# по умолчанию тот же URL: диалект postgresql+psycopg умеет и sync, и async
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL
+
+# Настройки пула (на каждый процесс-воркер; для async-движка — отдельный пул с теми же настройками)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))        # сек. ожидания свободного соединения
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))        # сек., -1 — не пересоздавать
+DB_POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", True)             # проверка соединения перед выдачей
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 — без ограничения
+
+
+def _engine_kwargs(url: str, poolclass) -> dict:
+    kwargs = dict(pool_pre_ping=DB_POOL_PRE_PING, pool_recycle=DB_POOL_RECYCLE)
+    if not url.startswith("postgresql"):
+        return kwargs
+    kwargs.update(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return kwargs
+
+
+engine = create_engine(DATABASE_URL, future=True, **_engine_kwargs(DATABASE_URL, pool_metrics.TimedQueuePool))
+pool_metrics.instrument(engine, "sync")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL, pool_metrics.TimedAsyncAdaptedQueuePool)
+    )
+    pool_metrics.instrument(async_engine.sync_engine, "async")
+    # expire_on_commit=False: ответ сериализуется уже вне greenlet'а, ленивые догрузки там невозможны
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
@@ -1,9 +0,0 @@
-from sqlalchemy.orm import Session
-from .base import SessionLocal
-
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -3,16 +3,18 @@ from datetime import datetime, date
 from decimal import Decimal
 from sqlalchemy import (
     String, DateTime, Date, Boolean, Text, Enum,
-    ForeignKey, Numeric, CheckConstraint, Integer, BigInteger
+    ForeignKey, ForeignKeyConstraint, Numeric, JSON, CheckConstraint, Integer, BigInteger, Index, UniqueConstraint, text
 )
 from sqlalchemy.sql import func
 from sqlalchemy.orm import Mapped, mapped_column
 from .base import Base
 
-Role = Enum("viewer", "editor", name="role_enum", native_enum=False)
-Granularity = Enum("day", "week", "month", "year", name="granularity_enum", native_enum=False)
-Kind = Enum("planned", "actual", name="kind_enum", native_enum=False)
-Sign = Enum("income", "expense", "transfer", name="sign_enum", native_enum=False)
+# В Postgres это нативные ENUM-типы (миграция e3f294fc3778); тип модели должен совпадать,
+# иначе multi-row INSERT (insertmanyvalues) приводит значения к VARCHAR и падает
+Role = Enum("viewer", "editor", name="role_enum")
+Granularity = Enum("day", "week", "month", "year", name="granularity_enum")
+Kind = Enum("planned", "actual", name="kind_enum")
+Sign = Enum("income", "expense", "transfer", name="sign_enum")
 
 class User(Base):
     __tablename__ = "user"
@@ -30,6 +32,10 @@ class Budget(Base):
     name: Mapped[str] = mapped_column(String(200), nullable=False)
     currency: Mapped[str] = mapped_column(String(3), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # растут при изменении счетов/категорий/шагов бюджета — ETag списков, см. app/src/versions.py
+    version: Mapped[int] = mapped_column(BigInteger, server_default=text("1"), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (Index("ix_budget_owner", "owner_user_id", "id"),)
 
 class BudgetShare(Base):
     __tablename__ = "budget_share"
@@ -37,7 +43,11 @@ class BudgetShare(Base):
     budget_id: Mapped[int] = mapped_column(ForeignKey("budget.id", ondelete="CASCADE"), nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
     role: Mapped[str] = mapped_column(Role, nullable=False)
-    __table_args__ = (CheckConstraint("role in ('viewer','editor')"),)
+    __table_args__ = (
+        CheckConstraint("role in ('viewer','editor')"),
+        Index("ix_budget_share_user", "user_id", "budget_id", postgresql_include=["role"]),
+        Index("ix_budget_share_budget", "budget_id", "user_id"),
+    )
 
 class BudgetStep(Base):
     __tablename__ = "budget_step"
@@ -48,6 +58,10 @@ class BudgetStep(Base):
     date_start: Mapped[date] = mapped_column(Date, nullable=False)
     date_end: Mapped[date] = mapped_column(Date, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # растут при записи операций шага — ETag ленты/сводки, см. app/src/versions.py
+    version: Mapped[int] = mapped_column(BigInteger, server_default=text("1"), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (Index("ix_budget_step_budget_start", "budget_id", text("date_start DESC"), text("id DESC")),)
 
 class Account(Base):
     __tablename__ = "account"
@@ -57,17 +71,38 @@ class Account(Base):
     currency: Mapped[str] = mapped_column(String(3), nullable=False)
     is_archived: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (Index("ix_account_budget", "budget_id", "id"),)
 
 class Category(Base):
     __tablename__ = "category"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     budget_id: Mapped[int] = mapped_column(ForeignKey("budget.id", ondelete="CASCADE"), nullable=False)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
+    # родитель в том же бюджете; дерево целиком — в category_closure (см. app/src/category_tree.py)
+    parent_id: Mapped[int | None] = mapped_column(ForeignKey("category.id", ondelete="RESTRICT"))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (
+        Index("ix_category_budget", "budget_id", "id"),
+        Index("ix_category_parent", "parent_id"),
+    )
+
+class CategoryClosure(Base):
+    """Все пары предок -> потомок дерева категорий (включая саму категорию с depth 0)."""
+    __tablename__ = "category_closure"
+    ancestor_id: Mapped[int] = mapped_column(ForeignKey("category.id", ondelete="CASCADE"), primary_key=True)
+    descendant_id: Mapped[int] = mapped_column(ForeignKey("category.id", ondelete="CASCADE"), primary_key=True)
+    depth: Mapped[int] = mapped_column(Integer, nullable=False)
+    # PK (ancestor_id, descendant_id) — поддерево; обратный индекс — предки категории (свёртка сумм вверх)
+    __table_args__ = (Index("ix_category_closure_descendant", "descendant_id", "ancestor_id", "depth"),)
 
 class Operation(Base):
     __tablename__ = "operation"
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # В Postgres таблица секционирована по hash(budget_id) и её первичный ключ — (id, budget_id)
+    # (миграция d4a8f3e1b9c2; секции создаёт только она). id по-прежнему уникален (общая последовательность),
+    # поэтому в модели ключ — id, а (id, budget_id) — уникальный ключ для ссылки плана: так схема
+    # из metadata.create_all (SQLite, стенды) остаётся обычной таблицей с автоинкрементом.
+    # на SQLite автоинкремент есть только у INTEGER PRIMARY KEY
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
     budget_id: Mapped[int] = mapped_column(ForeignKey("budget.id", ondelete="CASCADE"), nullable=False)
     step_id: Mapped[int] = mapped_column(ForeignKey("budget_step.id", ondelete="RESTRICT"), nullable=False)
     kind: Mapped[str] = mapped_column(Kind, nullable=False)      # planned | actual
@@ -79,7 +114,94 @@ class Operation(Base):
     account_id_to: Mapped[int | None] = mapped_column(ForeignKey("account.id", ondelete="RESTRICT"))
     category_id: Mapped[int | None] = mapped_column(ForeignKey("category.id", ondelete="SET NULL"))
     comment: Mapped[str | None] = mapped_column(Text)
-    planned_ref_id: Mapped[int | None] = mapped_column(ForeignKey("operation.id", ondelete="RESTRICT"))
+    planned_ref_id: Mapped[int | None] = mapped_column(BigInteger().with_variant(Integer, "sqlite"))
     created_by: Mapped[int | None] = mapped_column(ForeignKey("user.id", ondelete="SET NULL"))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    __table_args__ = (CheckConstraint("amount > 0", name="ck_amount_positive"),)
+    # отпечаток строки выписки (см. app/src/imports.py): повторный импорт не создаёт дублей
+    import_hash: Mapped[str | None] = mapped_column(String(32))
+    __table_args__ = (
+        CheckConstraint("amount > 0", name="ck_amount_positive"),
+        # в секционированной таблице его роль играет первичный ключ (см. include_object в migrations/env.py)
+        UniqueConstraint("id", "budget_id", name="uq_operation_id_budget"),
+        # ссылка факта на план — внутри бюджета: внешний ключ секционированной таблицы включает budget_id
+        ForeignKeyConstraint(
+            ["planned_ref_id", "budget_id"], ["operation.id", "operation.budget_id"],
+            ondelete="RESTRICT", name="operation_planned_ref_id_fkey",
+        ),
+        # индексы горячих путей — см. миграцию 048a93199e14
+        Index("ix_operation_step_kind", "step_id", "kind", "id", postgresql_include=["sign", "amount", "currency"]),
+        Index("ix_operation_step_created", "step_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_operation_budget", "budget_id"),
+        Index("ix_operation_planned_ref", "planned_ref_id", postgresql_where=text("planned_ref_id IS NOT NULL")),
+        # балансы счетов — см. миграцию 9c41d2e7b5a8
+        Index("ix_operation_account_date", "account_id", "date", postgresql_include=["id", "kind", "sign", "amount"]),
+        Index("ix_operation_account_to_date", "account_id_to", "date",
+              postgresql_include=["id", "kind", "sign", "amount"], postgresql_where=text("account_id_to IS NOT NULL")),
+        # импорт выписок — см. миграцию e5b19c7a3f62
+        Index("ux_operation_import_hash", "budget_id", "import_hash", unique=True,
+              postgresql_where=text("import_hash IS NOT NULL"), sqlite_where=text("import_hash IS NOT NULL")),
+    )
+
+class StepTotal(Base):
+    """Агрегаты операций шага (по kind/sign/currency), поддерживаются в пути записи — см. app/src/totals.py."""
+    __tablename__ = "step_totals"
+    step_id: Mapped[int] = mapped_column(ForeignKey("budget_step.id", ondelete="CASCADE"), primary_key=True)
+    # в step_totals kind/sign — строки (миграция 6f0716c3c37e), не ENUM-типы
+    kind: Mapped[str] = mapped_column(String(7), primary_key=True)
+    sign: Mapped[str] = mapped_column(String(8), primary_key=True)
+    currency: Mapped[str] = mapped_column(String(3), primary_key=True)
+    amount: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False, default=0)
+    ops_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+class AccountBalanceSnapshot(Base):
+    """
+    Баланс счёта по фактическим операциям с date <= as_of и id <= max_op_id.
+    Операции, записанные позже (в том числе задним числом), добираются дельтой — см. app/src/balances.py.
+    """
+    __tablename__ = "account_balance_snapshot"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    account_id: Mapped[int] = mapped_column(ForeignKey("account.id", ondelete="CASCADE"), nullable=False)
+    as_of: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    max_op_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    balance: Mapped[Decimal] = mapped_column(Numeric(18, 2), nullable=False)
+    # операции в валюте, отличной от валюты счёта: в balance не входят
+    unconverted_ops: Mapped[int] = mapped_column(Integer, server_default="0", nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    __table_args__ = (UniqueConstraint("account_id", "as_of", name="uq_account_balance_snapshot_as_of"),)
+
+class ImportJob(Base):
+    """Фоновый импорт выписки в операции бюджета — см. app/src/imports.py."""
+    __tablename__ = "import_job"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    budget_id: Mapped[int] = mapped_column(ForeignKey("budget.id", ondelete="CASCADE"), nullable=False)
+    account_id: Mapped[int] = mapped_column(ForeignKey("account.id", ondelete="CASCADE"), nullable=False)
+    format: Mapped[str] = mapped_column(String(8), nullable=False)      # csv | ofx
+    status: Mapped[str] = mapped_column(String(16), server_default="queued", nullable=False)  # queued | running | done | failed
+    bytes_total: Mapped[int] = mapped_column(BigInteger, server_default=text("0"), nullable=False)
+    bytes_read: Mapped[int] = mapped_column(BigInteger, server_default=text("0"), nullable=False)
+    rows_read: Mapped[int] = mapped_column(Integer, server_default=text("0"), nullable=False)
+    created: Mapped[int] = mapped_column(Integer, server_default=text("0"), nullable=False)
+    duplicates: Mapped[int] = mapped_column(Integer, server_default=text("0"), nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, server_default=text("0"), nullable=False)
+    errors: Mapped[list | None] = mapped_column(JSON)                   # [{"row": N, "error": "..."}], row 0 — файл целиком
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    __table_args__ = (Index("ix_import_job_budget", "budget_id", "id"),)
+
+class FxRate(Base):
+    """Курс: 1 base = rate quote на дату date (действует до следующей даты пары) — см. app/src/fx.py."""
+    __tablename__ = "fx_rate"
+    base: Mapped[str] = mapped_column(String(3), primary_key=True)
+    quote: Mapped[str] = mapped_column(String(3), primary_key=True)
+    # PK (base, quote, date) — он же индекс поиска курса «на дату»: последний date <= нужной
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    rate: Mapped[Decimal] = mapped_column(Numeric(20, 10), nullable=False)
+    __table_args__ = (CheckConstraint("rate > 0", name="ck_fx_rate_positive"),)
+
+class FxLoad(Base):
+    """Журнал загрузок курсов: последний id — версия курсов в ключе кеша app/src/fx.py."""
+    __tablename__ = "fx_load"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    rows: Mapped[int] = mapped_column(Integer, nullable=False)
+    loaded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,129 @@
+"""
+Метрики пула соединений: события пула (connect/checkout/checkin/invalidate)
+плюс время ожидания свободного соединения, измеряемое в TimedQueuePool._do_get.
+Отдаются через /api/internal/pool.
+"""
+import threading
+from time import perf_counter
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+# Границы корзин гистограммы времени получения соединения, в секундах
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.waits = 0          # checkout ждал: свободных нет и overflow исчерпан
+        self.timeouts = 0       # ожидание закончилось TimeoutError
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def observe_get(self, seconds: float, waited: bool, timed_out: bool) -> None:
+        with self._lock:
+            if waited:
+                self.waits += 1
+            if timed_out:
+                self.timeouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                # кумулятивно, как бакеты Prometheus: le -> число получений не дольше le
+                "wait_histogram": {
+                    ("+Inf" if b == float("inf") else str(b)): sum(self.wait_buckets[: i + 1])
+                    for i, b in enumerate(WAIT_BUCKETS)
+                },
+            }
+
+
+class _TimedGetMixin:
+    """Измеряет время получения соединения из очереди пула (включая ожидание)."""
+    stats: PoolStats
+
+    def _do_get(self):
+        waited = self._pool.empty() and self._max_overflow > -1 and self._overflow >= self._max_overflow
+        t0 = perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            stats = getattr(self, "stats", None)
+            if stats is not None:
+                stats.observe_get(perf_counter() - t0, waited, timed_out)
+
+
+class TimedQueuePool(_TimedGetMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedGetMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+_registry: dict[str, tuple] = {}
+
+
+def instrument(engine, name: str) -> PoolStats:
+    """Подписывает пул engine на события и регистрирует его под именем name."""
+    pool = engine.pool
+    stats = PoolStats()
+    pool.stats = stats
+
+    event.listen(pool, "connect", lambda *a: stats.incr("connects"))
+    event.listen(pool, "checkout", lambda *a: stats.incr("checkouts"))
+    event.listen(pool, "checkin", lambda *a: stats.incr("checkins"))
+    event.listen(pool, "invalidate", lambda *a: stats.incr("invalidations"))
+
+    _registry[name] = (engine, stats)
+    return stats
+
+
+def pool_status() -> dict:
+    out = {}
+    for name, (engine, stats) in _registry.items():
+        # после dispose() у engine новый пул того же класса — статистику переносим
+        pool = engine.pool
+        if getattr(pool, "stats", None) is not stats:
+            pool.stats = stats
+        info = {"class": type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            info.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                overflow=pool.overflow(),
+                max_overflow=pool._max_overflow,
+                timeout=pool.timeout(),
+            )
+        info.update(stats.snapshot())
+        out[name] = info
+    return out
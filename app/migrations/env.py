@@ -1,4 +1,5 @@
 import os
+import re
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config, pool
@@ -17,6 +18,21 @@ if config.config_file_name is not None:
 # Метаданные моделей для autogenerate
 target_metadata = Base.metadata
 
+# operation секционирована миграцией d4a8f3e1b9c2, а в модели это обычная таблица
+PARTITION_RE = re.compile(r"operation_p\d+")
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # секции operation_pNN (вместе с их индексами)
+    if type_ == "table" and PARTITION_RE.fullmatch(name):
+        return False
+    # ссылку planned_ref_id Postgres дублирует на родителе для каждой секции (служебные копии внешнего ключа)
+    if type_ == "foreign_key_constraint" and reflected and compare_to is None and obj.table.name == "operation":
+        return False
+    # (id, budget_id) в секционированной таблице — первичный ключ, отдельного уникального нет
+    if type_ == "unique_constraint" and name == "uq_operation_id_budget" and compare_to is None:
+        return False
+    return True
+
 def get_url() -> str:
     # Пробуем взять готовый DATABASE_URL (например: postgresql+psycopg2://user:pass@db:5432/budget)
     url = os.getenv("DATABASE_URL")
@@ -40,6 +56,7 @@ def run_migrations_offline():
         dialect_opts={"paramstyle": "named"},
         compare_type=True,       # сравнивать также типы колонок
         compare_server_default=True,
+        include_object=include_object,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -61,6 +78,7 @@ def run_migrations_online():
             target_metadata=target_metadata,
             compare_type=True,
             compare_server_default=True,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
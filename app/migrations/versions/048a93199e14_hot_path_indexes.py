@@ -0,0 +1,58 @@
+"""hot path indexes
+
+Revision ID: 048a93199e14
+Revises: 2b1a9c0a9b3b
+Create Date: 2026-10-18 00:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '048a93199e14'
+down_revision: Union[str, Sequence[str], None] = '2b1a9c0a9b3b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, include, where) — подобраны под запросы steps.py / operations.py
+INDEXES = [
+    # /steps/{id}/summary, copy_planned, /operations?step_id=&kind= (ORDER BY id)
+    ('ix_operation_step_kind', 'operation', ['step_id', 'kind', 'id'], ['sign', 'amount', 'currency'], None),
+    # /steps/{id}/feed: ORDER BY created_at DESC, id DESC + keyset-курсор
+    ('ix_operation_step_created', 'operation', ['step_id', sa.text('created_at DESC'), sa.text('id DESC')], None, None),
+    # каскадное удаление бюджета и проверки FK
+    ('ix_operation_budget', 'operation', ['budget_id'], None, None),
+    ('ix_operation_planned_ref', 'operation', ['planned_ref_id'], None, 'planned_ref_id IS NOT NULL'),
+    # /steps?budget_id= ORDER BY date_start DESC, id DESC
+    ('ix_budget_step_budget_start', 'budget_step', ['budget_id', sa.text('date_start DESC'), sa.text('id DESC')], None, None),
+    # /accounts?budget_id=, /categories?budget_id= (ORDER BY id DESC — обратный проход индекса)
+    ('ix_account_budget', 'account', ['budget_id', 'id'], None, None),
+    ('ix_category_budget', 'category', ['budget_id', 'id'], None, None),
+    # /budgets?owner_user_id=
+    ('ix_budget_owner', 'budget', ['owner_user_id', 'id'], None, None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema: secondary indexes, built CONCURRENTLY (without write locks)."""
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, include, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_include=include or [],
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema: drop secondary indexes."""
+    with op.get_context().autocommit_block():
+        for name, table, *_ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
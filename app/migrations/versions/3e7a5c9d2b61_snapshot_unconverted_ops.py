@@ -0,0 +1,29 @@
+"""account_balance_snapshot.unconverted_ops: operations in another currency left out of the balance
+
+Revision ID: 3e7a5c9d2b61
+Revises: 5d2b8e7c1f40
+Create Date: 2026-10-18 12:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e7a5c9d2b61'
+down_revision: Union[str, Sequence[str], None] = '5d2b8e7c1f40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: account_balance_snapshot.unconverted_ops."""
+    op.add_column('account_balance_snapshot',
+    sa.Column('unconverted_ops', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('account_balance_snapshot', 'unconverted_ops')
@@ -0,0 +1,33 @@
+"""fx_load: journal of currency rate loads (fx cache version)
+
+Revision ID: 5d2b8e7c1f40
+Revises: c8e1f4a2d6b9
+Create Date: 2026-10-18 08:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2b8e7c1f40'
+down_revision: Union[str, Sequence[str], None] = 'c8e1f4a2d6b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: fx_load (id, rows, loaded_at)."""
+    op.create_table('fx_load',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rows', sa.Integer(), nullable=False),
+    sa.Column('loaded_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('fx_load')
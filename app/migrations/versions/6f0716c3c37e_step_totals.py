@@ -0,0 +1,43 @@
+"""step totals
+
+Revision ID: 6f0716c3c37e
+Revises: 048a93199e14
+Create Date: 2026-10-18 00:10:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f0716c3c37e'
+down_revision: Union[str, Sequence[str], None] = '048a93199e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: step_totals + backfill from existing operations."""
+    op.create_table('step_totals',
+    sa.Column('step_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=7), nullable=False),
+    sa.Column('sign', sa.String(length=8), nullable=False),
+    sa.Column('currency', sa.String(length=3), nullable=False),
+    sa.Column('amount', sa.Numeric(precision=18, scale=2), server_default='0', nullable=False),
+    sa.Column('ops_count', sa.BigInteger(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['step_id'], ['budget_step.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('step_id', 'kind', 'sign', 'currency')
+    )
+    op.execute("""
+        INSERT INTO step_totals (step_id, kind, sign, currency, amount, ops_count)
+        SELECT step_id, kind::text, sign::text, currency, sum(amount), count(*)
+        FROM operation
+        GROUP BY step_id, kind, sign, currency
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('step_totals')
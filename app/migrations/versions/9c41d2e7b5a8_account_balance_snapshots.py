@@ -0,0 +1,58 @@
+"""account balance snapshots
+
+Revision ID: 9c41d2e7b5a8
+Revises: 6f0716c3c37e
+Create Date: 2026-10-18 00:20:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c41d2e7b5a8'
+down_revision: Union[str, Sequence[str], None] = '6f0716c3c37e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# дельта баланса счёта после снимка: операции по account_id / account_id_to с date > as_of или id > max_op_id
+INDEXES = [
+    ('ix_operation_account_date', 'operation', ['account_id', 'date'], ['id', 'kind', 'sign', 'amount'], None),
+    ('ix_operation_account_to_date', 'operation', ['account_id_to', 'date'], ['id', 'kind', 'sign', 'amount'],
+     'account_id_to IS NOT NULL'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema: account_balance_snapshot + operation indexes by account and date."""
+    op.create_table('account_balance_snapshot',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('max_op_id', sa.BigInteger(), nullable=False),
+    sa.Column('balance', sa.Numeric(precision=18, scale=2), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account_id', 'as_of', name='uq_account_balance_snapshot_as_of')
+    )
+    with op.get_context().autocommit_block():
+        for name, table, columns, include, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_include=include,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, *_ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    op.drop_table('account_balance_snapshot')
@@ -0,0 +1,45 @@
+"""category tree: category.parent_id + category_closure
+
+Revision ID: a7d3e9f0c514
+Revises: f2c8a6d41e93
+Create Date: 2026-10-18 05:00:00.000000+00:00
+
+Существующие категории становятся корнями: в category_closure — только пары (id, id, 0).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3e9f0c514'
+down_revision: Union[str, Sequence[str], None] = 'f2c8a6d41e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: category.parent_id and the closure table of the category tree."""
+    op.add_column('category', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('category_parent_id_fkey', 'category', 'category', ['parent_id'], ['id'], ondelete='RESTRICT')
+    op.create_index('ix_category_parent', 'category', ['parent_id'])
+    op.create_table('category_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['category.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_category_closure_descendant', 'category_closure', ['descendant_id', 'ancestor_id', 'depth'])
+    op.execute('INSERT INTO category_closure (ancestor_id, descendant_id, depth) SELECT id, id, 0 FROM category')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_category_closure_descendant', table_name='category_closure')
+    op.drop_table('category_closure')
+    op.drop_index('ix_category_parent', table_name='category')
+    op.drop_constraint('category_parent_id_fkey', 'category', type_='foreignkey')
+    op.drop_column('category', 'parent_id')
@@ -0,0 +1,53 @@
+"""operation comment search: full-text and trigram GIN indexes
+
+Revision ID: b3f6c1d8e2a7
+Revises: a7d3e9f0c514
+Create Date: 2026-10-18 06:00:00.000000+00:00
+
+Полнотекстовый индекс — по выражению, а не по хранимой generated-колонке tsvector: добавление
+STORED-колонки переписывает всю operation под ACCESS EXCLUSIVE, а индекс строится без блокировки
+записи тем же способом, что и в e5b19c7a3f62 (ON ONLY на родителе, CONCURRENTLY на секциях, ATTACH).
+Выражение должно совпадать с app/src/search.py. Нужно расширение pg_trgm (создаётся, если его нет).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f6c1d8e2a7'
+down_revision: Union[str, Sequence[str], None] = 'a7d3e9f0c514'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_operation_comment_tsv', 'comment_tsv', "USING gin (to_tsvector('russian', coalesce(comment, '')))"),
+    ('ix_operation_comment_trgm', 'comment_trgm', 'USING gin (comment gin_trgm_ops)'),
+]
+
+
+def _partitions() -> list[str]:
+    return list(op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'operation'::regclass ORDER BY c.relname"
+    )).scalars())
+
+
+def upgrade() -> None:
+    """Upgrade schema: GIN indexes for comment search on every operation partition."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, _, definition in INDEXES:
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON ONLY operation {definition}')
+    partitions = _partitions()
+    with op.get_context().autocommit_block():
+        for part in partitions:
+            for name, suffix, definition in INDEXES:
+                op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {part}_{suffix} ON {part} {definition}')
+                op.execute(f'ALTER INDEX {name} ATTACH PARTITION {part}_{suffix}')
+
+
+def downgrade() -> None:
+    """Downgrade schema (pg_trgm остаётся: расширение может использоваться не только здесь)."""
+    for name, _, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
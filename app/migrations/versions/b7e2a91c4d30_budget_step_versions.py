@@ -0,0 +1,37 @@
+"""budget and step versions for conditional GET
+
+Revision ID: b7e2a91c4d30
+Revises: 9c41d2e7b5a8
+Create Date: 2026-10-18 01:10:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2a91c4d30'
+down_revision: Union[str, Sequence[str], None] = '9c41d2e7b5a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ['budget', 'budget_step']
+
+
+def upgrade() -> None:
+    """Upgrade schema: version/updated_at on budget and budget_step (ETag / Last-Modified)."""
+    # константные DEFAULT в Postgres 11+ не переписывают таблицу
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.BigInteger(), server_default=sa.text('1'), nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                                       nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(TABLES):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'version')
@@ -0,0 +1,46 @@
+"""budget_share indexes for access checks
+
+Revision ID: c8e1f4a2d6b9
+Revises: b3f6c1d8e2a7
+Create Date: 2026-10-18 07:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e1f4a2d6b9'
+down_revision: Union[str, Sequence[str], None] = 'b3f6c1d8e2a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, include) — подобраны под запросы app/src/acl.py и /budgets/{id}/shares
+INDEXES = [
+    # карта ролей пользователя (acl.load_roles): index-only scan по user_id
+    ('ix_budget_share_user', 'budget_share', ['user_id', 'budget_id'], ['role']),
+    # /budgets/{id}/shares, каскадное удаление бюджета
+    ('ix_budget_share_budget', 'budget_share', ['budget_id', 'user_id'], None),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema: budget_share indexes, built CONCURRENTLY (without write locks)."""
+    with op.get_context().autocommit_block():
+        for name, table, columns, include in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_include=include or [],
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema: drop budget_share indexes."""
+    with op.get_context().autocommit_block():
+        for name, table, *_ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,193 @@
+"""partition operation by hash of budget_id
+
+Revision ID: d4a8f3e1b9c2
+Revises: b7e2a91c4d30
+Create Date: 2026-10-18 02:30:00.000000+00:00
+
+Таблица operation пересобирается онлайн, без долгих блокировок:
+
+1. (транзакция) operation_new — копия структуры (LIKE: колонки, DEFAULT с той же последовательностью,
+   CHECK), PARTITION BY HASH (budget_id) на OPERATION_PARTITIONS секций, PK (id, budget_id),
+   внешние ключи и индексы на пустой таблице; триггер на operation зеркалирует в неё
+   INSERT/UPDATE/DELETE, сделанные во время переноса.
+2. (autocommit) строки переносятся пачками по OPERATION_COPY_BATCH id; каждая пачка — своя короткая
+   транзакция, исходные строки пачки берутся FOR SHARE, чтобы параллельное изменение строки
+   не разошлось с копией. Ссылка planned_ref_id -> (id, budget_id) добавляется на каждую секцию
+   NOT VALID и проверяется VALIDATE (без блокировки записи), затем на родителя — Postgres
+   подхватывает уже проверенные ограничения секций без повторного сканирования.
+3. (транзакция) подмена: короткий ACCESS EXCLUSIVE на operation, старая таблица удаляется,
+   operation_new переименовывается, последовательность id переходит к новой таблице.
+
+Если миграция прервалась, повторный запуск начинает перенос заново.
+Число секций задаётся при миграции; смена модуля — это повторная пересборка (downgrade + upgrade).
+downgrade тем же способом возвращает обычную таблицу. Режим --sql (offline) не поддерживается.
+"""
+import logging
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8f3e1b9c2'
+down_revision: Union[str, Sequence[str], None] = 'b7e2a91c4d30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+log = logging.getLogger("alembic.runtime.migration")
+
+PARTITIONS = int(os.getenv("OPERATION_PARTITIONS", "16"))
+BATCH = int(os.getenv("OPERATION_COPY_BATCH", "20000"))
+# сколько ждать блокировку operation при установке триггера и подмене таблиц
+# (не вставать надолго в очередь перед запросами)
+SWAP_LOCK_TIMEOUT = os.getenv("OPERATION_SWAP_LOCK_TIMEOUT", "10s")
+
+COLUMNS = [
+    'id', 'budget_id', 'step_id', 'kind', 'sign', 'amount', 'currency', 'date',
+    'account_id', 'account_id_to', 'category_id', 'comment', 'planned_ref_id', 'created_by', 'created_at',
+]
+
+FOREIGN_KEYS = [
+    ('operation_account_id_fkey', 'account_id', 'account(id)', 'RESTRICT'),
+    ('operation_account_id_to_fkey', 'account_id_to', 'account(id)', 'RESTRICT'),
+    ('operation_budget_id_fkey', 'budget_id', 'budget(id)', 'CASCADE'),
+    ('operation_category_id_fkey', 'category_id', 'category(id)', 'SET NULL'),
+    ('operation_created_by_fkey', 'created_by', '"user"(id)', 'SET NULL'),
+    ('operation_step_id_fkey', 'step_id', 'budget_step(id)', 'RESTRICT'),
+]
+
+# те же индексы, что у operation (миграции 048a93199e14, 9c41d2e7b5a8); на секционированной
+# таблице каждый индекс создаётся на всех секциях
+INDEXES = [
+    ('ix_operation_step_kind', '(step_id, kind, id) INCLUDE (sign, amount, currency)'),
+    ('ix_operation_step_created', '(step_id, created_at DESC, id DESC)'),
+    ('ix_operation_budget', '(budget_id)'),
+    ('ix_operation_planned_ref', '(planned_ref_id) WHERE planned_ref_id IS NOT NULL'),
+    ('ix_operation_account_date', '(account_id, date) INCLUDE (id, kind, sign, amount)'),
+    ('ix_operation_account_to_date',
+     '(account_id_to, date) INCLUDE (id, kind, sign, amount) WHERE account_id_to IS NOT NULL'),
+]
+
+NEW = 'operation_new'
+
+
+def _partition(i: int) -> str:
+    return f'operation_p{i:02d}'
+
+
+def _prepare(partitioned: bool) -> None:
+    """Пустая operation_new со всеми ограничениями, кроме ссылки на себя, и триггер-зеркало."""
+    cols = ', '.join(COLUMNS)
+    new_cols = ', '.join(f'NEW.{c}' for c in COLUMNS)
+    updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in COLUMNS if c not in ('id', 'budget_id'))
+    key = '(id, budget_id)' if partitioned else '(id)'
+
+    # DROP/CREATE TRIGGER берут SHARE ROW EXCLUSIVE на operation: без таймаута ожидание за долгим запросом
+    # остановило бы всю запись в таблицу
+    op.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    op.execute('DROP TRIGGER IF EXISTS operation_mirror ON operation')
+    op.execute(f'DROP TABLE IF EXISTS {NEW} CASCADE')
+    op.execute(
+        f'CREATE TABLE {NEW} (LIKE operation INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        + (' PARTITION BY HASH (budget_id)' if partitioned else '')
+    )
+    if partitioned:
+        for i in range(PARTITIONS):
+            op.execute(
+                f'CREATE TABLE {_partition(i)} PARTITION OF {NEW} FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {i})'
+            )
+    op.execute(f'ALTER TABLE {NEW} ADD CONSTRAINT {NEW}_pkey PRIMARY KEY {key}')
+    for name, column, ref, on_delete in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE {NEW} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {ref} ON DELETE {on_delete}')
+    for name, definition in INDEXES:
+        op.execute(f'CREATE INDEX {name}_new ON {NEW} {definition}')
+
+    # изменения operation во время переноса; upsert — на случай, если пачка уже скопировала строку
+    op.execute(f'''
+        CREATE OR REPLACE FUNCTION operation_mirror() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM {NEW} WHERE id = OLD.id AND budget_id = OLD.budget_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {NEW} ({cols}) VALUES ({new_cols})
+                ON CONFLICT {key} DO UPDATE SET {updates};
+            END IF;
+            RETURN NULL;
+        END $$
+    ''')
+    op.execute(
+        'CREATE TRIGGER operation_mirror AFTER INSERT OR UPDATE OR DELETE ON operation '
+        'FOR EACH ROW EXECUTE FUNCTION operation_mirror()'
+    )
+
+
+def _copy_rows() -> None:
+    """Перенос существующих строк пачками (вызывается в autocommit: каждая пачка — своя транзакция)."""
+    conn = op.get_bind()
+    cols = ', '.join(COLUMNS)
+    lo, hi = conn.execute(sa.text('SELECT coalesce(min(id), 1) - 1, coalesce(max(id), 0) FROM operation')).one()
+    stmt = sa.text(
+        f'INSERT INTO {NEW} ({cols}) '
+        f'SELECT {cols} FROM operation WHERE id > :lo AND id <= :hi ORDER BY id FOR SHARE '
+        f'ON CONFLICT DO NOTHING'
+    )
+    copied = batches = 0
+    while lo < hi:
+        copied += conn.execute(stmt, {'lo': lo, 'hi': min(lo + BATCH, hi)}).rowcount
+        lo += BATCH
+        batches += 1
+        if batches % 50 == 0:
+            log.info('operation: copied %d rows (id <= %d of %d)', copied, min(lo, hi), hi)
+    log.info('operation: copied %d rows', copied)
+
+
+def _add_self_reference(partitioned: bool) -> None:
+    """planned_ref_id -> operation: проверка без блокировки записи (NOT VALID + VALIDATE)."""
+    name = 'operation_planned_ref_id_fkey'
+    if partitioned:
+        ref = f'FOREIGN KEY (planned_ref_id, budget_id) REFERENCES {NEW} (id, budget_id) ON DELETE RESTRICT'
+        # NOT VALID на секционированном родителе не поддерживается — по секциям
+        for i in range(PARTITIONS):
+            op.execute(f'ALTER TABLE {_partition(i)} ADD CONSTRAINT {_partition(i)}_planned_ref_fkey {ref} NOT VALID')
+            op.execute(f'ALTER TABLE {_partition(i)} VALIDATE CONSTRAINT {_partition(i)}_planned_ref_fkey')
+        op.execute(f'ALTER TABLE {NEW} ADD CONSTRAINT {name} {ref}')
+    else:
+        ref = f'FOREIGN KEY (planned_ref_id) REFERENCES {NEW} (id) ON DELETE RESTRICT'
+        op.execute(f'ALTER TABLE {NEW} ADD CONSTRAINT {name} {ref} NOT VALID')
+        op.execute(f'ALTER TABLE {NEW} VALIDATE CONSTRAINT {name}')
+
+
+def _swap() -> None:
+    op.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    op.execute('LOCK TABLE operation IN ACCESS EXCLUSIVE MODE')
+    op.execute('DROP TRIGGER operation_mirror ON operation')
+    op.execute('DROP FUNCTION operation_mirror()')
+    # последовательность принадлежит operation.id и удалилась бы вместе со старой таблицей
+    op.execute(f'ALTER SEQUENCE operation_id_seq OWNED BY {NEW}.id')
+    op.execute('DROP TABLE operation')
+    op.execute(f'ALTER TABLE {NEW} RENAME TO operation')
+    op.execute(f'ALTER INDEX {NEW}_pkey RENAME TO operation_pkey')
+    for name, _ in INDEXES:
+        op.execute(f'ALTER INDEX {name}_new RENAME TO {name}')
+
+
+def _rebuild(partitioned: bool) -> None:
+    _prepare(partitioned)
+    with op.get_context().autocommit_block():
+        _copy_rows()
+        _add_self_reference(partitioned)
+        op.execute('ANALYZE operation_new')
+    _swap()
+
+
+def upgrade() -> None:
+    """Upgrade schema: operation -> PARTITION BY HASH (budget_id), rows moved in batches."""
+    _rebuild(partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema: back to a plain operation table, rows moved the same way."""
+    _rebuild(partitioned=False)
@@ -0,0 +1,76 @@
+"""statement import: operation.import_hash + import_job
+
+Revision ID: e5b19c7a3f62
+Revises: d4a8f3e1b9c2
+Create Date: 2026-10-18 03:00:00.000000+00:00
+
+Уникальный индекс (budget_id, import_hash) на секционированной operation строится без блокировки
+записи: пустой индекс на родителе (ON ONLY, невалидный), CONCURRENTLY на каждой секции
+и ATTACH PARTITION — после подключения всех секций индекс родителя становится валидным.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b19c7a3f62'
+down_revision: Union[str, Sequence[str], None] = 'd4a8f3e1b9c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX = 'ux_operation_import_hash'
+WHERE = 'import_hash IS NOT NULL'
+
+
+def _partitions() -> list[str]:
+    return list(op.get_bind().execute(sa.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'operation'::regclass ORDER BY c.relname"
+    )).scalars())
+
+
+def upgrade() -> None:
+    """Upgrade schema: operation.import_hash (+ unique index per budget) and import_job."""
+    # NULL по умолчанию — только изменение каталога, без перезаписи строк
+    op.add_column('operation', sa.Column('import_hash', sa.String(length=32), nullable=True))
+    op.create_table('import_job',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('budget_id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(length=8), nullable=False),
+    sa.Column('status', sa.String(length=16), server_default='queued', nullable=False),
+    sa.Column('bytes_total', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('bytes_read', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('rows_read', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('created', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('duplicates', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('failed', sa.Integer(), server_default=sa.text('0'), nullable=False),
+    sa.Column('errors', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['budget_id'], ['budget.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_import_job_budget', 'import_job', ['budget_id', 'id'])
+
+    op.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {INDEX} ON ONLY operation (budget_id, import_hash) WHERE {WHERE}')
+    partitions = _partitions()
+    with op.get_context().autocommit_block():
+        for part in partitions:
+            op.execute(
+                f'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {part}_import_hash '
+                f'ON {part} (budget_id, import_hash) WHERE {WHERE}'
+            )
+            op.execute(f'ALTER INDEX {INDEX} ATTACH PARTITION {part}_import_hash')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_import_job_budget', table_name='import_job')
+    op.drop_table('import_job')
+    op.execute(f'DROP INDEX IF EXISTS {INDEX}')
+    op.drop_column('operation', 'import_hash')
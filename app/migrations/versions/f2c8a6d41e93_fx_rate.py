@@ -0,0 +1,35 @@
+"""fx_rate: currency rates by date
+
+Revision ID: f2c8a6d41e93
+Revises: e5b19c7a3f62
+Create Date: 2026-10-18 04:00:00.000000+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c8a6d41e93'
+down_revision: Union[str, Sequence[str], None] = 'e5b19c7a3f62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema: fx_rate (base, quote, date) -> rate."""
+    op.create_table('fx_rate',
+    sa.Column('base', sa.String(length=3), nullable=False),
+    sa.Column('quote', sa.String(length=3), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=20, scale=10), nullable=False),
+    sa.CheckConstraint('rate > 0', name='ck_fx_rate_positive'),
+    sa.PrimaryKeyConstraint('base', 'quote', 'date')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('fx_rate')
@@ -0,0 +1,165 @@
+"""
+Доступ к бюджетам: роль пользователя в каждом бюджете (owner | editor | viewer).
+
+Карта ролей пользователя (budget_id -> роль: владелец бюджета или BudgetShare) читается одним
+запросом в короткой собственной сессии и кешируется на ACL_CACHE_TTL; в пределах запроса зависимость current_access
+вычисляется один раз. Изменение BudgetShare или владельца бюджета через ORM сбрасывает
+затронутые карты (после flush и ещё раз после commit), другие воркеры догоняют за ACL_CACHE_TTL.
+
+Бюджет шага, счёта, категории и задачи импорта не меняется после создания, поэтому
+id -> budget_id кешируется без срока (LRU на ACL_RESOURCE_CACHE_SIZE записей): проверка доступа
+к шагу на горячем пути не обращается к БД.
+
+Нет доступа к бюджету — ответ как для несуществующего объекта (обычно 404), есть только
+чтение, а нужна запись — 403.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+import sqlalchemy as sa
+from fastapi import Depends, HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.base import SessionLocal
+from app.src import auth_cache
+from app.src.api.auth import current_user
+from app.src.cache import TTLCache
+
+ACL_CACHE_TTL = float(os.getenv("ACL_CACHE_TTL", "30"))
+ACL_CACHE_SIZE = int(os.getenv("ACL_CACHE_SIZE", "10000"))
+ACL_RESOURCE_CACHE_SIZE = int(os.getenv("ACL_RESOURCE_CACHE_SIZE", "100000"))
+
+VIEWER, EDITOR, OWNER = "viewer", "editor", "owner"
+_RANK = {VIEWER: 1, EDITOR: 2, OWNER: 3}
+
+roles_cache = TTLCache(maxsize=ACL_CACHE_SIZE, ttl=ACL_CACHE_TTL)
+resources = TTLCache(maxsize=ACL_RESOURCE_CACHE_SIZE, ttl=float("inf"))
+
+
+@dataclass(frozen=True)
+class Access:
+    user_id: int
+    roles: dict[int, str]   # budget_id -> роль
+
+    def can(self, budget_id: int | None, role: str = VIEWER) -> bool:
+        have = self.roles.get(budget_id)
+        return have is not None and _RANK[have] >= _RANK[role]
+
+    def budget_ids(self) -> list[int]:
+        return sorted(self.roles)
+
+
+def load_roles(db: Session, user_id: int) -> dict[int, str]:
+    b, s = models.Budget, models.BudgetShare
+    rows = db.execute(sa.union_all(
+        sa.select(b.id, sa.literal(OWNER, sa.String)).where(b.owner_user_id == user_id),
+        sa.select(s.budget_id, sa.cast(s.role, sa.String)).where(s.user_id == user_id),
+    )).all()
+    roles: dict[int, str] = {}
+    for budget_id, role in rows:
+        if budget_id not in roles or _RANK[role] > _RANK[roles[budget_id]]:
+            roles[budget_id] = role
+    return roles
+
+
+def current_access(user: auth_cache.UserSnapshot = Depends(current_user)) -> Access:
+    roles = roles_cache.get(user.id)
+    if roles is None:
+        # своя короткая сессия, закрытая до обработчика: зависимость не держит соединение из пула
+        # на время запроса (SSE, выгрузки), а сессия обработчика — одна, из get_db
+        with SessionLocal() as db:
+            roles = load_roles(db, user.id)
+        roles_cache.set(user.id, roles)
+    return Access(user.id, roles)
+
+
+def budget_of(db: Session, model, obj_id: int | None) -> int | None:
+    """budget_id шага/счёта/категории/задачи импорта (None — объекта нет)."""
+    if obj_id is None:
+        return None
+    key = (model.__tablename__, obj_id)
+    budget_id = resources.get(key)
+    if budget_id is None:
+        budget_id = db.scalar(sa.select(model.budget_id).where(model.id == obj_id))
+        if budget_id is not None:  # отсутствующий id не кешируем: объект может появиться позже
+            resources.set(key, budget_id)
+    return budget_id
+
+
+def require(access: Access, budget_id: int | None, role: str, detail: str, status_code: int = 404) -> int:
+    """Проверка роли в бюджете: нет доступа — status_code/detail (как «не найдено»), мало прав — 403."""
+    if not access.can(budget_id, VIEWER):
+        raise HTTPException(status_code, detail)
+    if not access.can(budget_id, role):
+        raise HTTPException(403, "forbidden")
+    return budget_id
+
+
+def require_budget(access: Access, budget_id: int, role: str = VIEWER) -> int:
+    return require(access, budget_id, role, "budget not found")
+
+
+def require_step(db: Session, access: Access, step_id: int, role: str = VIEWER) -> int:
+    return require(access, budget_of(db, models.BudgetStep, step_id), role, "step not found")
+
+
+def require_account(db: Session, access: Access, account_id: int, role: str = VIEWER) -> int:
+    return require(access, budget_of(db, models.Account, account_id), role, "account not found")
+
+
+# ---------- Инвалидация ----------
+def invalidate(user_ids=(), budget_ids=()) -> int:
+    """Сбросить карты ролей пользователей user_ids и всех, у кого есть доступ к budget_ids."""
+    users, budgets = set(user_ids), set(budget_ids)
+    if not users and not budgets:
+        return 0
+    return roles_cache.discard_where(lambda uid, roles: uid in users or not budgets.isdisjoint(roles))
+
+
+_PENDING_KEY = "acl_invalidate"
+
+
+def _changed(session) -> tuple[set, set]:
+    users, budgets = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.BudgetShare):
+            users.add(obj.user_id)
+            budgets.add(obj.budget_id)
+            # при смене user_id у доли прежний пользователь тоже теряет доступ
+            users.update(sa.inspect(obj).attrs.user_id.history.deleted or ())
+        elif isinstance(obj, models.Budget) and obj.id is not None:
+            owner = sa.inspect(obj).attrs.owner_user_id.history
+            if obj in session.dirty and not owner.has_changes():
+                continue  # переименование и т.п. на доступ не влияет
+            users.add(obj.owner_user_id)
+            budgets.add(obj.id)
+            users.update(owner.deleted or ())
+    users.discard(None)
+    budgets.discard(None)
+    return users, budgets
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    users, budgets = _changed(session)
+    if users or budgets:
+        invalidate(users, budgets)
+        pending = session.info.setdefault(_PENDING_KEY, (set(), set()))
+        pending[0].update(users)
+        pending[1].update(budgets)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    # повторно: между flush и commit параллельный запрос мог закешировать ещё старую карту
+    users, budgets = session.info.pop(_PENDING_KEY, ((), ()))
+    invalidate(users, budgets)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING_KEY, None)
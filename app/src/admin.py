@@ -0,0 +1,86 @@
+"""
+Административные команды.
+
+    python -m app.src.admin rebuild-step-totals [--step-id N ...]
+    python -m app.src.admin snapshot-balances [--budget-id N] [--min-ops N] [--keep N]
+    python -m app.src.admin load-fx FILE [FILE ...]
+"""
+import argparse
+import sys
+
+import sqlalchemy as sa
+
+from app.db import models
+from app.db.base import SessionLocal
+from app.src import totals, balances, versions, response_cache, fx
+
+
+def cmd_rebuild_step_totals(args) -> None:
+    db = SessionLocal()
+    try:
+        rows = totals.rebuild(db, args.step_id or None)
+        # сводки могли измениться — кешированные у клиентов ответы (ETag) больше не годятся
+        versions.bump_steps(db, args.step_id or None)
+        db.commit()
+        # имеет смысл для общего кеша (redis); in-process кеш API догонит за RESPONSE_CACHE_TTL
+        step_ids = args.step_id or db.scalars(sa.select(models.BudgetStep.id)).all()
+        response_cache.invalidate(*(("step", s) for s in step_ids))
+    finally:
+        db.close()
+    print(f"step_totals rebuilt: {rows} rows")
+
+
+def cmd_snapshot_balances(args) -> None:
+    db = SessionLocal()
+    try:
+        created, deleted = balances.snapshot(db, budget_id=args.budget_id, min_ops=args.min_ops, keep=args.keep)
+    finally:
+        db.close()
+    print(f"balance snapshots: {created} created, {deleted} compacted")
+
+
+def cmd_load_fx(args) -> None:
+    db = SessionLocal()
+    try:
+        loaded = 0
+        for path in args.file:
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                try:
+                    loaded += fx.load(db, fx.read_rates(f))
+                except ValueError as e:
+                    sys.exit(f"{path}: {e}")
+        # итоги сводок в валюте бюджета зависят от курсов — ETag шагов с другими валютами меняется
+        step_ids = fx.foreign_currency_steps(db)
+        versions.bump_steps(db, step_ids)
+        db.commit()
+        response_cache.invalidate(*(("step", s) for s in step_ids))
+    finally:
+        db.close()
+    print(f"fx rates loaded: {loaded} rows, {len(step_ids)} step summaries invalidated")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m app.src.admin")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-step-totals", help="пересчитать step_totals по таблице operation")
+    p.add_argument("--step-id", type=int, action="append", help="только указанные шаги (можно повторять)")
+    p.set_defaults(func=cmd_rebuild_step_totals)
+
+    p = sub.add_parser("snapshot-balances", help="снимки балансов счетов и удаление старых снимков")
+    p.add_argument("--budget-id", type=int, help="только счета указанного бюджета")
+    p.add_argument("--min-ops", type=int, default=balances.BALANCE_SNAPSHOT_MIN_OPS,
+                   help="снимок, если после предыдущего накопилось не меньше N операций (1 — у всех с изменениями)")
+    p.add_argument("--keep", type=int, default=balances.BALANCE_SNAPSHOT_KEEP, help="хранить N последних снимков на счёт")
+    p.set_defaults(func=cmd_snapshot_balances)
+
+    p = sub.add_parser("load-fx", help="загрузить курсы валют из CSV (date,base,quote,rate)")
+    p.add_argument("file", nargs="+", help="CSV-файлы курсов: 1 base = rate quote с даты date")
+    p.set_defaults(func=cmd_load_fx)
+
+    args = ap.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,74 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+import sqlalchemy as sa
 from sqlalchemy.orm import Session
-from app.src.deps import get_db
+from app.src.deps import get_db, db_route
 from app.db import models
-from app.src.schemas import AccountCreate, AccountRead
+from app.src import fastjson, balances, versions, response_cache, events, acl
+from app.src.schemas import AccountCreate, AccountRead, AccountBalance
 
 router = APIRouter()
 
 @router.post("", response_model=AccountRead, status_code=status.HTTP_201_CREATED)
-def create_account(payload: AccountCreate, db: Session = Depends(get_db)):
-    # проверим, что бюджет существует
-    if not db.query(models.Budget).filter(models.Budget.id == payload.budget_id).first():
-        raise HTTPException(400, "budget_id not found")
+@db_route
+def create_account(
+    payload: AccountCreate,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    acl.require(access, payload.budget_id, acl.EDITOR, "budget_id not found", 400)
     acc = models.Account(
         budget_id=payload.budget_id,
         name=payload.name,
         currency=payload.currency,
     )
     db.add(acc)
+    versions.bump_budget(db, payload.budget_id)
+    db.flush()
+    events.emit(db, payload.budget_id, "account.created", AccountRead.model_validate(acc).model_dump(mode="json"))
     db.commit()
+    response_cache.invalidate(("accounts", payload.budget_id))
     db.refresh(acc)
     return acc
 
 @router.get("", response_model=list[AccountRead])
+@db_route
 def list_accounts(
+    request: Request,
     db: Session = Depends(get_db),
-    budget_id: int | None = Query(default=None)
+    budget_id: int | None = Query(default=None),
+    access: acl.Access = Depends(acl.current_access),
 ):
-    q = db.query(models.Account).order_by(models.Account.id.desc())
+    # без budget_id — счета всех доступных бюджетов
+    if budget_id is not None:
+        acl.require_budget(access, budget_id)
+    key, cached = response_cache.lookup(request, ("accounts", budget_id)) if budget_id is not None else (None, None)
+    if cached is not None:
+        return cached
+    ver = versions.budget_version(db, budget_id)
+    if (not_modified := versions.not_modified(request, ver)) is not None:
+        return not_modified
+    q = sa.select(*fastjson.columns(models.Account, AccountRead)).order_by(models.Account.id.desc())
     if budget_id is not None:
-        q = q.filter(models.Account.budget_id == budget_id)
-    return q.all()
\ No newline at end of file
+        q = q.where(models.Account.budget_id == budget_id)
+    else:
+        q = q.where(models.Account.budget_id.in_(access.budget_ids()))
+    resp = fastjson.FastJSONResponse(fastjson.records(db.execute(q).all(), AccountRead), headers=versions.headers(ver))
+    return response_cache.store(key, resp, ver)
+
+
+@router.get("/{account_id}/balance", response_model=AccountBalance)
+@db_route
+def get_account_balance(
+    account_id: int,
+    at: datetime | None = Query(default=None, description="момент времени (по умолчанию — сейчас)"),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """Баланс счёта по фактическим операциям: последний снимок + операции после него."""
+    acl.require_account(db, access, account_id)
+    rows = balances.balances(db, account_ids=[account_id], at=at)
+    if not rows:
+        raise HTTPException(404, "account not found")
+    return rows[0]
@@ -1,13 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, Response, Cookie, Header, Request
+from fastapi.concurrency import run_in_threadpool
 import os
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from app.db.deps import get_db
+from app.db.base import SessionLocal
 from app.db import models
+from app.src.deps import get_db
 from app.src import schemas
+from app.src import auth_cache
 from app.src.security import (
-    hash_password, verify_password, create_jwt, decode_jwt,
+    hash_password_async, verify_and_update_async, PasswordHasherBusy,
+    create_jwt, decode_jwt, decode_jwt_claims,
     # ssh_fingerprint_sha256, parse_fp_header,  # ← временно не используем, чтобы не падать, пока нет колонки в БД
 )
 
@@ -49,8 +53,24 @@ def clear_session_cookie(resp: Response):
     resp.delete_cookie(COOKIE_NAME, path="/")
 
 
+def _user_by_token(token: str) -> auth_cache.UserSnapshot | None:
+    # кеш: подпись JWT и наличие пользователя уже проверены при первом запросе с этим токеном
+    snap = auth_cache.lookup(token)
+    if snap:
+        return snap
+    claims = decode_jwt_claims(token)
+    if not claims:
+        return None
+    uid, exp = claims
+    # короткая сессия только на промах кеша: соединение возвращается в пул до обработчика
+    with SessionLocal() as db:
+        user = db.get(models.User, uid)
+        if not user:
+            return None
+        return auth_cache.store(token, user, exp)
+
+
 def current_user(
-    db: Session = Depends(get_db),
     session: str | None = Cookie(default=None, alias=COOKIE_NAME),
     x_ssh_fp: str | None = Header(default=None, alias="X-SSH-Key-Fingerprint"),
     authorization: str | None = Header(default=None, alias="Authorization"),
@@ -60,23 +80,20 @@ def current_user(
     1) Bearer JWT из Authorization
     2) JWT из cookie
     3) (временно отключено) Отпечаток SSH-ключа
+    Возвращает снимок пользователя (auth_cache.UserSnapshot), а не ORM-объект.
     """
     # 0) Bearer token in Authorization header
     if authorization and authorization.lower().startswith("bearer "):
         token = authorization.split(" ", 1)[1].strip()
-        uid = decode_jwt(token)
-        if uid:
-            user = db.get(models.User, uid)
-            if user:
-                return user
+        user = _user_by_token(token)
+        if user:
+            return user
 
     # 1) JWT from cookie
     if session:
-        uid = decode_jwt(session)
-        if uid:
-            user = db.get(models.User, uid)
-            if user:
-                return user
+        user = _user_by_token(session)
+        if user:
+            return user
 
     # 2) SSH fingerprint header (ОТКЛЮЧЕНО до появления колонки ssh_fingerprint в БД)
     # if x_ssh_fp:
@@ -89,6 +106,14 @@ def current_user(
     raise HTTPException(status_code=401, detail="auth required")
 
 
+async def _password_op(coro):
+    """Хеширование/проверка пароля в выделенном пуле; переполненная очередь -> 503."""
+    try:
+        return await coro
+    except PasswordHasherBusy:
+        raise HTTPException(503, "password hashing is busy, retry later", headers={"Retry-After": "1"})
+
+
 @router.post("/register", response_model=schemas.UserRead, status_code=201)
 async def register(request: Request, db: Session = Depends(get_db)):
     """
@@ -110,17 +135,21 @@ async def register(request: Request, db: Session = Depends(get_db)):
 
     email_norm = payload.email.strip().lower()
 
-    # Уникальность email
-    if db.query(models.User).filter(models.User.email == email_norm).first():
+    # Уникальность email (запросы к БД — в threadpool, как в login)
+    if await run_in_threadpool(_find_user_by_email, db, email_norm):
         raise HTTPException(409, "email already registered")
 
     # Опциональный SSH ключ — сохраняем как есть (без отпечатка пока)
     user = models.User(
         email=email_norm,
         name=payload.name,
-        hashed_password=hash_password(payload.password),  # ← ВАЖНО: поле в БД называется hashed_password
+        hashed_password=await _password_op(hash_password_async(payload.password)),  # ← ВАЖНО: поле в БД называется hashed_password
         ssh_public_key=payload.ssh_public_key,
     )
+    return await run_in_threadpool(_insert_user, db, user)
+
+
+def _insert_user(db: Session, user: models.User) -> models.User:
     db.add(user)
     try:
         db.commit()
@@ -136,14 +165,35 @@ async def register(request: Request, db: Session = Depends(get_db)):
     return user
 
 
+def _find_user_by_email(db: Session, email: str):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def _store_password_hash(db: Session, user: models.User, new_hash: str) -> None:
+    user.hashed_password = new_hash
+    db.commit()
+
+
 @router.post("/login", response_model=schemas.UserRead)
-def login(payload: schemas.LoginPayload, response: Response, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == payload.email).first()
-    if not user or not getattr(user, "hashed_password", None) or not verify_password(payload.password, user.hashed_password):
+async def login(payload: schemas.LoginPayload, response: Response, db: Session = Depends(get_db)):
+    """
+    Запросы к БД — в threadpool, проверка пароля — в пуле хеширования (security._hash_executor),
+    так что ни event loop, ни потоки обработчиков не заняты bcrypt/argon2.
+    Если хеш устарел (другая схема или параметры), он пересчитывается и сохраняется.
+    """
+    user = await run_in_threadpool(_find_user_by_email, db, payload.email)
+    if not user or not getattr(user, "hashed_password", None):
         raise HTTPException(401, "invalid credentials")
-    token = create_jwt(user.id)
+    ok, new_hash = await _password_op(verify_and_update_async(payload.password, user.hashed_password))
+    if not ok:
+        raise HTTPException(401, "invalid credentials")
+
+    result = schemas.UserRead.model_validate(user)  # до commit: после него атрибуты user просрочены
+    if new_hash:
+        await run_in_threadpool(_store_password_hash, db, user, new_hash)
+    token = create_jwt(result.id)
     set_session_cookie(response, token)
-    return user
+    return result
 
 
 @router.post("/refresh", response_model=schemas.UserRead)
@@ -178,7 +228,7 @@ def logout(response: Response):
 
 
 @router.get("/me", response_model=schemas.MeRead)
-def me(user: models.User = Depends(current_user)):
+def me(user: auth_cache.UserSnapshot = Depends(current_user)):
     return user
 
 
@@ -1,21 +1,42 @@
 # app/src/api/budgets.py
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import asyncio
+import codecs
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+import sqlalchemy as sa
 from sqlalchemy.orm import Session
-from app.src.deps import get_db
+from app.src.deps import get_db, db_route
 from app.db import models
-from app.src.schemas import BudgetCreate, BudgetRead
+from app.db.base import SessionLocal
+from app.src import reports, balances, events, imports, export, search, fastjson, acl, auth_cache
+from app.src.api.auth import current_user
+from app.src.pagination import encode_cursor, decode_cursor
+from app.src.schemas import (
+    BudgetCreate, BudgetRead, BudgetReport, AccountBalance, ImportJobRead, OperationSearchHit, OperationSearchPage,
+    BudgetShareRead, BudgetShareUpdate,
+)
 
 router = APIRouter()
 
 @router.post("", response_model=BudgetRead, status_code=status.HTTP_201_CREATED)
-def create_budget(payload: BudgetCreate, db: Session = Depends(get_db)):
-    owner = db.query(models.User).filter(models.User.id == payload.owner_user_id).first()
-    if not owner:
-        raise HTTPException(status_code=400, detail="owner_user_id not found")
+@db_route
+def create_budget(
+    payload: BudgetCreate,
+    db: Session = Depends(get_db),
+    user: auth_cache.UserSnapshot = Depends(current_user),
+):
+    # владелец — текущий пользователь; owner_user_id в теле допускается только свой
+    if payload.owner_user_id is not None and payload.owner_user_id != user.id:
+        raise HTTPException(status_code=403, detail="forbidden")
     b = models.Budget(
         name=payload.name,
         currency=payload.currency,
-        owner_user_id=payload.owner_user_id,
+        owner_user_id=user.id,
     )
     db.add(b)
     db.commit()
@@ -23,11 +44,356 @@ def create_budget(payload: BudgetCreate, db: Session = Depends(get_db)):
     return b
 
 @router.get("", response_model=list[BudgetRead])
+@db_route
 def list_budgets(
     db: Session = Depends(get_db),
     owner_user_id: int | None = Query(default=None, description="optional filter by owner"),
+    access: acl.Access = Depends(acl.current_access),
 ):
-    q = db.query(models.Budget).order_by(models.Budget.id.desc())
+    """Бюджеты, доступные текущему пользователю (свои и расшаренные)."""
+    if not access.roles:
+        return []
+    q = db.query(models.Budget).filter(models.Budget.id.in_(access.budget_ids())).order_by(models.Budget.id.desc())
     if owner_user_id is not None:
         q = q.filter(models.Budget.owner_user_id == owner_user_id)
-    return q.all()
\ No newline at end of file
+    return q.all()
+
+
+# ---------- Сводный отчёт по бюджету ----------
+@router.get("/{budget_id}/report", response_model=BudgetReport)
+@db_route(cpu_bound=True)
+def get_budget_report(
+    budget_id: int,
+    date_from: date | None = Query(default=None, description="шаги, заканчивающиеся не раньше этой даты"),
+    date_to: date | None = Query(default=None, description="шаги, начинающиеся не позже этой даты"),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Доходы/расходы/нетто по шагам и категориям бюджета, план против факта и процент исполнения плана.
+    Переводы не учитываются. Все суммы считаются одним сгруппированным запросом.
+    """
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    acl.require_budget(access, budget_id)
+    budget = db.get(models.Budget, budget_id)
+    if not budget:
+        raise HTTPException(status_code=404, detail="budget not found")
+    return reports.budget_report(db, budget, date_from, date_to)
+
+
+# ---------- Выгрузка операций ----------
+@router.get("/{budget_id}/export", response_class=StreamingResponse,
+            responses={200: {"content": {"text/csv": {}, "application/vnd.apache.parquet": {}}}})
+@db_route
+def export_operations(
+    budget_id: int,
+    request: Request,
+    fmt: str = Query(default="csv", alias="format", pattern="^(csv|parquet)$"),
+    date_from: date | None = Query(default=None, alias="from", description="операции с этой даты"),
+    date_to: date | None = Query(default=None, alias="to", description="операции по эту дату включительно"),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Все операции бюджета за период с именами шага, счетов и категории — файлом CSV или Parquet.
+    Выгрузка идёт потоком с серверного курсора (в Postgres CSV — через COPY), память не растёт
+    с объёмом истории; CSV сжимается gzip на лету, если клиент его принимает.
+    """
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    acl.require_budget(access, budget_id)
+    if fmt == "parquet" and not export.PARQUET_AVAILABLE:
+        raise HTTPException(status_code=400, detail="parquet export requires pyarrow")
+
+    # поток читает своим соединением; соединение обработчика не держим открытым всю выгрузку
+    db.rollback()
+    q = export.operations_query(budget_id, date_from, date_to)
+    filename = f"budget-{budget_id}-operations.{fmt}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if fmt == "parquet":
+        return StreamingResponse(export.iterate_closing(export.stream_parquet(q)),
+                                 media_type="application/vnd.apache.parquet", headers=headers)
+    body = export.stream_csv(q)
+    headers["Vary"] = "Accept-Encoding"
+    if export.accepts_gzip(request.headers.get("accept-encoding")):
+        body = export.gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export.iterate_closing(body), media_type="text/csv; charset=utf-8", headers=headers)
+
+
+# ---------- Поиск операций ----------
+@router.get("/{budget_id}/operations/search", response_model=OperationSearchPage)
+@db_route
+def search_operations(
+    budget_id: int,
+    q: str = Query(min_length=1, max_length=200, description="слова комментария; опечатки допускаются"),
+    amount_min: Decimal | None = Query(default=None),
+    amount_max: Decimal | None = Query(default=None),
+    date_from: date | None = Query(default=None, alias="from", description="операции с этой даты"),
+    date_to: date | None = Query(default=None, alias="to", description="операции по эту дату включительно"),
+    account_id: int | None = Query(default=None, description="счёт списания или зачисления"),
+    category_id: int | None = Query(default=None, description="категория вместе с подкатегориями"),
+    limit: int = Query(default=search.SEARCH_DEFAULT_LIMIT, ge=1, le=search.SEARCH_MAX_LIMIT),
+    cursor: str | None = Query(default=None, description="next_cursor из предыдущей страницы"),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Операции бюджета, в комментарии которых встречаются слова q (словоформы и опечатки),
+    по убыванию релевантности. Страницы — по курсору next_cursor.
+    """
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="q must not be blank")
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if amount_min is not None and amount_max is not None and amount_min > amount_max:
+        raise HTTPException(status_code=400, detail="amount_min must not be greater than amount_max")
+    acl.require_budget(access, budget_id)
+    after = None
+    if cursor:
+        rank, op_id = decode_cursor(cursor, 2)
+        try:
+            after = float(rank), int(op_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="invalid cursor")
+
+    filters = search.Filters(amount_min, amount_max, date_from, date_to, account_id, category_id)
+    stmt = search.search_query(db.get_bind().dialect.name, budget_id, q, filters, after, limit)
+    rows = db.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    return fastjson.FastJSONResponse({
+        "items": fastjson.records(rows, OperationSearchHit),
+        "next_cursor": next_cursor,
+    })
+
+
+# ---------- Балансы счетов бюджета ----------
+@router.get("/{budget_id}/balances", response_model=list[AccountBalance])
+@db_route
+def get_budget_balances(
+    budget_id: int,
+    at: datetime | None = Query(default=None, description="момент времени (по умолчанию — сейчас)"),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """Балансы всех счетов бюджета одним запросом (снимок + дельта на каждый счёт)."""
+    acl.require_budget(access, budget_id)
+    return balances.balances(db, budget_id=budget_id, at=at)
+
+
+# ---------- Поток изменений (SSE) ----------
+async def _event_stream(request: Request, sub: events.Subscription, missed: list[bytes] | None):
+    try:
+        yield b"retry: 3000\n\n"
+        if missed is None:
+            yield events.reset_frame()
+        for frame in missed or ():
+            yield frame
+        while True:
+            try:
+                frame = await asyncio.wait_for(sub.queue.get(), timeout=events.EVENTS_KEEPALIVE_SEC)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield events.keepalive_frame()
+                continue
+            if frame is None:  # подписчик переполнен
+                yield events.reset_frame()
+                return
+            yield frame
+    finally:
+        events.broker.unsubscribe(sub)
+
+
+@router.get("/{budget_id}/events")
+async def budget_events(
+    budget_id: int,
+    request: Request,
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Server-Sent Events: операции, шаги, счета и категории бюджета по мере их фиксации в БД.
+    Кадры: event = тип (operation.created, operations.created, step.created, account.created,
+    category.created), data — JSON. При переподключении с Last-Event-ID досылаются пропущенные
+    события; если это невозможно — событие reset (клиенту нужно перечитать данные).
+    """
+    # доступ проверяется до подписки: без прав поток не открывается
+    acl.require_budget(access, budget_id)
+    sub, missed = events.broker.subscribe(budget_id, last_event_id)
+    return StreamingResponse(
+        _event_stream(request, sub, missed),
+        media_type="text/event-stream",
+        # X-Accel-Buffering — чтобы nginx не копил поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ---------- Импорт выписки ----------
+_IMPORT_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "text/csv": {"schema": {"type": "string", "format": "binary"}},
+            "application/x-ofx": {"schema": {"type": "string", "format": "binary"}},
+        },
+    }
+}
+
+
+def _parse_rules(rules: list[str]) -> list[tuple[str, int]]:
+    out = []
+    for r in rules:
+        needle, sep, cat = r.rpartition("=")
+        if not sep or not needle.strip() or not cat.strip().isdigit():
+            raise HTTPException(status_code=400, detail=f"invalid rule {r!r}: expected <text>=<category_id>")
+        out.append((needle.strip().lower(), int(cat)))
+    return out
+
+
+def _import_target_error(budget_id: int, account_id: int, opts: imports.Options) -> tuple[int, str] | None:
+    db = SessionLocal()
+    try:
+        if db.get(models.Budget, budget_id) is None:
+            return 404, "budget not found"
+        err = imports.check_target(db, budget_id, account_id, opts.step_id, {cat for _, cat in opts.rules})
+        return (400, err) if err else None
+    finally:
+        db.close()
+
+
+def _create_import_job(budget_id: int, account_id: int, fmt: str, size: int) -> ImportJobRead:
+    db = SessionLocal()
+    try:
+        return ImportJobRead.model_validate(imports.create_job(db, budget_id, account_id, fmt, size))
+    finally:
+        db.close()
+
+
+@router.post("/{budget_id}/import", response_model=ImportJobRead, status_code=status.HTTP_202_ACCEPTED,
+             openapi_extra=_IMPORT_BODY_DOC)
+async def import_statement(
+    budget_id: int,
+    request: Request,
+    account_id: int = Query(..., description="счёт выписки"),
+    format: str = Query(default="csv", pattern="^(csv|ofx)$"),
+    step_id: int | None = Query(default=None, description="шаг для всех строк (по умолчанию — шаг по дате строки)"),
+    encoding: str = Query(default="utf-8-sig"),
+    delimiter: str = Query(default=",", min_length=1, max_length=1),
+    date_column: str = Query(default="date"),
+    amount_column: str = Query(default="amount", description="сумма со знаком: < 0 — расход"),
+    comment_column: str | None = Query(default="comment"),
+    category_column: str | None = Query(default=None, description="колонка с именем категории бюджета"),
+    date_format: str = Query(default="%Y-%m-%d"),
+    decimal_comma: bool = Query(default=False),
+    rule: list[str] = Query(default=[], description="<подстрока комментария>=<category_id>, первое совпадение"),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Импорт банковской выписки (тело запроса — файл CSV или OFX) в фактические операции счёта.
+    Файл принимается потоком и разбирается в фоне: ответ 202 с задачей, прогресс — GET /api/imports/{id}.
+    Строки, уже импортированные ранее (тот же счёт, дата, сумма, комментарий), пропускаются.
+    """
+    acl.require_budget(access, budget_id, acl.EDITOR)
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"unknown encoding {encoding!r}")
+    opts = imports.Options(
+        format=format, step_id=step_id, encoding=encoding, delimiter=delimiter,
+        date_column=date_column, amount_column=amount_column, comment_column=comment_column,
+        category_column=category_column, date_format=date_format, decimal_comma=decimal_comma,
+        rules=_parse_rules(rule),
+    )
+    if (err := await run_in_threadpool(_import_target_error, budget_id, account_id, opts)) is not None:
+        raise HTTPException(status_code=err[0], detail=err[1])
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > imports.IMPORT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"file too large (max {imports.IMPORT_MAX_BYTES} bytes)")
+
+    # тело — во временный файл по кускам: в памяти не больше IMPORT_SPOOL_MEMORY
+    f = tempfile.SpooledTemporaryFile(max_size=imports.IMPORT_SPOOL_MEMORY)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > imports.IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"file too large (max {imports.IMPORT_MAX_BYTES} bytes)")
+            f.write(chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="empty file")
+        f.seek(0)
+        job = await run_in_threadpool(_create_import_job, budget_id, account_id, format, size)
+    except BaseException:
+        f.close()
+        raise
+    imports.submit(job.id, f, opts)
+    return job
+
+
+# ---------- Доступ к бюджету ----------
+def _lock_budget(db: Session, budget_id: int) -> None:
+    # изменения долей одного бюджета — по очереди: у budget_share нет уникального (budget_id, user_id)
+    db.execute(sa.select(models.Budget.id).where(models.Budget.id == budget_id).with_for_update())
+
+
+@router.get("/{budget_id}/shares", response_model=list[BudgetShareRead])
+@db_route
+def list_shares(budget_id: int, db: Session = Depends(get_db), access: acl.Access = Depends(acl.current_access)):
+    """Пользователи, которым открыт бюджет, и их роли (владелец — в owner_user_id бюджета)."""
+    acl.require_budget(access, budget_id)
+    s = models.BudgetShare
+    return db.query(s).filter(s.budget_id == budget_id).order_by(s.user_id).all()
+
+
+@router.put("/{budget_id}/shares/{user_id}", response_model=BudgetShareRead)
+@db_route
+def put_share(
+    budget_id: int,
+    user_id: int,
+    payload: BudgetShareUpdate,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """Открыть бюджет пользователю или сменить его роль (только владелец)."""
+    acl.require_budget(access, budget_id, acl.OWNER)
+    if user_id == access.user_id:
+        raise HTTPException(status_code=400, detail="owner already has full access")
+    if not db.get(models.User, user_id):
+        raise HTTPException(status_code=400, detail="user not found")
+    _lock_budget(db, budget_id)
+    s = models.BudgetShare
+    share = db.query(s).filter(s.budget_id == budget_id, s.user_id == user_id).first()
+    if share is None:
+        share = models.BudgetShare(budget_id=budget_id, user_id=user_id, role=payload.role)
+        db.add(share)
+    else:
+        share.role = payload.role
+    db.commit()  # карта ролей пользователя сбрасывается после commit (app/src/acl.py)
+    db.refresh(share)
+    return share
+
+
+@router.delete("/{budget_id}/shares/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@db_route
+def delete_share(
+    budget_id: int,
+    user_id: int,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """Закрыть доступ к бюджету (владелец — любому, участник — себе)."""
+    acl.require_budget(access, budget_id, acl.OWNER if user_id != access.user_id else acl.VIEWER)
+    _lock_budget(db, budget_id)
+    s = models.BudgetShare
+    shares = db.query(s).filter(s.budget_id == budget_id, s.user_id == user_id).all()
+    if not shares:
+        raise HTTPException(status_code=404, detail="share not found")
+    for share in shares:
+        db.delete(share)
+    db.commit()
@@ -1,27 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+import sqlalchemy as sa
 from sqlalchemy.orm import Session
-from app.src.deps import get_db
+from app.src.deps import get_db, db_route
 from app.db import models
-from app.src.schemas import CategoryCreate, CategoryRead
+from app.src import fastjson, versions, response_cache, events, category_tree, acl
+from app.src.schemas import CategoryCreate, CategoryRead, CategoryUpdate
 
 router = APIRouter()
 
 @router.post("", response_model=CategoryRead, status_code=status.HTTP_201_CREATED)
-def create_category(payload: CategoryCreate, db: Session = Depends(get_db)):
-    if not db.query(models.Budget).filter(models.Budget.id == payload.budget_id).first():
-        raise HTTPException(400, "budget_id not found")
-    c = models.Category(budget_id=payload.budget_id, name=payload.name)
+@db_route
+def create_category(
+    payload: CategoryCreate,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    acl.require(access, payload.budget_id, acl.EDITOR, "budget_id not found", 400)
+    # до изменения дерева: блокировка строки budget упорядочивает изменения дерева бюджета
+    versions.bump_budget(db, payload.budget_id)
+    if payload.parent_id is not None:
+        parent = db.get(models.Category, payload.parent_id)
+        if not parent or parent.budget_id != payload.budget_id:
+            raise HTTPException(400, "parent_id not found")
+    c = models.Category(budget_id=payload.budget_id, name=payload.name, parent_id=payload.parent_id)
     db.add(c)
+    db.flush()
+    category_tree.attach(db, c.id, c.parent_id)
+    events.emit(db, payload.budget_id, "category.created", CategoryRead.model_validate(c).model_dump(mode="json"))
     db.commit()
+    response_cache.invalidate(("categories", payload.budget_id))
+    db.refresh(c)
+    return c
+
+@router.patch("/{category_id}", response_model=CategoryRead)
+@db_route
+def update_category(
+    category_id: int,
+    payload: CategoryUpdate,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """Переименование и/или перенос категории вместе с подкатегориями под другого родителя."""
+    c = db.get(models.Category, category_id)
+    acl.require(access, c.budget_id if c else None, acl.EDITOR, "category not found")
+    versions.bump_budget(db, c.budget_id)
+    if payload.name is not None:
+        c.name = payload.name
+    if "parent_id" in payload.model_fields_set and payload.parent_id != c.parent_id:
+        if payload.parent_id is not None:
+            parent = db.get(models.Category, payload.parent_id)
+            if not parent or parent.budget_id != c.budget_id:
+                raise HTTPException(400, "parent_id not found")
+            if category_tree.is_in_subtree(db, parent.id, c.id):
+                raise HTTPException(400, "category cannot be moved into its own subtree")
+        category_tree.move(db, c.id, payload.parent_id)
+        c.parent_id = payload.parent_id
+    db.flush()
+    events.emit(db, c.budget_id, "category.updated", CategoryRead.model_validate(c).model_dump(mode="json"))
+    db.commit()
+    response_cache.invalidate(("categories", c.budget_id))
     db.refresh(c)
     return c
 
 @router.get("", response_model=list[CategoryRead])
+@db_route
 def list_categories(
+    request: Request,
     db: Session = Depends(get_db),
-    budget_id: int | None = Query(default=None)
+    budget_id: int | None = Query(default=None),
+    access: acl.Access = Depends(acl.current_access),
 ):
-    q = db.query(models.Category).order_by(models.Category.id.desc())
+    # без budget_id — категории всех доступных бюджетов
+    if budget_id is not None:
+        acl.require_budget(access, budget_id)
+    key, cached = response_cache.lookup(request, ("categories", budget_id)) if budget_id is not None else (None, None)
+    if cached is not None:
+        return cached
+    ver = versions.budget_version(db, budget_id)
+    if (not_modified := versions.not_modified(request, ver)) is not None:
+        return not_modified
+    q = sa.select(*fastjson.columns(models.Category, CategoryRead)).order_by(models.Category.id.desc())
     if budget_id is not None:
-        q = q.filter(models.Category.budget_id == budget_id)
-    return q.all()
\ No newline at end of file
+        q = q.where(models.Category.budget_id == budget_id)
+    else:
+        q = q.where(models.Category.budget_id.in_(access.budget_ids()))
+    resp = fastjson.FastJSONResponse(fastjson.records(db.execute(q).all(), CategoryRead), headers=versions.headers(ver))
+    return response_cache.store(key, resp, ver)
\ No newline at end of file
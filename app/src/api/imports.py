@@ -0,0 +1,19 @@
+# app/src/api/imports.py
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app.src.deps import get_db, db_route
+from app.src import acl
+from app.db import models
+from app.src.schemas import ImportJobRead
+
+router = APIRouter()
+
+
+@router.get("/{job_id}", response_model=ImportJobRead)
+@db_route
+def get_import_job(job_id: int, db: Session = Depends(get_db), access: acl.Access = Depends(acl.current_access)):
+    """Состояние задачи импорта выписки: статус, доля прочитанного файла, счётчики и ошибки строк."""
+    job = db.get(models.ImportJob, job_id)
+    acl.require(access, job.budget_id if job else None, acl.VIEWER, "import job not found")
+    return job
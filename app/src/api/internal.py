@@ -0,0 +1,48 @@
+# app/src/api/internal.py
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+
+from app.db import pool_metrics
+from app.src import response_cache, events, fx
+
+router = APIRouter()
+
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+
+
+_LOOPBACK = {"127.0.0.1", "::1"}
+
+
+def internal_access(request: Request, x_internal_token: str | None = Header(default=None, alias="X-Internal-Token")):
+    # токен задан в ENV — служебные эндпоинты только с ним; не задан — только с локального адреса
+    if INTERNAL_API_TOKEN:
+        if not x_internal_token or not hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN):
+            raise HTTPException(403, "forbidden")
+    elif request.client is None or request.client.host not in _LOOPBACK:
+        raise HTTPException(403, "forbidden")
+
+
+@router.get("/pool", dependencies=[Depends(internal_access)])
+def pool_status():
+    """Состояние пулов соединений (sync и, при DB_ASYNC=1, async): занятость, overflow, ожидания."""
+    return pool_metrics.pool_status()
+
+
+@router.get("/cache", dependencies=[Depends(internal_access)])
+def cache_status():
+    """Кеш ответов чтения: бэкенд, попадания/промахи/инвалидации по видам данных (счётчики этого процесса)."""
+    return response_cache.stats()
+
+
+@router.get("/fx", dependencies=[Depends(internal_access)])
+def fx_status():
+    """Кеш курсов валют этого процесса: размер, попадания/промахи."""
+    return fx.stats()
+
+
+@router.get("/events", dependencies=[Depends(internal_access)])
+def events_status():
+    """SSE-подписчики этого процесса и число разосланных событий."""
+    return events.broker.stats()
@@ -1,135 +1,328 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import DBAPIError
+from pydantic import ValidationError
 from datetime import datetime, timezone
 from decimal import Decimal
+import json
+import os
 
-from app.src.deps import get_db
+import sqlalchemy as sa
+
+from app.src.deps import get_db, db_route
 from app.db import models
-from app.src.schemas import OperationCreate, OperationRead
+from app.src import totals, planning, fastjson, versions, response_cache, events, partitions, acl
+from app.src.schemas import OperationCreate, OperationRead, BulkItemError, BulkOperationResult
 
 router = APIRouter()
 
-def _get_step(db: Session, step_id: int):
-    return db.query(models.BudgetStep).filter(models.BudgetStep.id == step_id).first()
+# Размер пачки для multi-row INSERT и лимит элементов в одном запросе /bulk
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100000"))
 
-def _get_account(db: Session, acc_id: int | None):
-    if not acc_id:
-        return None
-    return db.query(models.Account).filter(models.Account.id == acc_id).first()
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
 
-def _get_category(db: Session, cat_id: int | None):
-    if not cat_id:
-        return None
-    return db.query(models.Category).filter(models.Category.id == cat_id).first()
+def _get_step(db: Session, step_id: int):
+    return db.query(models.BudgetStep).filter(models.BudgetStep.id == step_id).first()
 
-@router.post("", response_model=OperationRead, status_code=status.HTTP_201_CREATED)
-def create_operation(payload: OperationCreate, db: Session = Depends(get_db)):
-    step = _get_step(db, payload.step_id)
-    if not step:
-        raise HTTPException(400, "step_id not found")
+def _resolve(db: Session, cache: dict, id_col, cols: list, ids) -> dict:
+    """
+    Догружает в cache строки (id, *cols) одним запросом IN (...) только для ещё не известных id.
+    Не найденные id кешируются как None, чтобы не запрашивать их повторно.
+    """
+    missing = {i for i in ids if i and i not in cache}
+    if missing:
+        cache.update(dict.fromkeys(missing))
+        for row in db.execute(sa.select(id_col, *cols).where(id_col.in_(missing))):
+            cache[row[0]] = row
+    return cache
 
+def _check_refs(payload: OperationCreate, step, accounts: dict, categories: dict, planned: dict) -> str | None:
+    """
+    Проверка согласованности ссылок операции с бюджетом шага.
+    Работает по заранее загруженным словарям id -> строка, без обращений к БД.
+    Возвращает текст ошибки или None.
+    """
     if payload.sign in {"income", "expense"}:
-        acc = _get_account(db, payload.account_id)
+        acc = accounts.get(payload.account_id)
         if not acc:
-            raise HTTPException(400, "account_id not found")
+            return "account_id not found"
         if acc.budget_id != step.budget_id:
-            raise HTTPException(400, "account belongs to another budget")
+            return "account belongs to another budget"
 
     if payload.sign == "transfer":
-        src = _get_account(db, payload.account_id)
-        dst = _get_account(db, payload.account_id_to)
+        src = accounts.get(payload.account_id)
+        dst = accounts.get(payload.account_id_to)
         if not src or not dst:
-            raise HTTPException(400, "account_id or account_id_to not found")
+            return "account_id or account_id_to not found"
         if src.budget_id != step.budget_id or dst.budget_id != step.budget_id:
-            raise HTTPException(400, "transfer accounts must belong to step's budget")
+            return "transfer accounts must belong to step's budget"
 
     if payload.category_id:
-        cat = _get_category(db, payload.category_id)
+        cat = categories.get(payload.category_id)
         if not cat:
-            raise HTTPException(400, "category_id not found")
+            return "category_id not found"
         if cat.budget_id != step.budget_id:
-            raise HTTPException(400, "category belongs to another budget")
+            return "category belongs to another budget"
 
     if payload.kind == "actual" and payload.planned_ref_id:
-        planned = db.query(models.Operation).filter(models.Operation.id == payload.planned_ref_id).first()
-        if not planned:
-            raise HTTPException(400, "planned_ref_id not found")
-        if planned.kind != "planned":
-            raise HTTPException(400, "planned_ref_id must refer to a planned operation")
-        if planned.step_id != payload.step_id:
-            raise HTTPException(400, "planned and actual must belong to the same step")
-
-    op = models.Operation(
-        budget_id=step.budget_id,
+        ref = planned.get(payload.planned_ref_id)
+        if not ref:
+            return "planned_ref_id not found"
+        if ref.kind != "planned":
+            return "planned_ref_id must refer to a planned operation"
+        if ref.step_id != payload.step_id:
+            return "planned and actual must belong to the same step"
+
+    return None
+
+def _operation_values(payload: OperationCreate, budget_id: int, now: datetime) -> dict:
+    return dict(
+        budget_id=budget_id,
         step_id=payload.step_id,
         kind=payload.kind,
         sign=payload.sign,
         amount=Decimal(payload.amount),
         currency=payload.currency,
-        date=payload.date or datetime.now(timezone.utc),
+        date=payload.date or now,
         account_id=payload.account_id,
         account_id_to=payload.account_id_to,
         category_id=payload.category_id,
         comment=payload.comment,
         planned_ref_id=payload.planned_ref_id,
-        created_at=datetime.now(timezone.utc),
+        created_at=now,
     )
+
+@router.post("", response_model=OperationRead, status_code=status.HTTP_201_CREATED)
+@db_route
+def create_operation(
+    payload: OperationCreate,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    step = _get_step(db, payload.step_id)
+    acl.require(access, step.budget_id if step else None, acl.EDITOR, "step_id not found", 400)
+
+    accounts = _resolve(db, {}, models.Account.id, [models.Account.budget_id],
+                        {payload.account_id, payload.account_id_to})
+    categories = _resolve(db, {}, models.Category.id, [models.Category.budget_id], {payload.category_id})
+    planned = {}
+    if payload.kind == "actual":
+        planned = _resolve(db, {}, models.Operation.id, [models.Operation.kind, models.Operation.step_id],
+                           {payload.planned_ref_id})
+
+    err = _check_refs(payload, step, accounts, categories, planned)
+    if err:
+        raise HTTPException(400, err)
+
+    op = models.Operation(**_operation_values(payload, step.budget_id, datetime.now(timezone.utc)))
     db.add(op)
+    totals.add_totals(db, [op])
+    versions.bump_steps(db, [op.step_id])
+    db.flush()
+    events.emit(db, step.budget_id, "operation.created", OperationRead.model_validate(op).model_dump(mode="json"))
     db.commit()
+    response_cache.invalidate(("step", payload.step_id))
     db.refresh(op)
     return op
 
+
+# ---------- Пакетная загрузка операций ----------
+class _BadLine:
+    """Строка NDJSON, которую не удалось разобрать как JSON."""
+    def __init__(self, error: str):
+        self.error = error
+
+
+def _parse_ndjson_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return _BadLine(f"invalid json: {e}")
+
+
+async def _read_bulk_items(request: Request) -> list:
+    """
+    Тело /bulk: JSON-массив OperationCreate либо NDJSON (по объекту на строку).
+    NDJSON читается из потока построчно, битые строки превращаются в ошибки элементов.
+    """
+    ctype = request.headers.get("content-type", "").lower()
+    items: list = []
+    if ctype.startswith(NDJSON_TYPES):
+        buf = b""
+        async for chunk in request.stream():
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            items.extend(_parse_ndjson_line(line) for line in lines if line.strip())
+            if len(items) > BULK_MAX_ITEMS:
+                break
+        if buf.strip():
+            items.append(_parse_ndjson_line(buf))
+    else:
+        try:
+            items = await request.json()
+        except ValueError:
+            raise HTTPException(400, "invalid json body")
+        if not isinstance(items, list):
+            raise HTTPException(422, "expected a json array of operations")
+
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(413, f"too many items (max {BULK_MAX_ITEMS})")
+    return items
+
+
+def _validation_message(e: ValidationError) -> str:
+    parts = []
+    for err in e.errors():
+        loc = ".".join(str(x) for x in err.get("loc", ()))
+        parts.append(f"{loc}: {err['msg']}" if loc else err["msg"])
+    return "; ".join(parts)
+
+
+_BULK_BODY_DOC = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {"type": "array", "items": {"$ref": "#/components/schemas/OperationCreate"}},
+            },
+            "application/x-ndjson": {
+                "schema": {"$ref": "#/components/schemas/OperationCreate"},
+            },
+        },
+    }
+}
+
+
+@router.post("/bulk", response_model=BulkOperationResult, openapi_extra=_BULK_BODY_DOC)
+@db_route(cpu_bound=True)
+def create_operations_bulk(
+    items: list = Depends(_read_bulk_items),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Пакетное создание операций.
+    Ссылки (шаги, счета, категории, плановые) резолвятся одним IN-запросом на таблицу для каждой пачки,
+    согласованность бюджетов проверяется в памяти, вставка — один multi-row INSERT ... RETURNING на пачку.
+    Ошибочные элементы попадают в errors и не прерывают загрузку остальных
+    (в том числе операции шагов, бюджет которых пользователю недоступен или доступен только на чтение).
+    """
+    ids: list[int | None] = [None] * len(items)
+    errors: list[BulkItemError] = []
+    created_by_step: dict[int, list[int]] = {}  # step_id -> [budget_id, число операций]
+
+    payloads: list[tuple[int, OperationCreate]] = []
+    for i, raw in enumerate(items):
+        if isinstance(raw, _BadLine):
+            errors.append(BulkItemError(index=i, error=raw.error))
+            continue
+        try:
+            payloads.append((i, OperationCreate.model_validate(raw)))
+        except ValidationError as e:
+            errors.append(BulkItemError(index=i, error=_validation_message(e)))
+
+    steps: dict = {}
+    accounts: dict = {}
+    categories: dict = {}
+    planned: dict = {}
+    now = datetime.now(timezone.utc)
+    stmt = sa.insert(models.Operation).returning(models.Operation.id, sort_by_parameter_order=True)
+
+    for start in range(0, len(payloads), BULK_CHUNK_SIZE):
+        chunk = payloads[start:start + BULK_CHUNK_SIZE]
+        _resolve(db, steps, models.BudgetStep.id, [models.BudgetStep.budget_id],
+                 {p.step_id for _, p in chunk})
+        _resolve(db, accounts, models.Account.id, [models.Account.budget_id],
+                 {a for _, p in chunk for a in (p.account_id, p.account_id_to)})
+        _resolve(db, categories, models.Category.id, [models.Category.budget_id],
+                 {p.category_id for _, p in chunk})
+        _resolve(db, planned, models.Operation.id, [models.Operation.kind, models.Operation.step_id],
+                 {p.planned_ref_id for _, p in chunk if p.kind == "actual"})
+
+        rows: list[dict] = []
+        positions: list[int] = []
+        for i, p in chunk:
+            step = steps.get(p.step_id)
+            if not step or not access.can(step.budget_id):
+                err = "step_id not found"
+            elif not access.can(step.budget_id, acl.EDITOR):
+                err = "forbidden"
+            else:
+                err = _check_refs(p, step, accounts, categories, planned)
+            if err:
+                errors.append(BulkItemError(index=i, error=err))
+                continue
+            rows.append(_operation_values(p, step.budget_id, now))
+            positions.append(i)
+
+        if not rows:
+            continue
+        try:
+            # savepoint на пачку: сбой вставки откатывает только её
+            with db.begin_nested():
+                new_ids = db.execute(stmt, rows).scalars().all()
+                totals.add_totals(db, rows)
+        except DBAPIError as e:
+            msg = f"insert failed: {getattr(e, 'orig', e)}"
+            errors.extend(BulkItemError(index=i, error=msg) for i in positions)
+            continue
+        for r in rows:
+            created_by_step.setdefault(r["step_id"], [r["budget_id"], 0])[1] += 1
+        for i, new_id in zip(positions, new_ids):
+            ids[i] = new_id
+
+    # версии шагов и события — один раз на запрос, а не на пачку; в событии только счётчик,
+    # сами операции клиент дочитает лентой шага
+    versions.bump_steps(db, created_by_step)
+    for step_id, (budget_id, n) in sorted(created_by_step.items()):
+        events.emit(db, budget_id, "operations.created", {"step_id": step_id, "count": n})
+    db.commit()
+    response_cache.invalidate(*(("step", s) for s in created_by_step))
+    errors.sort(key=lambda e: e.index)
+    return BulkOperationResult(created=sum(1 for x in ids if x is not None), ids=ids, errors=errors)
+
 @router.get("", response_model=list[OperationRead])
+@db_route(cpu_bound=True)
 def list_operations(
+    request: Request,
     db: Session = Depends(get_db),
     step_id: int = Query(...),
     kind: str | None = Query(default=None, pattern="^(planned|actual)$"),
+    access: acl.Access = Depends(acl.current_access),
 ):
-    q = db.query(models.Operation).filter(models.Operation.step_id == step_id)
+    acl.require_step(db, access, step_id)
+    ver = versions.step_version(db, step_id)
+    if (not_modified := versions.not_modified(request, ver)) is not None:
+        return not_modified
+    q = sa.select(*fastjson.columns(models.Operation, OperationRead)).where(partitions.by_step(step_id))
     if kind:
-        q = q.filter(models.Operation.kind == kind)
-    return q.order_by(models.Operation.id.asc()).all()
+        q = q.where(models.Operation.kind == kind)
+    rows = db.execute(q.order_by(models.Operation.id.asc())).all()
+    return fastjson.FastJSONResponse(fastjson.records(rows, OperationRead), headers=versions.headers(ver))
 
 @router.post("/copy_planned", response_model=dict, status_code=status.HTTP_201_CREATED)
+@db_route
 def copy_planned_operations(
     source_step_id: int = Query(...),
     target_step_id: int = Query(...),
     db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
 ):
     if source_step_id == target_step_id:
         raise HTTPException(400, "source_step_id and target_step_id must differ")
 
     src = _get_step(db, source_step_id)
     dst = _get_step(db, target_step_id)
-    if not src or not dst:
+    if not src or not dst or not access.can(src.budget_id):
         raise HTTPException(400, "source or target step not found")
     if src.budget_id != dst.budget_id:
         raise HTTPException(400, "steps must belong to the same budget")
+    acl.require_budget(access, src.budget_id, acl.EDITOR)
 
-    planned_ops = db.query(models.Operation).filter(
-        models.Operation.step_id == source_step_id,
-        models.Operation.kind == "planned"
-    ).all()
-
-    created = 0
-    for p in planned_ops:
-        clone = models.Operation(
-            budget_id=dst.budget_id,
-            step_id=target_step_id,
-            kind="planned",
-            sign=p.sign,
-            amount=p.amount,
-            currency=p.currency,
-            date=dst.date_start or datetime.now(timezone.utc),
-            account_id=p.account_id,
-            account_id_to=p.account_id_to,
-            category_id=p.category_id,
-            comment=p.comment,
-            planned_ref_id=None,
-            created_at=datetime.now(timezone.utc),
-        )
-        db.add(clone)
-        created += 1
-
+    created = planning.copy_planned(db, source_step_id, [target_step_id], keep_dates=False)
+    if created:
+        events.emit(db, dst.budget_id, "operations.created", {"step_id": target_step_id, "count": created})
     db.commit()
-    return {"copied": created}
\ No newline at end of file
+    response_cache.invalidate(("step", target_step_id))
+    return {"copied": created}
@@ -1,15 +1,20 @@
 from __future__ import annotations
-from datetime import date
+import os
+from datetime import date, datetime
+from decimal import Decimal
 from typing import List, Optional
 
 import sqlalchemy as sa
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app.db import models
-from app.db.deps import get_db
-from app.src import schemas
+from app.db.base import SessionLocal
+from app.src.deps import get_db, db_route
+from app.src import schemas, totals, planning, fastjson, versions, response_cache, events, partitions, fx, reports, acl, matching
+from app.src.pagination import encode_cursor, decode_cursor
 
 router = APIRouter()
 
@@ -20,10 +25,13 @@ class _StepCreatePayload(schemas.StepCreate):
 
 
 @router.post("", response_model=schemas.StepRead)
-def create_step(payload: _StepCreatePayload, db: Session = Depends(get_db)):
-    budget = db.get(models.Budget, payload.budget_id)
-    if not budget:
-        raise HTTPException(status_code=404, detail="budget not found")
+@db_route
+def create_step(
+    payload: _StepCreatePayload,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    acl.require_budget(access, payload.budget_id, acl.EDITOR)
 
     step = models.BudgetStep(
         budget_id=payload.budget_id,
@@ -33,67 +41,230 @@ def create_step(payload: _StepCreatePayload, db: Session = Depends(get_db)):
         date_end=payload.date_end,
     )
     db.add(step)
+    versions.bump_budget(db, payload.budget_id)
+    db.flush()
+    events.emit(db, payload.budget_id, "step.created", schemas.StepRead.model_validate(step).model_dump(mode="json"))
     db.commit()
+    response_cache.invalidate(("steps", payload.budget_id))
     db.refresh(step)
     return step
 
 
 @router.get("", response_model=List[schemas.StepRead])
-def list_steps(budget_id: int = Query(...), db: Session = Depends(get_db)):
-    steps = (
-        db.query(models.BudgetStep)
-        .filter(models.BudgetStep.budget_id == budget_id)
+@db_route
+def list_steps(
+    request: Request,
+    budget_id: int = Query(...),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    acl.require_budget(access, budget_id)
+    key, cached = response_cache.lookup(request, ("steps", budget_id))
+    if cached is not None:
+        return cached
+    # ETag — версия бюджета: при совпадении 304 без чтения шагов
+    ver = versions.budget_version(db, budget_id)
+    if (not_modified := versions.not_modified(request, ver)) is not None:
+        return not_modified
+    q = (
+        sa.select(*fastjson.columns(models.BudgetStep, schemas.StepRead))
+        .where(models.BudgetStep.budget_id == budget_id)
         .order_by(models.BudgetStep.date_start.desc(), models.BudgetStep.id.desc())
-        .all()
     )
-    return steps
+    resp = fastjson.FastJSONResponse(fastjson.records(db.execute(q).all(), schemas.StepRead),
+                                     headers=versions.headers(ver))
+    return response_cache.store(key, resp, ver)
 
 
 # ---------- НОВОЕ: Лента операций шага ----------
-@router.get("/{step_id}/feed", response_model=list[schemas.OperationRead])
-def get_step_feed(step_id: int, db: Session = Depends(get_db)):
+FEED_DEFAULT_LIMIT = int(os.getenv("FEED_DEFAULT_LIMIT", "100"))
+FEED_MAX_LIMIT = int(os.getenv("FEED_MAX_LIMIT", "1000"))
+FEED_STREAM_BATCH = int(os.getenv("FEED_STREAM_BATCH", "500"))
+
+# Только колонки OperationRead (+ created_at для курсора) — без ORM-объектов
+_FEED_COLUMNS = fastjson.columns(models.Operation, schemas.OperationRead)
+
+
+def _feed_query(step_id: int, cursor: str | None):
+    q = sa.select(*_FEED_COLUMNS, models.Operation.created_at).where(partitions.by_step(step_id))
+    if cursor:
+        ts, op_id = decode_cursor(cursor, 2)
+        try:
+            ts, op_id = datetime.fromisoformat(ts), int(op_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="invalid cursor")
+        q = q.where(sa.tuple_(models.Operation.created_at, models.Operation.id) < sa.tuple_(ts, op_id))
+    return q.order_by(models.Operation.created_at.desc(), models.Operation.id.desc())
+
+
+def _stream_feed(q):
+    """
+    NDJSON-поток ленты: строки читаются серверным курсором пачками по FEED_STREAM_BATCH,
+    поэтому память не зависит от размера шага. Сессия своя — живёт столько же, сколько поток.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(q.execution_options(yield_per=FEED_STREAM_BATCH))
+        for part in result.partitions():
+            yield b"".join(fastjson.dumps(rec) + b"\n" for rec in fastjson.records(part, schemas.OperationRead))
+    finally:
+        db.close()
+
+
+@router.get("/{step_id}/feed", response_model=schemas.OperationFeedPage)
+@db_route
+def get_step_feed(
+    request: Request,
+    step_id: int,
+    limit: int = Query(default=FEED_DEFAULT_LIMIT, ge=1, le=FEED_MAX_LIMIT),
+    cursor: Optional[str] = Query(default=None, description="next_cursor из предыдущей страницы"),
+    fmt: str = Query(default="json", alias="format", pattern="^(json|ndjson)$"),
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
     """
     Возвращает операции шага, отсортированные по времени создания (как лента).
     Включает planned и actual.
+    Keyset-пагинация по (created_at, id): следующая страница запрашивается с cursor=next_cursor.
+    format=ndjson отдаёт потоком все операции начиная с cursor (limit не применяется).
+    ETag — версия шага: если операции не менялись, 304 без чтения ленты.
     """
-    ops = (
-        db.query(models.Operation)
-        .filter(models.Operation.step_id == step_id)
-        .order_by(models.Operation.created_at.desc())
-        .all()
-    )
-    return ops
+    acl.require_step(db, access, step_id)
+    ver = versions.step_version(db, step_id)
+    if (not_modified := versions.not_modified(request, ver)) is not None:
+        return not_modified
+    q = _feed_query(step_id, cursor)
+    if fmt == "ndjson":
+        return StreamingResponse(_stream_feed(q), media_type="application/x-ndjson", headers=versions.headers(ver))
+
+    rows = db.execute(q.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at.isoformat(), rows[-1].id)
+    # строки кодируются напрямую, без OperationRead.model_validate на каждую (схема ответа та же)
+    return fastjson.FastJSONResponse({
+        "items": fastjson.records(rows, schemas.OperationRead),
+        "next_cursor": next_cursor,
+    }, headers=versions.headers(ver))
 
 
-# ---------- НОВОЕ: Сводка по шагу (только actual) ----------
+# ---------- НОВОЕ: Сводка по шагу ----------
 @router.get("/{step_id}/summary", response_model=schemas.StepSummary)
-def get_step_summary(step_id: int, db: Session = Depends(get_db)):
+@db_route
+def get_step_summary(
+    request: Request,
+    step_id: int,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
     """
     Возвращает суммы доходов/расходов за шаг по фактическим операциям.
-    Переводы в сводку не включаем.
+    Переводы в сводку не включаем (отдаются отдельно в total_transfer), план — в planned_*.
+    Читает готовые агрегаты step_totals по первичному ключу, операции не сканируются.
+    Итоги — в валюте бюджета: суммы в других валютах пересчитываются по курсу на конец шага
+    (как в отчётах, см. app/src/fx.py); валюты без курса в итоги не входят и перечислены в unconverted.
+    by_currency — суммы как есть, без пересчёта.
     """
-    row = (
-        db.query(
-            sa.func.coalesce(
-                sa.func.sum(
-                    sa.case((models.Operation.sign == "income", models.Operation.amount), else_=0)
-                ),
-                0,
-            ).label("inc"),
-            sa.func.coalesce(
-                sa.func.sum(
-                    sa.case((models.Operation.sign == "expense", models.Operation.amount), else_=0)
-                ),
-                0,
-            ).label("exp"),
-        )
-        .filter(models.Operation.step_id == step_id, models.Operation.kind == "actual")
-        .one()
+    acl.require_step(db, access, step_id)
+    key, cached = response_cache.lookup(request, ("step", step_id))
+    if cached is not None:
+        return cached
+    ver = versions.step_version(db, step_id)
+    if (not_modified := versions.not_modified(request, ver)) is not None:
+        return not_modified
+    rows = totals.step_totals(db, step_id)
+    currency, date_end = db.execute(
+        sa.select(models.Budget.currency, models.BudgetStep.date_end)
+        .join(models.Budget, models.Budget.id == models.BudgetStep.budget_id)
+        .where(models.BudgetStep.id == step_id)
+    ).one()
+    # курс на date_end меняется только с загрузкой курсов, а она увеличивает версию шага (ETag)
+    fx_version = fx.version(db) if any(r.currency != currency for r in rows) else 0
+    sums: dict[tuple[str, str], Decimal] = {}
+    unconverted: set[str] = set()
+    for r in rows:
+        rate = fx.rate(db, r.currency, currency, date_end, fx_version)
+        if rate is None:
+            if r.ops_count:
+                unconverted.add(r.currency)
+            continue
+        sums[(r.kind, r.sign)] = sums.get((r.kind, r.sign), Decimal(0)) + r.amount * rate
+    sums = {k: v.quantize(fx.CENT) for k, v in sums.items()}
+
+    inc = sums.get(("actual", "income"), Decimal(0))
+    exp = sums.get(("actual", "expense"), Decimal(0))
+    p_inc = sums.get(("planned", "income"), Decimal(0))
+    p_exp = sums.get(("planned", "expense"), Decimal(0))
+    summary = schemas.StepSummary(
+        total_income=inc,
+        total_expense=exp,
+        net=inc - exp,
+        total_transfer=sums.get(("actual", "transfer"), Decimal(0)),
+        planned_income=p_inc,
+        planned_expense=p_exp,
+        planned_net=p_inc - p_exp,
+        currency=currency,
+        unconverted=sorted(unconverted),
+        by_currency=[schemas.StepTotalRead.model_validate(r) for r in rows if r.ops_count],
     )
-    inc = row.inc or 0
-    exp = row.exp or 0
-    net = inc - exp
-    return schemas.StepSummary(total_income=inc, total_expense=exp, net=net)
+    resp = fastjson.FastJSONResponse(summary.model_dump(mode="json"), headers=versions.headers(ver))
+    return response_cache.store(key, resp, ver)
+
+
+@router.get("/{step_id}/category_tree", response_model=schemas.CategoryTree)
+@db_route(cpu_bound=True)
+def get_category_tree(step_id: int, db: Session = Depends(get_db), access: acl.Access = Depends(acl.current_access)):
+    """
+    Все категории бюджета деревом с суммами шага (факт и план, в валюте бюджета):
+    own — операции самой категории, total — вместе с подкатегориями. Суммы — одним запросом.
+    """
+    acl.require_step(db, access, step_id)
+    step = db.get(models.BudgetStep, step_id)
+    budget = db.get(models.Budget, step.budget_id)
+    return reports.category_tree(db, budget, step)
+
+
+# ---------- Сопоставление факта с планом ----------
+@router.post("/{step_id}/match", response_model=schemas.StepMatchResult)
+@db_route(cpu_bound=True)
+def match_step(
+    step_id: int,
+    payload: schemas.StepMatchRequest | None = None,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Связывает фактические операции шага без planned_ref_id с подходящими планами
+    (счёт, категория, знак, сумма в пределах amount_tolerance, дата в пределах date_window_days).
+    dry_run=true только показывает найденные пары, ничего не меняя.
+    """
+    payload = payload or schemas.StepMatchRequest()
+    budget_id = acl.require_step(db, access, step_id, acl.VIEWER if payload.dry_run else acl.EDITOR)
+    if not payload.dry_run:
+        # блокировка строки шага до commit: параллельные записи в шаг ждут, пары не устареют
+        versions.bump_steps(db, [step_id])
+    planned, actual = matching.load(db, step_id)
+    tolerance = payload.amount_tolerance if payload.amount_tolerance is not None else matching.MATCH_AMOUNT_TOLERANCE
+    window = payload.date_window_days if payload.date_window_days is not None else matching.MATCH_DATE_WINDOW_DAYS
+    links = matching.match(planned, actual, tolerance, window)
+
+    matched = len(links)
+    if payload.dry_run or not links:
+        db.rollback()
+    else:
+        matched = matching.write(db, budget_id, links)
+        events.emit(db, budget_id, "operations.matched", {"step_id": step_id, "count": matched})
+        db.commit()
+        response_cache.invalidate(("step", step_id))
+    result = schemas.StepMatchResult(
+        dry_run=payload.dry_run,
+        planned=len(planned),
+        actual=len(actual),
+        matched=matched,
+        links=[schemas.MatchLink(**vars(link)) for link in links],
+    )
+    return fastjson.FastJSONResponse(result.model_dump(mode="json"))
 
 
 # ---------- НОВОЕ: Копирование плановых операций между шагами ----------
@@ -101,42 +272,69 @@ class _CopyPlannedPayload(BaseModel):
     to_step_id: int
 
 
+class _CopyPlannedManyPayload(BaseModel):
+    to_step_ids: List[int] = Field(min_length=1)
+
+
 @router.post("/{from_step_id}/copy_planned")
-def copy_planned_operations(from_step_id: int, payload: _CopyPlannedPayload, db: Session = Depends(get_db)):
+@db_route
+def copy_planned_operations(
+    from_step_id: int,
+    payload: _CopyPlannedPayload,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    if from_step_id == payload.to_step_id:
+        raise HTTPException(status_code=400, detail="target step must differ from the source step")
+
     src = db.get(models.BudgetStep, from_step_id)
     dst = db.get(models.BudgetStep, payload.to_step_id)
-    if not src or not dst:
+    if not src or not dst or not access.can(src.budget_id):
         raise HTTPException(status_code=404, detail="step not found")
     if src.budget_id != dst.budget_id:
         raise HTTPException(status_code=400, detail="steps belong to different budgets")
+    acl.require_budget(access, src.budget_id, acl.EDITOR)
+
+    copied = planning.copy_planned(db, src.id, [dst.id], keep_dates=True)
+    if copied:
+        events.emit(db, src.budget_id, "operations.created", {"step_id": dst.id, "count": copied})
+    db.commit()
+    response_cache.invalidate(("step", dst.id))
+    return {"copied": copied}
+
+
+@router.post("/{from_step_id}/copy_planned_many")
+@db_route
+def copy_planned_operations_many(
+    from_step_id: int,
+    payload: _CopyPlannedManyPayload,
+    db: Session = Depends(get_db),
+    access: acl.Access = Depends(acl.current_access),
+):
+    """
+    Копирует план шага сразу в несколько шагов (например, на все будущие месяцы) одним INSERT ... SELECT.
+    """
+    target_ids = sorted(set(payload.to_step_ids))
+    if from_step_id in target_ids:
+        raise HTTPException(status_code=400, detail="target steps must differ from the source step")
 
-    planned_ops = (
-        db.query(models.Operation)
-        .filter(models.Operation.step_id == src.id, models.Operation.kind == "planned")
+    src = db.get(models.BudgetStep, from_step_id)
+    budgets = dict(
+        db.query(models.BudgetStep.id, models.BudgetStep.budget_id)
+        .filter(models.BudgetStep.id.in_(target_ids))
         .all()
     )
+    if not src or len(budgets) != len(target_ids) or not access.can(src.budget_id):
+        raise HTTPException(status_code=404, detail="step not found")
+    if any(b != src.budget_id for b in budgets.values()):
+        raise HTTPException(status_code=400, detail="steps belong to different budgets")
+    acl.require_budget(access, src.budget_id, acl.EDITOR)
 
-    copied = 0
-    for op in planned_ops:
-        db.add(
-            models.Operation(
-                budget_id=dst.budget_id,
-                step_id=dst.id,
-                kind="planned",
-                sign=op.sign,
-                amount=op.amount,
-                currency=op.currency,
-                date=op.date,
-                account_id=op.account_id,
-                account_id_to=op.account_id_to,
-                category_id=op.category_id,
-                comment=op.comment,
-                planned_ref_id=None,
-                created_by=None,
-                created_at=sa.func.now(),
-            )
-        )
-        copied += 1
-
+    copied = planning.copy_planned(db, src.id, target_ids, keep_dates=True)
+    if copied:
+        # строк на каждый шаг поровну: копируется один и тот же план
+        for t in target_ids:
+            events.emit(db, src.budget_id, "operations.created", {"step_id": t, "count": copied // len(target_ids)})
     db.commit()
-    return {"copied": copied}
\ No newline at end of file
+    response_cache.invalidate(*(("step", t) for t in target_ids))
+    return {"copied": copied, "targets": len(target_ids)}
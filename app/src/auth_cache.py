@@ -0,0 +1,74 @@
+"""
+Кеш аутентификации: токен -> снимок пользователя.
+
+Повторный запрос с тем же JWT не проверяет подпись заново и не ходит в БД за пользователем.
+Запись живёт не дольше USER_CACHE_TTL и не дольше exp самого токена; изменение или удаление
+пользователя через ORM сбрасывает его записи (после flush и ещё раз после commit).
+"""
+import os
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.src.cache import TTLCache
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))      # секунды
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))   # записей (токенов)
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    email: str
+    name: str | None
+
+    @classmethod
+    def of(cls, user: models.User) -> "UserSnapshot":
+        return cls(id=user.id, email=user.email, name=user.name)
+
+
+tokens = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def lookup(token: str) -> UserSnapshot | None:
+    return tokens.get(token)
+
+
+def store(token: str, user: models.User, exp: int) -> UserSnapshot:
+    snap = UserSnapshot.of(user)
+    tokens.set(token, snap, ttl=exp - time.time())
+    return snap
+
+
+def invalidate_user(user_id: int) -> int:
+    return tokens.discard_where(lambda _token, snap: snap.id == user_id)
+
+
+_PENDING_KEY = "auth_cache_invalidate"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = {
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, models.User) and obj.id is not None
+    }
+    if changed:
+        for uid in changed:
+            invalidate_user(uid)
+        session.info.setdefault(_PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    # повторно: между flush и commit запрос мог закешировать ещё старую версию
+    for uid in session.info.pop(_PENDING_KEY, ()):
+        invalidate_user(uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,229 @@
+"""
+Балансы счетов: последний снимок (account_balance_snapshot) + дельта операций после него.
+
+Баланс считается по фактическим операциям: income прибавляет amount к account_id,
+expense вычитает, transfer вычитает с account_id и прибавляет к account_id_to.
+Учитываются только операции в валюте счёта: операции в другой валюте в баланс не входят
+(курс на дату операции мог бы разойтись с уже снятым снимком), а считаются отдельно —
+unconverted_ops, чтобы клиент видел, что баланс неполный.
+
+Снимок покрывает операции с date <= as_of и id <= max_op_id, поэтому дельта —
+операции с date <= at и (date > as_of или id > max_op_id): сюда попадают и записанные
+задним числом. Обе части идут по индексам (account_id, date) / (account_id_to, date),
+так что стоимость запроса — O(операций после снимка), а не всей истории.
+
+snapshot() делает новые снимки для счетов, где после последнего снимка накопилось
+достаточно операций, и удаляет старые (compact) — по бюджету за транзакцию, блокируя на это
+время запись только в этот бюджет; запускается командой
+`python -m app.src.admin snapshot-balances` или фоновой задачей (BALANCE_SNAPSHOT_INTERVAL_SEC).
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, aliased
+
+from app.db import models
+
+log = logging.getLogger(__name__)
+
+# Новый снимок — если после последнего накопилось не меньше стольких операций
+BALANCE_SNAPSHOT_MIN_OPS = int(os.getenv("BALANCE_SNAPSHOT_MIN_OPS", "500"))
+# Сколько последних снимков хранить на счёт (старые нужны только для balance?at= в прошлом)
+BALANCE_SNAPSHOT_KEEP = int(os.getenv("BALANCE_SNAPSHOT_KEEP", "12"))
+# Период фоновой задачи в процессе API, сек.; 0 — выключено (запускать командой из cron)
+BALANCE_SNAPSHOT_INTERVAL_SEC = float(os.getenv("BALANCE_SNAPSHOT_INTERVAL_SEC", "0"))
+
+# ключ pg_advisory_xact_lock (вместе с budget_id): снимки бюджета делает один процесс
+_ADVISORY_LOCK_KEY = 0x62616C73  # "bals"
+
+
+@dataclass
+class Balance:
+    account_id: int
+    budget_id: int
+    name: str
+    currency: str
+    balance: Decimal
+    at: datetime
+    snapshot_as_of: datetime | None
+    ops_since_snapshot: int
+    unconverted_ops: int
+
+
+def _latest_snapshot_id(acc_id_col, at: datetime):
+    """
+    Коррелированный подзапрос: id последнего снимка счёта с as_of <= at.
+    ORDER BY as_of DESC LIMIT 1 по уникальному индексу (account_id, as_of) — один спуск
+    по индексу на счёт, снимки других счетов не читаются.
+    """
+    s = models.AccountBalanceSnapshot
+    return (
+        sa.select(s.id)
+        .where(s.account_id == acc_id_col, s.as_of <= at)
+        .order_by(s.as_of.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def _delta(acc_id_col, budget_id_col, currency_col, snap, at: datetime, incoming: bool):
+    """
+    Коррелированные подзапросы по операциям счёта после снимка: (сумма, число, число в чужой валюте).
+    incoming=False — операции с account_id (income +, expense/transfer -),
+    incoming=True — входящие переводы по account_id_to (+).
+    В сумму идут только операции в валюте счёта; остальные лишь считаются (unconverted_ops).
+    Операции счёта лежат в его бюджете: условие на budget_id оставляет одну секцию operation.
+    """
+    op = models.Operation
+    if incoming:
+        amount = op.amount
+        cond = [op.account_id_to == acc_id_col, op.sign == "transfer"]
+    else:
+        amount = sa.case((op.sign == "income", op.amount), else_=-op.amount)
+        cond = [op.account_id == acc_id_col]
+    after_snapshot = sa.or_(snap.as_of.is_(None), op.date > snap.as_of, op.id > snap.max_op_id)
+    where = sa.and_(*cond, op.budget_id == budget_id_col, op.kind == "actual", op.date <= at, after_snapshot)
+    same = op.currency == currency_col
+    total = sa.select(sa.func.coalesce(sa.func.sum(amount), 0)).where(where, same).scalar_subquery()
+    count = sa.select(sa.func.count()).where(where).scalar_subquery()
+    foreign = sa.select(sa.func.count()).where(where, sa.not_(same)).scalar_subquery()
+    return total, count, foreign
+
+
+def balances(
+    db: Session,
+    *,
+    budget_id: int | None = None,
+    account_ids: list[int] | None = None,
+    at: datetime | None = None,
+) -> list[Balance]:
+    """Балансы счетов бюджета (или указанных счетов) на момент at (по умолчанию — сейчас)."""
+    at = at or datetime.now(timezone.utc)
+    a = models.Account
+    snap = aliased(models.AccountBalanceSnapshot, name="snap")
+    out_sum, out_cnt, out_foreign = _delta(a.id, a.budget_id, a.currency, snap, at, incoming=False)
+    in_sum, in_cnt, in_foreign = _delta(a.id, a.budget_id, a.currency, snap, at, incoming=True)
+
+    q = (
+        sa.select(
+            a.id, a.budget_id, a.name, a.currency,
+            sa.func.coalesce(snap.balance, 0) + out_sum + in_sum,
+            snap.as_of,
+            out_cnt + in_cnt,
+            sa.func.coalesce(snap.unconverted_ops, 0) + out_foreign + in_foreign,
+        )
+        .outerjoin(snap, snap.id == _latest_snapshot_id(a.id, at))
+        .order_by(a.id)
+    )
+    if budget_id is not None:
+        q = q.where(a.budget_id == budget_id)
+    if account_ids is not None:
+        q = q.where(a.id.in_(account_ids))
+    return [
+        Balance(
+            account_id=r[0], budget_id=r[1], name=r[2], currency=r[3], balance=Decimal(r[4]),
+            at=at, snapshot_as_of=r[5], ops_since_snapshot=r[6], unconverted_ops=r[7],
+        )
+        for r in db.execute(q)
+    ]
+
+
+def snapshot(
+    db: Session,
+    *,
+    budget_id: int | None = None,
+    min_ops: int = BALANCE_SNAPSHOT_MIN_OPS,
+    keep: int = BALANCE_SNAPSHOT_KEEP,
+    as_of: datetime | None = None,
+) -> tuple[int, int]:
+    """
+    Снимки балансов на as_of (по умолчанию — сейчас) для счетов, у которых после последнего
+    снимка не меньше min_ops операций, затем удаление снимков сверх keep на счёт.
+    Каждый бюджет — отдельная короткая транзакция (коммитит сама). Возвращает (создано, удалено).
+    """
+    as_of = as_of or datetime.now(timezone.utc)
+    if budget_id is not None:
+        budget_ids = [budget_id]
+    else:
+        budget_ids = db.scalars(sa.select(models.Budget.id).order_by(models.Budget.id)).all()
+        db.commit()
+    created = deleted = 0
+    for b in budget_ids:
+        try:
+            c, d = _snapshot_budget(db, b, min_ops, keep, as_of)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        created += c
+        deleted += d
+    return created, deleted
+
+
+def _snapshot_budget(db: Session, budget_id: int, min_ops: int, keep: int, as_of: datetime) -> tuple[int, int]:
+    s = models.AccountBalanceSnapshot
+    op = models.Operation
+    if db.get_bind().dialect.name == "postgresql":
+        lock = sa.func.pg_try_advisory_xact_lock(_ADVISORY_LOCK_KEY, budget_id)
+        if not db.execute(sa.select(lock)).scalar():
+            return 0, 0  # этот бюджет сейчас снимает другой процесс
+    # Вставка операции держит FOR KEY SHARE на строке своего бюджета (проверка внешнего ключа)
+    # до commit, а FOR UPDATE с ним конфликтует: ждём транзакции, уже пишущие в этот бюджет
+    # (иначе строка с id <= max_op_id, закоммиченная после снимка, не попала бы ни в снимок,
+    # ни в дельту), и до commit задерживаем новые — только в этом бюджете.
+    if db.execute(sa.select(models.Budget.id).where(models.Budget.id == budget_id).with_for_update()).first() is None:
+        return 0, 0
+    max_op_id = db.execute(
+        sa.select(sa.func.coalesce(sa.func.max(op.id), 0)).where(op.budget_id == budget_id)
+    ).scalar()
+    due = [b for b in balances(db, budget_id=budget_id, at=as_of) if b.ops_since_snapshot >= max(min_ops, 1)]
+    if due:
+        db.execute(sa.insert(s), [
+            dict(account_id=b.account_id, as_of=as_of, max_op_id=max_op_id, balance=b.balance,
+                 unconverted_ops=b.unconverted_ops)
+            for b in due
+        ])
+    return len(due), compact(db, keep=keep, budget_id=budget_id)
+
+
+def compact(db: Session, *, keep: int = BALANCE_SNAPSHOT_KEEP, budget_id: int | None = None) -> int:
+    """Удалить снимки сверх keep последних на счёт. Возвращает число удалённых."""
+    s = models.AccountBalanceSnapshot
+    ranked = sa.select(
+        s.id, sa.func.row_number().over(partition_by=s.account_id, order_by=s.as_of.desc()).label("rn"),
+    )
+    if budget_id is not None:
+        ranked = ranked.where(
+            s.account_id.in_(sa.select(models.Account.id).where(models.Account.budget_id == budget_id))
+        )
+    ranked = ranked.subquery()
+    stale = sa.select(ranked.c.id).where(ranked.c.rn > max(keep, 1))
+    return db.execute(sa.delete(s).where(s.id.in_(stale))).rowcount or 0
+
+
+async def snapshot_loop(session_factory, interval: float) -> None:
+    """Фоновая задача: snapshot() раз в interval секунд (в threadpool, ошибки только логируются)."""
+    from fastapi.concurrency import run_in_threadpool
+
+    def run_once() -> tuple[int, int]:
+        db = session_factory()
+        try:
+            return snapshot(db)
+        finally:
+            db.close()
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            created, deleted = await run_in_threadpool(run_once)
+            if created or deleted:
+                log.info("balance snapshots: %d created, %d compacted", created, deleted)
+        except Exception:
+            log.exception("balance snapshot job failed")
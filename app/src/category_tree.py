@@ -0,0 +1,65 @@
+"""
+Дерево категорий: category.parent_id и таблица замыкания category_closure.
+
+В category_closure лежат все пары (предок, потомок, глубина), включая (id, id, 0), поэтому
+поддерево или предки категории — один индексный проход, а свёртка сумм по дереву —
+одно соединение с operation (см. reports.category_tree). Таблицу меняют только функции этого модуля.
+
+Изменения дерева одного бюджета выполняются по очереди: вызывающий код сначала увеличивает
+версию бюджета (versions.bump_budget) — UPDATE строки budget держит её блокировку до commit,
+и параллельное перемещение не построит цикл по устаревшему дереву.
+"""
+from __future__ import annotations
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, aliased
+
+from app.db import models
+
+
+def attach(db: Session, category_id: int, parent_id: int | None) -> None:
+    """Пути новой категории: к себе и ко всем предкам parent_id."""
+    cc = models.CategoryClosure
+    paths = sa.select(sa.literal(category_id), sa.literal(category_id), sa.literal(0))
+    if parent_id is not None:
+        paths = paths.union_all(
+            sa.select(cc.ancestor_id, sa.literal(category_id), cc.depth + 1).where(cc.descendant_id == parent_id)
+        )
+    db.execute(sa.insert(cc).from_select(["ancestor_id", "descendant_id", "depth"], paths))
+
+
+def subtree_ids(category_id: int):
+    """SELECT id категорий поддерева (включая саму категорию)."""
+    cc = models.CategoryClosure
+    return sa.select(cc.descendant_id).where(cc.ancestor_id == category_id)
+
+
+def is_in_subtree(db: Session, category_id: int, root_id: int) -> bool:
+    cc = models.CategoryClosure
+    return db.scalar(
+        sa.select(sa.literal(True)).where(cc.ancestor_id == root_id, cc.descendant_id == category_id)
+    ) is not None
+
+
+def move(db: Session, category_id: int, parent_id: int | None) -> None:
+    """
+    Перенести поддерево category_id под parent_id (None — в корень): пути в category_closure;
+    category.parent_id выставляет вызывающий код. parent_id не должен лежать в этом поддереве —
+    это тоже проверяет вызывающий код (is_in_subtree).
+    """
+    cc = models.CategoryClosure
+    sub = subtree_ids(category_id)
+    # пути от прежних внешних предков к поддереву
+    db.execute(
+        sa.delete(cc).where(cc.descendant_id.in_(sub), cc.ancestor_id.not_in(sub)),
+        execution_options={"synchronize_session": False},
+    )
+    if parent_id is not None:
+        sup, low = aliased(cc), aliased(cc)
+        db.execute(sa.insert(cc).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            sa.select(sup.ancestor_id, low.descendant_id, sup.depth + low.depth + 1)
+            .select_from(sup)
+            .join(low, sa.true())
+            .where(sup.descendant_id == parent_id, low.ancestor_id == category_id),
+        ))
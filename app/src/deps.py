@@ -1,10 +1,61 @@
 # app/src/deps.py
-from typing import Generator
-from app.db.base import SessionLocal
+import inspect
+import typing
+from typing import AsyncGenerator, Generator
+
+from fastapi import Depends
+
+from app.db.base import SessionLocal, AsyncSessionLocal, DB_ASYNC
 
 def get_db() -> Generator:
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def db_route(fn=None, *, cpu_bound: bool = False):
+    """
+    Декоратор обработчика с параметром `db: Session = Depends(get_db)`.
+
+    По умолчанию возвращает обработчик как есть (sync, выполняется в threadpool).
+    При DB_ASYNC=1 подменяет его async-обёрткой: db берётся из get_async_db, а тело
+    выполняется через AsyncSession.run_sync — в greenlet'е на event loop, поэтому
+    ожидание Postgres не занимает поток и один воркер держит сотни запросов.
+
+    Всё, что тело делает помимо запросов, тоже идёт на event loop и на это время останавливает
+    остальные запросы воркера. Поэтому обработчики с заметной работой в Python (валидация
+    больших пакетов, свёртка отчётов, сборка больших ответов) объявляются как
+    @db_route(cpu_bound=True): они и при DB_ASYNC=1 остаются sync — в threadpool с sync-сессией.
+    """
+    if fn is None:
+        return lambda f: db_route(f, cpu_bound=cpu_bound)
+    if not DB_ASYNC or cpu_bound:
+        return fn
+
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    sig = inspect.signature(fn)
+    hints = typing.get_type_hints(fn, include_extras=True)
+    params = []
+    for p in sig.parameters.values():
+        if p.name == "db":
+            p = p.replace(annotation=AsyncSession, default=Depends(get_async_db))
+        else:
+            p = p.replace(annotation=hints.get(p.name, p.annotation))
+        params.append(p)
+
+    async def wrapper(*args, db, **kwargs):
+        return await db.run_sync(lambda session: fn(*args, db=session, **kwargs))
+
+    # без functools.wraps: FastAPI разворачивает __wrapped__ и принял бы обработчик за sync
+    for attr in ("__module__", "__name__", "__qualname__", "__doc__"):
+        setattr(wrapper, attr, getattr(fn, attr))
+    wrapper.__signature__ = sig.replace(parameters=params, return_annotation=hints.get("return", sig.return_annotation))
+    return wrapper
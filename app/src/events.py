@@ -0,0 +1,212 @@
+"""
+События изменений бюджета для SSE-потока GET /api/budgets/{id}/events.
+
+Обработчики записи вызывают emit() до commit, в той же транзакции:
+- EVENTS_TRANSPORT=memory (по умолчанию) — событие откладывается в session.info и после commit
+  раздаётся подписчикам этого процесса (после rollback — выбрасывается);
+- EVENTS_TRANSPORT=postgres — событие уходит через pg_notify в той же транзакции: Postgres доставит
+  его только после commit, и всем воркерам сразу. Каждый воркер держит одно LISTEN-соединение
+  (listen_loop в lifespan) и раздаёт полученное своим подписчикам.
+
+Каждое событие кодируется в SSE-кадр один раз и рассылается всем подписчикам бюджета.
+Последние EVENTS_REPLAY кадров бюджета хранятся, чтобы клиент, переподключившийся с Last-Event-ID,
+получил пропущенное; если их уже нет (или id выдан другим процессом) — событие reset,
+клиент перечитывает данные (с ETag это дёшево).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import count
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.src import fastjson
+
+log = logging.getLogger(__name__)
+
+EVENTS_TRANSPORT = os.getenv("EVENTS_TRANSPORT", "memory").strip().lower()
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "budget_events")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))       # кадров в очереди подписчика
+EVENTS_REPLAY = int(os.getenv("EVENTS_REPLAY", "200"))                # кадров бюджета для Last-Event-ID
+EVENTS_KEEPALIVE_SEC = float(os.getenv("EVENTS_KEEPALIVE_SEC", "15"))
+
+if EVENTS_TRANSPORT not in {"memory", "postgres"}:
+    raise RuntimeError(f"EVENTS_TRANSPORT must be memory or postgres, got {EVENTS_TRANSPORT!r}")
+
+# NOTIFY принимает не больше 8000 байт; крупные события уходят без data
+_NOTIFY_MAX_BYTES = 7900
+
+
+# ---------- Брокер ----------
+@dataclass(eq=False)
+class Subscription:
+    budget_id: int
+    loop: asyncio.AbstractEventLoop
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(EVENTS_QUEUE_SIZE))
+    overflowed: bool = False
+
+    def _put(self, frame: bytes) -> None:
+        # вызывается в потоке event loop'а подписчика
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # клиент не успевает читать: очередь сбрасывается, поток закроется событием reset
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            log.warning("events: subscriber of budget %s overflowed, dropping", self.budget_id)
+
+
+class Broker:
+    """Подписчики по бюджетам; publish() можно вызывать из любого потока."""
+
+    def __init__(self, replay: int = EVENTS_REPLAY):
+        self.boot = secrets.token_hex(4)  # префикс id событий этого процесса
+        self._seq = count(1)
+        self._subs: dict[int, set[Subscription]] = {}
+        self._replay: dict[int, deque] = {}
+        self._replay_size = replay
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, budget_id: int, last_event_id: str | None = None) -> tuple[Subscription, list[bytes] | None]:
+        """
+        Подписка и пропущенные кадры после last_event_id
+        (None — восстановить нельзя, клиенту нужен reset; [] — ничего не пропущено).
+        """
+        sub = Subscription(budget_id=budget_id, loop=asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(budget_id, set()).add(sub)
+            missed: list[bytes] | None = []
+            if last_event_id:
+                missed = self._missed(budget_id, last_event_id)
+        return sub, missed
+
+    def _missed(self, budget_id: int, last_event_id: str) -> list[bytes] | None:
+        boot, _, seq = last_event_id.partition(".")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        buf = self._replay.get(budget_id) or deque()
+        seq = int(seq)
+        if buf and buf[0][0] > seq + 1:
+            return None  # часть событий уже вытеснена из буфера
+        return [frame for s, frame in buf if s > seq]
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.budget_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.budget_id]
+
+    def publish(self, budget_id: int, kind: str, data: dict) -> None:
+        with self._lock:
+            seq = next(self._seq)
+            frame = _frame(f"{self.boot}.{seq}", kind, {"type": kind, "budget_id": budget_id, **data})
+            buf = self._replay.setdefault(budget_id, deque(maxlen=self._replay_size))
+            buf.append((seq, frame))
+            subs = list(self._subs.get(budget_id, ()))
+            self.published += 1
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, frame)
+            except RuntimeError:  # loop подписчика уже закрыт
+                self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "transport": EVENTS_TRANSPORT,
+                "budgets": len(self._subs),
+                "subscribers": sum(len(s) for s in self._subs.values()),
+                "published": self.published,
+            }
+
+
+def _frame(event_id: str | None, kind: str, payload: dict) -> bytes:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {kind}\ndata: ".encode() + fastjson.dumps(payload) + b"\n\n"
+
+
+def keepalive_frame() -> bytes:
+    return b": keepalive\n\n"
+
+
+def reset_frame() -> bytes:
+    return _frame(None, "reset", {"type": "reset"})
+
+
+broker = Broker()
+
+
+# ---------- Запись ----------
+_PENDING_KEY = "events_pending"
+
+
+def emit(db: Session, budget_id: int, kind: str, data: dict) -> None:
+    """
+    Событие kind ("operation.created", "step.created", ...) для бюджета; data — JSON-совместимый dict.
+    Вызывать до commit: подписчики увидят событие только если транзакция зафиксирована.
+    """
+    if EVENTS_TRANSPORT == "postgres":
+        payload = fastjson.dumps({"budget_id": budget_id, "kind": kind, "data": data})
+        if len(payload) > _NOTIFY_MAX_BYTES:
+            slim = {k: data[k] for k in ("id", "step_id", "count") if k in data}
+            payload = fastjson.dumps({"budget_id": budget_id, "kind": kind, "data": {**slim, "truncated": True}})
+        db.execute(sa.select(sa.func.pg_notify(EVENTS_CHANNEL, payload.decode())))
+    else:
+        db.info.setdefault(_PENDING_KEY, []).append((budget_id, kind, data))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    for budget_id, kind, data in session.info.pop(_PENDING_KEY, ()):
+        broker.publish(budget_id, kind, data)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ---------- LISTEN ----------
+def _listen_dsn(database_url: str) -> str:
+    # psycopg принимает libpq-URL без "+драйвера" SQLAlchemy
+    return sa.engine.make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def listen_loop(database_url: str) -> None:
+    """Фоновая задача (EVENTS_TRANSPORT=postgres): LISTEN и раздача уведомлений; переподключается при сбоях."""
+    import psycopg
+
+    delay = 1.0
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(_listen_dsn(database_url), autocommit=True) as conn:
+                await conn.execute(f'LISTEN "{EVENTS_CHANNEL}"')
+                delay = 1.0
+                async for note in conn.notifies():
+                    try:
+                        msg = json.loads(note.payload)
+                        broker.publish(int(msg["budget_id"]), msg["kind"], msg["data"])
+                    except (ValueError, KeyError, TypeError):
+                        log.warning("events: bad notification payload: %.200s", note.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("events: LISTEN connection failed, reconnecting in %.0fs", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
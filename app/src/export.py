@@ -0,0 +1,184 @@
+"""
+Выгрузка операций бюджета (GET /api/budgets/{id}/export) потоком в CSV или Parquet.
+
+Строки — операции бюджета с датой в [from, to], с именами шага, счетов и категории, по (date, id).
+Память процесса не зависит от объёма истории:
+- CSV в Postgres — COPY (SELECT ...) TO STDOUT: CSV формирует сервер, приложение пересылает куски;
+  в остальных БД — серверный курсор пачками по EXPORT_CHUNK_ROWS и csv.writer;
+- Parquet — серверный курсор пачками по EXPORT_CHUNK_ROWS, каждая пачка пишется отдельной row group,
+  и готовые байты сразу уходят клиенту (нужен пакет pyarrow).
+CSV сжимается gzip на лету, если клиент принимает его (Accept-Encoding); Parquet сжат внутри.
+Поток держит своё соединение с БД на всё время выгрузки.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import os
+import zlib
+from contextlib import closing
+from datetime import date, datetime, time, timedelta, timezone
+from typing import AsyncIterator, Iterator
+
+import sqlalchemy as sa
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import aliased
+
+from app.db import models
+from app.db.base import SessionLocal, engine
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+EXPORT_PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+
+COLUMNS = ("id", "date", "step", "kind", "sign", "amount", "currency", "account", "account_to", "category", "comment")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # необязательная зависимость: без неё доступен только CSV
+    pa = pq = None
+
+PARQUET_AVAILABLE = pa is not None
+
+
+def operations_query(budget_id: int, date_from: date | None, date_to: date | None):
+    op, s, c = models.Operation, models.BudgetStep, models.Category
+    acc, acc_to = aliased(models.Account), aliased(models.Account)
+    q = (
+        sa.select(
+            op.id, op.date, s.name.label("step"), op.kind, op.sign, op.amount, op.currency,
+            acc.name.label("account"), acc_to.name.label("account_to"), c.name.label("category"), op.comment,
+        )
+        .join(s, s.id == op.step_id)
+        .join(acc, acc.id == op.account_id)
+        .outerjoin(acc_to, acc_to.id == op.account_id_to)
+        .outerjoin(c, c.id == op.category_id)
+        .where(op.budget_id == budget_id)
+    )
+    if date_from is not None:
+        q = q.where(op.date >= datetime.combine(date_from, time.min, tzinfo=timezone.utc))
+    if date_to is not None:
+        q = q.where(op.date < datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=timezone.utc))
+    return q.order_by(op.date, op.id)
+
+
+# ---------- CSV ----------
+def _copy_csv(q) -> Iterator[bytes]:
+    # параметры — только id бюджета и границы дат, поэтому запрос можно отрендерить с литералами
+    sql = q.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    raw = engine.raw_connection()
+    try:
+        with raw.driver_connection.cursor() as cur:
+            cur.execute("SET LOCAL TIME ZONE 'UTC'")
+            with cur.copy(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)") as copy:
+                for data in copy:
+                    yield bytes(data)
+    finally:
+        raw.close()  # соединение возвращается в пул с откатом транзакции
+
+
+def _cursor_csv(q) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(COLUMNS)
+    db = SessionLocal()
+    try:
+        for part in db.execute(q.execution_options(yield_per=EXPORT_CHUNK_ROWS)).partitions():
+            writer.writerows(part)
+            yield buf.getvalue().encode()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():  # пустая выгрузка — только заголовок
+            yield buf.getvalue().encode()
+    finally:
+        db.close()
+
+
+def stream_csv(q) -> Iterator[bytes]:
+    return _copy_csv(q) if engine.dialect.name == "postgresql" else _cursor_csv(q)
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() in {"gzip", "*"}:
+            try:
+                q = float(params.strip().removeprefix("q=")) if params.strip() else 1.0
+            except ValueError:
+                q = 1.0
+            return q > 0  # q=0 — клиент явно отказывается
+    return False
+
+
+def gzip_stream(chunks: Iterator[bytes], level: int = EXPORT_GZIP_LEVEL) -> Iterator[bytes]:
+    z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # заголовок gzip
+    with closing(chunks):
+        for chunk in chunks:
+            if out := z.compress(chunk):
+                yield out
+    yield z.flush()
+
+
+async def iterate_closing(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Тело StreamingResponse: генератор читается в threadpool и закрывается при обрыве клиента.
+    Starlette сам его не закрывает — COPY и соединение с БД висели бы до сборки мусора.
+    """
+    try:
+        async for chunk in iterate_in_threadpool(chunks):
+            yield chunk
+    finally:
+        await run_in_threadpool(chunks.close)
+
+
+# ---------- Parquet ----------
+class _Sink(io.RawIOBase):
+    """Файл для ParquetWriter: копит записанные байты до следующего take()."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def _parquet_schema():
+    return pa.schema([
+        ("id", pa.int64()), ("date", pa.timestamp("us", tz="UTC")), ("step", pa.string()),
+        ("kind", pa.string()), ("sign", pa.string()), ("amount", pa.decimal128(18, 2)), ("currency", pa.string()),
+        ("account", pa.string()), ("account_to", pa.string()), ("category", pa.string()), ("comment", pa.string()),
+    ])
+
+
+def stream_parquet(q) -> Iterator[bytes]:
+    schema = _parquet_schema()
+    sink = _Sink()
+    db = SessionLocal()
+    try:
+        with pq.ParquetWriter(sink, schema, compression=EXPORT_PARQUET_COMPRESSION) as writer:
+            for part in db.execute(q.execution_options(yield_per=EXPORT_CHUNK_ROWS)).partitions():
+                columns = list(zip(*part))
+                writer.write_batch(pa.record_batch(
+                    [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema,
+                ))
+                if data := sink.take():
+                    yield data
+        yield sink.take()
+    finally:
+        db.close()
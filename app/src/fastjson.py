@@ -0,0 +1,54 @@
+"""
+Быстрая сериализация списков для горячих GET-эндпоинтов.
+
+Вместо ORM-объектов, которые FastAPI по одному прогоняет через from_attributes-модели,
+выбираются только колонки схемы ответа, строки превращаются в dict и кодируются сразу в JSON
+(orjson, если установлен; иначе стандартный json). Эндпоинт оставляет response_model —
+схема OpenAPI не меняется, а возвращённый Response FastAPI отдаёт как есть.
+
+Формат совпадает с Pydantic для полей этих схем: Decimal — строкой, date — ISO 8601.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательная зависимость
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def columns(model, schema: type[BaseModel]) -> list:
+    """Колонки модели, соответствующие полям схемы ответа (имена полей = имена атрибутов)."""
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+def records(rows: Iterable, schema: type[BaseModel]) -> list[dict]:
+    """Строки select(*columns(model, schema), ...) -> dict по полям схемы (лишние колонки в конце отбрасываются)."""
+    keys = tuple(schema.model_fields)
+    return [dict(zip(keys, row)) for row in rows]
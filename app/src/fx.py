@@ -0,0 +1,170 @@
+"""
+Курсы валют и пересчёт сумм в валюту бюджета.
+
+Курс хранится в fx_rate: 1 base = rate quote с даты date до следующей даты этой пары.
+Курс frm -> to на дату on ищется по порядку:
+- прямой: последняя запись (frm, to) с date <= on;
+- обратный: 1 / (to, frm);
+- кросс через FX_PIVOT: (P, to) / (P, frm) — хватает таблицы вида «EUR ко всем валютам» (как у ЕЦБ).
+Каждый вариант — один проход назад по PK (base, quote, date).
+
+Суммы шага пересчитываются по курсу на конец шага (date_end): и сводка шага (rate() по готовым
+агрегатам step_totals), и отчёты (convert_sql() внутри агрегирующего запроса) — итоги шага
+в сводке и в отчёте совпадают. Для текущего шага это последний загруженный курс: он меняется только
+вместе с загрузкой курсов, а она увеличивает версии затронутых шагов (ETag сводки).
+
+rate() — курс одной пары на дату с in-process кешем на FX_CACHE_TTL (запоминается и отсутствие
+курса). В ключе кеша — версия курсов version(): id последней записи fx_load. Курсы загружаются
+офлайн: python -m app.src.admin load-fx FILE — загрузка добавляет запись в fx_load, и API-процессы
+сразу перестают находить старые значения. Суммы без курса не пересчитываются и в итоги не входят.
+"""
+from __future__ import annotations
+
+import csv
+import os
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterable, Iterator
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.src.cache import TTLCache
+
+FX_PIVOT = os.getenv("FX_PIVOT", "EUR").upper()
+FX_CACHE_TTL = float(os.getenv("FX_CACHE_TTL", "300"))
+FX_CACHE_SIZE = int(os.getenv("FX_CACHE_SIZE", "10000"))
+FX_LOAD_BATCH = 5000
+
+CENT = Decimal("0.01")
+_ONE = sa.literal(Decimal(1), sa.Numeric(20, 10))
+_MISSING = object()
+
+_cache = TTLCache(FX_CACHE_SIZE, FX_CACHE_TTL)
+
+
+# ---------- Курс в SQL ----------
+def _latest(base, quote, on):
+    """(SELECT rate FROM fx_rate WHERE base = .. AND quote = .. AND date <= on ORDER BY date DESC LIMIT 1)"""
+    r = models.FxRate
+    return (
+        sa.select(r.rate)
+        .where(r.base == base, r.quote == quote, r.date <= on)
+        .order_by(r.date.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def rate_sql(frm, to, on):
+    """Курс frm -> to на дату on (NULL, если курса нет). Аргументы — колонки или значения."""
+    return sa.func.coalesce(
+        _latest(frm, to, on),
+        _ONE / _latest(to, frm, on),
+        _latest(FX_PIVOT, to, on) / _latest(FX_PIVOT, frm, on),
+    )
+
+
+def convert_sql(amount, currency, to, on):
+    """amount в валюте currency -> в валюту to по курсу на дату on; NULL, если курса нет."""
+    return sa.case((currency == to, amount), else_=amount * rate_sql(currency, to, on))
+
+
+# ---------- Курс в Python ----------
+def version(db: Session) -> int:
+    """Версия курсов — id последней загрузки (0 — курсы не загружались)."""
+    return db.scalar(sa.select(sa.func.max(models.FxLoad.id))) or 0
+
+
+def rate(db: Session, frm: str, to: str, on: date, fx_version: int) -> Decimal | None:
+    """
+    Курс frm -> to на дату on (None — курса нет). fx_version — version(db), прочитанная один раз
+    на запрос; кешируется на FX_CACHE_TTL в пределах версии.
+    """
+    if frm == to:
+        return Decimal(1)
+    key = (frm, to, on, fx_version)
+    value = _cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = db.scalar(sa.select(rate_sql(frm, to, on)))
+        _cache.set(key, value)
+    return value
+
+
+def stats() -> dict:
+    return _cache.stats()
+
+
+# ---------- Загрузка курсов ----------
+def read_rates(f: IO[str]) -> Iterator[dict]:
+    """
+    CSV с заголовком date,base,quote,rate (порядок колонок любой, лишние игнорируются):
+    1 base = rate quote с даты date. Ошибка в строке — ValueError с номером строки.
+    """
+    reader = csv.DictReader(f)
+    missing = {"date", "base", "quote", "rate"} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        try:
+            base, quote = row["base"].strip().upper(), row["quote"].strip().upper()
+            value = Decimal(row["rate"].strip())
+            d = date.fromisoformat(row["date"].strip())
+        except (InvalidOperation, ValueError, AttributeError) as e:
+            raise ValueError(f"line {reader.line_num}: {e}") from None
+        if len(base) != 3 or len(quote) != 3 or base == quote:
+            raise ValueError(f"line {reader.line_num}: bad currency pair {base}/{quote}")
+        if not value > 0:
+            raise ValueError(f"line {reader.line_num}: rate must be positive")
+        yield {"base": base, "quote": quote, "date": d, "rate": value}
+
+
+def _upsert(db: Session, rows: list[dict]) -> None:
+    table = models.FxRate.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(table)
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(table)
+    else:
+        raise RuntimeError(f"fx_rate upsert is not supported for {dialect}")
+    # внутри одной пачки ключ должен встречаться один раз (ON CONFLICT не обновляет строку дважды)
+    rows = list({(r["base"], r["quote"], r["date"]): r for r in rows}.values())
+    db.execute(
+        stmt.on_conflict_do_update(index_elements=["base", "quote", "date"], set_={"rate": stmt.excluded.rate}),
+        rows,
+    )
+
+
+def load(db: Session, rows: Iterable[dict]) -> int:
+    """
+    Записать курсы (существующие на ту же дату заменяются) пачками по FX_LOAD_BATCH и новую версию
+    курсов (запись fx_load). Без commit.
+    """
+    n = 0
+    batch: list[dict] = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= FX_LOAD_BATCH:
+            _upsert(db, batch)
+            n += len(batch)
+            batch.clear()
+    if batch:
+        _upsert(db, batch)
+        n += len(batch)
+    db.add(models.FxLoad(rows=n))
+    db.flush()
+    return n
+
+
+def foreign_currency_steps(db: Session) -> list[int]:
+    """Шаги, в сводке которых есть суммы не в валюте бюджета, — их итоги зависят от курсов."""
+    t, s, b = models.StepTotal, models.BudgetStep, models.Budget
+    return list(db.scalars(
+        sa.select(t.step_id).distinct()
+        .join(s, s.id == t.step_id)
+        .join(b, b.id == s.budget_id)
+        .where(t.currency != b.currency, t.ops_count > 0)
+    ))
@@ -0,0 +1,517 @@
+"""
+Импорт банковских выписок (CSV, OFX) в фактические операции счёта.
+
+POST /api/budgets/{id}/import принимает файл телом запроса: тело пишется потоком во временный файл
+(в памяти до IMPORT_SPOOL_MEMORY, дальше — на диск), создаётся запись import_job, и файл разбирается
+в фоновом пуле IMPORT_WORKERS потоков. Прогресс — GET /api/imports/{job_id}.
+
+Разбор потоковый: CSV читается модулем csv построчно, OFX (SGML 1.x и XML 2.x) — токенизатором
+по кускам файла; в памяти одновременно не больше одной пачки из IMPORT_CHUNK_SIZE строк.
+Строка выписки становится операцией так: знак суммы задаёт income/expense, шаг — step_id из запроса
+или самый узкий шаг бюджета, содержащий дату, категория — по колонке с именем категории,
+иначе по первому правилу «подстрока комментария -> категория».
+
+Дубли: у операции есть import_hash — отпечаток (счёт, дата, сумма, комментарий, номер повтора).
+Номер повтора различает одинаковые строки одного файла (две одинаковые покупки за день), поэтому
+повторная загрузка той же или пересекающейся выписки ничего не удваивает. Уже существующие
+отпечатки отсекает уникальный индекс (budget_id, import_hash): INSERT ... ON CONFLICT DO NOTHING.
+
+Каждая пачка — своя транзакция (операции, step_totals, версии шагов, прогресс задачи), так что
+прерванный импорт можно просто повторить. Задачи выполняются в процессе, принявшем файл. При остановке
+приложения (shutdown) задачи прерываются на границе пачки и получают статус failed; задачи процесса,
+который упал, помечает failed fail_orphaned() при следующем старте: в Postgres выполняющаяся задача
+держит advisory-блокировку на соединении своего потока, а ждущая в очереди — на общем соединении
+процесса (с создания задачи до её запуска), поэтому задачи живых воркеров не трогаются.
+"""
+from __future__ import annotations
+
+import codecs
+import csv
+import hashlib
+import html
+import io
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterator, NamedTuple
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.base import SessionLocal, engine
+from app.src import totals, versions, events, response_cache
+
+log = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))                   # строк в пачке INSERT
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))      # предел размера файла
+IMPORT_SPOOL_MEMORY = int(os.getenv("IMPORT_SPOOL_MEMORY", str(1024 * 1024)))     # дальше файл — на диске
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))                    # ошибок строк в задаче
+
+# ключ pg_advisory_lock (вместе с id задачи): задача выполняется живым процессом
+_ADVISORY_LOCK_KEY = 0x696D7074  # "impt"
+# ключ блокировки задачи, ждущей в очереди пула: держит соединение _queue_conn процесса
+_QUEUED_LOCK_KEY = 0x696D7071  # "impq"
+_INTERRUPTED = "import interrupted by server restart; upload the file again to finish it"
+
+FORMATS = ("csv", "ofx")
+_READ_SIZE = 64 * 1024
+_CENT = Decimal("0.01")
+
+
+@dataclass
+class Options:
+    format: str = "csv"
+    step_id: int | None = None
+    encoding: str = "utf-8-sig"
+    # CSV: разделитель, имена колонок заголовка, формат даты, десятичная запятая (1.234,56)
+    delimiter: str = ","
+    date_column: str = "date"
+    amount_column: str = "amount"
+    comment_column: str | None = "comment"
+    category_column: str | None = None
+    date_format: str = "%Y-%m-%d"
+    decimal_comma: bool = False
+    # (подстрока в нижнем регистре, category_id): первое совпадение с комментарием
+    rules: list[tuple[str, int]] = field(default_factory=list)
+
+
+class StatementRow(NamedTuple):
+    row: int                  # CSV — номер строки файла, OFX — номер транзакции
+    date: date
+    amount: Decimal           # со знаком: < 0 — списание
+    comment: str | None = None
+    category: str | None = None
+
+
+class RowError(NamedTuple):
+    row: int
+    error: str
+
+
+# ---------- Разбор ----------
+def parse_amount(raw: str, decimal_comma: bool = False) -> Decimal:
+    s = raw.strip().replace(" ", "").replace("\u00a0", "").replace("\u202f", "")
+    s = s.replace(".", "").replace(",", ".") if decimal_comma else s.replace(",", "")
+    if s.startswith("(") and s.endswith(")"):  # бухгалтерская запись отрицательной суммы
+        s = "-" + s[1:-1]
+    value = Decimal(s)
+    if not value.is_finite():
+        raise InvalidOperation(s)
+    return value
+
+
+def _cell(rec: dict, column: str | None) -> str | None:
+    if column is None:
+        return None
+    return (rec[column] or "").strip() or None
+
+
+def parse_csv(f: IO[bytes], opts: Options) -> Iterator[StatementRow | RowError]:
+    text = io.TextIOWrapper(f, encoding=opts.encoding, errors="replace", newline="")
+    reader = csv.DictReader(text, delimiter=opts.delimiter)
+    header = set(reader.fieldnames or ())
+    missing = {opts.date_column, opts.amount_column} - header
+    if missing:
+        raise ValueError(f"csv header has no columns: {', '.join(sorted(missing))}")
+    comment_col = opts.comment_column if opts.comment_column in header else None
+    category_col = opts.category_column if opts.category_column in header else None
+
+    for rec in reader:
+        line = reader.line_num
+        raw_date, raw_amount = rec[opts.date_column] or "", rec[opts.amount_column] or ""
+        try:
+            d = datetime.strptime(raw_date.strip(), opts.date_format).date()
+        except ValueError:
+            yield RowError(line, f"bad date: {raw_date!r}")
+            continue
+        try:
+            amount = parse_amount(raw_amount, opts.decimal_comma)
+        except InvalidOperation:
+            yield RowError(line, f"bad amount: {raw_amount!r}")
+            continue
+        yield StatementRow(row=line, date=d, amount=amount,
+                           comment=_cell(rec, comment_col), category=_cell(rec, category_col))
+
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def _ofx_tokens(f: IO[bytes], encoding: str) -> Iterator[tuple[bool, str, str]]:
+    """(закрывающий?, ТЕГ, текст после тега) по мере чтения файла; незаконченный тег ждёт следующего куска."""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    buf = ""
+    while chunk := f.read(_READ_SIZE):
+        buf += decoder.decode(chunk)
+        cut = buf.rfind("<")
+        if cut > 0:
+            for m in _OFX_TAG.finditer(buf, 0, cut):
+                yield m.group(1) == "/", m.group(2).upper(), m.group(3)
+            buf = buf[cut:]
+    buf += decoder.decode(b"", final=True)
+    for m in _OFX_TAG.finditer(buf):
+        yield m.group(1) == "/", m.group(2).upper(), m.group(3)
+
+
+def parse_ofx(f: IO[bytes], opts: Options) -> Iterator[StatementRow | RowError]:
+    # в SGML-варианте (OFX 1.x) у полей нет закрывающих тегов — значение идёт до следующего '<'
+    trn: dict[str, str] | None = None
+    n = 0
+    for closing, tag, text in _ofx_tokens(f, opts.encoding):
+        if tag == "STMTTRN":
+            if not closing:
+                trn = {}
+                continue
+            if trn is None:
+                continue
+            n += 1
+            rec, trn = trn, None
+            raw_date, raw_amount = rec.get("DTPOSTED", ""), rec.get("TRNAMT", "")
+            try:
+                d = datetime.strptime(raw_date[:8], "%Y%m%d").date()
+            except ValueError:
+                yield RowError(n, f"bad DTPOSTED: {raw_date!r}")
+                continue
+            try:
+                amount = parse_amount(raw_amount.replace(",", "."))
+            except InvalidOperation:
+                yield RowError(n, f"bad TRNAMT: {raw_amount!r}")
+                continue
+            parts = [p for p in (rec.get("NAME"), rec.get("MEMO")) if p]
+            if len(parts) == 2 and parts[0] == parts[1]:
+                parts.pop()
+            yield StatementRow(row=n, date=d, amount=amount, comment=" ".join(parts) or None)
+        elif trn is not None and not closing:
+            value = html.unescape(text).strip()
+            if value:
+                trn[tag] = value
+
+
+def parse(f: IO[bytes], opts: Options) -> Iterator[StatementRow | RowError]:
+    return parse_ofx(f, opts) if opts.format == "ofx" else parse_csv(f, opts)
+
+
+# ---------- Сопоставление ----------
+def import_hash(account_id: int, d: date, amount: Decimal, comment: str | None, occurrence: int) -> str:
+    key = f"{account_id}|{d.isoformat()}|{amount.quantize(_CENT)}|{comment or ''}|{occurrence}"
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+class _Steps:
+    """Шаг бюджета по дате: из содержащих дату — самый короткий (месяц внутри года), при равенстве — новее."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda r: (r.date_end - r.date_start, -r.id))
+        self.by_date: dict[date, int | None] = {}
+
+    def find(self, d: date) -> int | None:
+        if d not in self.by_date:
+            self.by_date[d] = next((r.id for r in self.rows if r.date_start <= d <= r.date_end), None)
+        return self.by_date[d]
+
+
+@dataclass
+class _Progress:
+    bytes_read: int = 0
+    rows_read: int = 0
+    created: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def fail(self, row: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": error})
+
+    def values(self) -> dict:
+        return dict(
+            bytes_read=self.bytes_read, rows_read=self.rows_read, created=self.created,
+            duplicates=self.duplicates, failed=self.failed, errors=list(self.errors),
+        )
+
+
+def check_target(db: Session, budget_id: int, account_id: int, step_id: int | None, category_ids) -> str | None:
+    """Счёт, шаг и категории правил должны принадлежать бюджету. Текст ошибки или None."""
+    account = db.get(models.Account, account_id)
+    if not account or account.budget_id != budget_id:
+        return "account_id not found in this budget"
+    if step_id is not None:
+        step = db.get(models.BudgetStep, step_id)
+        if not step or step.budget_id != budget_id:
+            return "step_id not found in this budget"
+    if category_ids:
+        c = models.Category
+        found = set(db.execute(sa.select(c.id).where(c.id.in_(category_ids), c.budget_id == budget_id)).scalars())
+        if missing := set(category_ids) - found:
+            return f"category not found in this budget: {min(missing)}"
+    return None
+
+
+# Postgres: пачка передаётся массивами по колонкам (12 параметров вместо 12 на строку) — текст запроса
+# не зависит от размера пачки, и драйверу не нужно заново разбирать огромный VALUES на каждой пачке
+_PG_COLUMNS = {
+    "budget_id": "int", "step_id": "int", "kind": "kind_enum", "sign": "sign_enum", "amount": "numeric",
+    "currency": "text", "date": "timestamptz", "account_id": "int", "category_id": "int", "comment": "text",
+    "import_hash": "text", "created_at": "timestamptz",
+}
+_PG_INSERT = sa.text(
+    f"INSERT INTO operation ({', '.join(_PG_COLUMNS)}) "
+    f"SELECT * FROM unnest({', '.join(f'CAST(:{c} AS {t}[])' for c, t in _PG_COLUMNS.items())}) "
+    f"ON CONFLICT (budget_id, import_hash) WHERE import_hash IS NOT NULL DO NOTHING "
+    f"RETURNING import_hash"
+)
+
+
+def _insert(db: Session, rows: list[dict]) -> set[str]:
+    """Вставить строки, пропуская уже импортированные; возвращает import_hash вставленных."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return set(db.execute(_PG_INSERT, {c: [r[c] for r in rows] for c in _PG_COLUMNS}).scalars())
+    if dialect != "sqlite":
+        raise RuntimeError(f"statement import is not supported for {dialect}")
+    op = models.Operation
+    stmt = sqlite.insert(op).on_conflict_do_nothing(
+        index_elements=[op.budget_id, op.import_hash], index_where=op.import_hash.isnot(None),
+    ).returning(op.import_hash)
+    return set(db.execute(stmt, rows).scalars())
+
+
+def _flush(db: Session, job_id: int, budget_id: int, rows: list[dict], progress: _Progress) -> None:
+    """Пачка строк + прогресс задачи одной транзакцией."""
+    by_step: Counter = Counter()
+    if rows:
+        inserted = _insert(db, rows)
+        new_rows = [r for r in rows if r["import_hash"] in inserted]
+        progress.created += len(new_rows)
+        progress.duplicates += len(rows) - len(new_rows)
+        by_step.update(r["step_id"] for r in new_rows)
+        totals.add_totals(db, new_rows)
+        versions.bump_steps(db, by_step)
+        for step_id, n in sorted(by_step.items()):
+            events.emit(db, budget_id, "operations.created", {"step_id": step_id, "count": n})
+    db.execute(sa.update(models.ImportJob).where(models.ImportJob.id == job_id).values(**progress.values()))
+    db.commit()
+    response_cache.invalidate(*(("step", s) for s in by_step))
+
+
+def run(db: Session, job: models.ImportJob, f: IO[bytes], opts: Options) -> _Progress:
+    """Разобрать файл и записать операции пачками. Исключение — ошибка файла целиком (задача failed)."""
+    # атрибуты задачи — один раз: commit каждой пачки сбрасывает загруженные объекты сессии
+    job_id, budget_id, bytes_total = job.id, job.budget_id, job.bytes_total
+    account_id, currency = db.execute(
+        sa.select(models.Account.id, models.Account.currency).where(models.Account.id == job.account_id)
+    ).one()
+    s, c = models.BudgetStep, models.Category
+    steps = _Steps(db.execute(sa.select(s.id, s.date_start, s.date_end).where(s.budget_id == budget_id)).all())
+    categories = {
+        name.lower(): cat_id
+        for cat_id, name in db.execute(sa.select(c.id, c.name).where(c.budget_id == budget_id))
+    }
+    now = datetime.now(timezone.utc)
+    seen: Counter = Counter()  # повторы одинаковых строк файла -> номер повтора в отпечатке
+    progress = _Progress()
+    batch: list[dict] = []
+
+    for item in parse(f, opts):
+        if _stopping.is_set():
+            raise JobInterrupted(_INTERRUPTED)
+        progress.rows_read += 1
+        if isinstance(item, RowError):
+            progress.fail(item.row, item.error)
+            continue
+        if item.amount == 0:
+            progress.fail(item.row, "zero amount")
+            continue
+        step_id = opts.step_id or steps.find(item.date)
+        if step_id is None:
+            progress.fail(item.row, f"no budget step covers {item.date.isoformat()}")
+            continue
+        category_id = categories.get(item.category.lower()) if item.category else None
+        if category_id is None and item.comment:
+            text = item.comment.lower()
+            category_id = next((cat for needle, cat in opts.rules if needle in text), None)
+
+        key = (item.date, item.amount.quantize(_CENT), item.comment)
+        occurrence = seen[key]
+        seen[key] += 1
+        batch.append(dict(
+            budget_id=budget_id,
+            step_id=step_id,
+            kind="actual",
+            sign="expense" if item.amount < 0 else "income",
+            amount=abs(item.amount).quantize(_CENT),
+            currency=currency,
+            date=datetime(item.date.year, item.date.month, item.date.day, tzinfo=timezone.utc),
+            account_id=account_id,
+            category_id=category_id,
+            comment=item.comment,
+            import_hash=import_hash(account_id, item.date, item.amount, item.comment, occurrence),
+            created_at=now,
+        ))
+        if len(batch) >= IMPORT_CHUNK_SIZE:
+            progress.bytes_read = f.tell()
+            _flush(db, job_id, budget_id, batch, progress)
+            batch = []
+
+    progress.bytes_read = bytes_total
+    _flush(db, job_id, budget_id, batch, progress)
+    return progress
+
+
+# ---------- Задачи ----------
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import")
+_stopping = threading.Event()
+
+
+class JobInterrupted(Exception):
+    """Приложение останавливается: задача прерывается на границе пачки."""
+
+
+_queue_mutex = threading.Lock()
+_queue_conn: sa.Connection | None = None
+
+
+def _hold_queued(job_id: int, hold: bool) -> None:
+    """Взять (hold=True) или отпустить блокировку ждущей задачи на общем соединении процесса (Postgres)."""
+    global _queue_conn
+    if engine.dialect.name != "postgresql":
+        return
+    lock = sa.func.pg_advisory_lock if hold else sa.func.pg_advisory_unlock
+    with _queue_mutex:
+        try:
+            if _queue_conn is None:
+                _queue_conn = engine.connect()
+            _queue_conn.execute(sa.select(lock(_QUEUED_LOCK_KEY, job_id)))
+            _queue_conn.commit()
+        except Exception:
+            # блокировки ушли вместе с соединением: до запуска ждущие задачи не защищены от fail_orphaned
+            log.exception("import job %s: queue lock connection failed", job_id)
+            if _queue_conn is not None:
+                _queue_conn.invalidate()
+                _queue_conn.close()
+            _queue_conn = None
+
+
+def _set_status(db: Session, job_id: int, **values) -> None:
+    db.execute(sa.update(models.ImportJob).where(models.ImportJob.id == job_id).values(**values))
+    db.commit()
+
+
+def _run_job(job_id: int, f: IO[bytes], opts: Options) -> None:
+    # сессия на одном соединении: session-level advisory-блокировка переживает commit каждой пачки
+    conn = engine.connect()
+    db = SessionLocal(bind=conn)
+    locked = conn.dialect.name == "postgresql"
+    queued = True
+    try:
+        if locked:
+            db.execute(sa.select(sa.func.pg_advisory_lock(_ADVISORY_LOCK_KEY, job_id)))
+        _set_status(db, job_id, status="running", started_at=datetime.now(timezone.utc))
+        # задачу уже защищает блокировка выполнения: место в очереди больше не держим
+        _hold_queued(job_id, False)
+        queued = False
+        job = db.get(models.ImportJob, job_id)
+        try:
+            progress = run(db, job, f, opts)
+        except Exception as e:
+            db.rollback()
+            if isinstance(e, (ValueError, UnicodeError, JobInterrupted)):  # файл не того формата — не ошибка сервера
+                log.warning("import job %s failed: %s", job_id, e)
+            else:
+                log.exception("import job %s failed", job_id)
+            errors = list(db.get(models.ImportJob, job_id).errors or [])
+            errors.append({"row": 0, "error": str(e) or type(e).__name__})
+            _set_status(db, job_id, status="failed", errors=errors, finished_at=datetime.now(timezone.utc))
+            return
+        _set_status(db, job_id, status="done", finished_at=datetime.now(timezone.utc))
+        log.info("import job %s: %d created, %d duplicates, %d failed",
+                 job_id, progress.created, progress.duplicates, progress.failed)
+    except Exception:
+        log.exception("import job %s: cannot update job status", job_id)
+    finally:
+        if queued:
+            _hold_queued(job_id, False)
+        db.close()
+        if locked:
+            try:
+                conn.execute(sa.select(sa.func.pg_advisory_unlock(_ADVISORY_LOCK_KEY, job_id)))
+                conn.commit()
+            except Exception:  # соединение потеряно — блокировка снята вместе с ним
+                conn.invalidate()
+        conn.close()
+        f.close()
+
+
+def create_job(db: Session, budget_id: int, account_id: int, fmt: str, size: int) -> models.ImportJob:
+    """Создать задачу queued; её блокировка очереди держится до запуска в пуле (см. submit)."""
+    job = models.ImportJob(budget_id=budget_id, account_id=account_id, format=fmt, bytes_total=size, errors=[])
+    db.add(job)
+    db.flush()
+    # до commit: задачу не видно другим процессам, пока она не защищена от fail_orphaned
+    _hold_queued(job.id, True)
+    try:
+        db.commit()
+    except BaseException:
+        _hold_queued(job.id, False)
+        raise
+    db.refresh(job)
+    return job
+
+
+def submit(job_id: int, f: IO[bytes], opts: Options) -> None:
+    """Поставить разбор файла f (позиция — начало) в фоновый пул; файл закрывается по завершении."""
+    try:
+        _executor.submit(_run_job, job_id, f, opts)
+    except RuntimeError:  # пул уже остановлен (shutdown)
+        _hold_queued(job_id, False)
+        f.close()
+        raise
+
+
+def fail_orphaned(db: Session) -> int:
+    """
+    Пометить failed задачи queued и running, которые никто не выполняет (процесс упал или перезапущен).
+    Вызывается при старте приложения; возвращает число задач.
+    """
+    j = models.ImportJob
+    stmt = sa.select(j.id, j.errors).where(j.status.in_(("queued", "running")))
+    if db.get_bind().dialect.name == "postgresql":
+        # блокировку держит процесс, у которого задача в очереди или выполняется;
+        # xact-блокировка свободной задачи снимется с commit
+        job_id = sa.cast(j.id, sa.Integer)
+        stmt = stmt.where(sa.case(
+            (j.status == "queued", sa.func.pg_try_advisory_xact_lock(_QUEUED_LOCK_KEY, job_id)),
+            else_=sa.func.pg_try_advisory_xact_lock(_ADVISORY_LOCK_KEY, job_id),
+        ))
+    orphans = db.execute(stmt).all()
+    for job_id, errors in orphans:
+        db.execute(sa.update(j).where(j.id == job_id).values(
+            status="failed",
+            errors=[*(errors or []), {"row": 0, "error": _INTERRUPTED}],
+            finished_at=datetime.now(timezone.utc),
+        ))
+    db.commit()
+    if orphans:
+        log.warning("marked %d orphaned import jobs as failed", len(orphans))
+    return len(orphans)
+
+
+def shutdown() -> None:
+    """Остановить пул: выполняющиеся и ждущие задачи завершаются как failed на границе пачки."""
+    global _queue_conn
+    _stopping.set()
+    _executor.shutdown(wait=True)
+    with _queue_mutex:
+        if _queue_conn is not None:
+            _queue_conn.close()
+            _queue_conn = None
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, APIRouter
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, APIRouter, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import os
 
 # Подроутеры
@@ -13,9 +17,35 @@ from app.src.api import (
     categories,
     steps,
     operations,
+    imports,
+    internal,
 )
+from app.src import metrics, balances, events
+from app.src import imports as import_jobs
+from app.db.base import SessionLocal, DATABASE_URL
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Импорты, ждавшие или выполнявшиеся в упавшем или перезапущенном процессе, уже не завершатся
+    with SessionLocal() as db:
+        await asyncio.to_thread(import_jobs.fail_orphaned, db)
+    # Фоновые снимки балансов счетов (по умолчанию выключены — команда admin snapshot-balances из cron)
+    tasks = []
+    if balances.BALANCE_SNAPSHOT_INTERVAL_SEC > 0:
+        tasks.append(asyncio.create_task(balances.snapshot_loop(SessionLocal, balances.BALANCE_SNAPSHOT_INTERVAL_SEC)))
+    # События бюджетов между воркерами через LISTEN/NOTIFY (по умолчанию — только в процессе)
+    if events.EVENTS_TRANSPORT == "postgres":
+        tasks.append(asyncio.create_task(events.listen_loop(DATABASE_URL)))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.to_thread(import_jobs.shutdown)
 
-app = FastAPI(title="Budget App API", version="0.1.0")
+
+app = FastAPI(title="Budget App API", version="0.1.0", lifespan=lifespan)
 
 # CORS — чтобы фронт мог ходить в API
 def _parse_origins(val: str | None) -> list[str]:
@@ -35,10 +65,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Время обработки, число SQL-запросов и время в БД по маршрутам (Server-Timing, /metrics)
+metrics.instrument_sql()
+app.add_middleware(metrics.MetricsMiddleware)
+
 @app.get("/health")
 def health_root():
     return {"status": "ok"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False,
+         dependencies=[Depends(internal.internal_access)])
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 # Единый префикс для всего API
 api = APIRouter(prefix="/api")
 
@@ -50,6 +89,8 @@ api.include_router(accounts.router,   prefix="/accounts",   tags=["accounts"])
 api.include_router(categories.router, prefix="/categories", tags=["categories"])  # /api/categories/...
 api.include_router(steps.router,      prefix="/steps",      tags=["steps"])       # /api/steps/...
 api.include_router(operations.router, prefix="/operations", tags=["operations"])  # /api/operations/...
+api.include_router(imports.router,    prefix="/imports",    tags=["imports"])     # /api/imports/...
+api.include_router(internal.router,   prefix="/internal",   tags=["internal"])    # /api/internal/...
 
 # Подключаем агрегатор к приложению
 app.include_router(api)
\ No newline at end of file
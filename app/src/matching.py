@@ -0,0 +1,179 @@
+"""
+Сопоставление фактических операций шага с плановыми (POST /api/steps/{id}/match).
+
+Операции шага читаются одним запросом: планы, на которые ещё не ссылается ни один факт,
+и факты без planned_ref_id. Пара подходит, если совпадают знак, валюта и счета (для перевода —
+оба), категории совместимы (равны, либо у одной из операций категории нет), сумма плана
+отличается от суммы факта не больше чем на долю amount_tolerance, а даты — не больше чем
+на date_window_days дней.
+
+Планы раскладываются по корзинам (знак, валюта, счета) -> категория -> список по сумме,
+поэтому для факта перебираются только планы его корзины: от ближайшей суммы (bisect) в обе стороны,
+пока не наберётся MATCH_MAX_CANDIDATES подходящих по дате, — а не все пары.
+Из найденных пар жадно выбираются лучшие: сначала с той же категорией, затем с меньшей разницей
+сумм и дат; каждый план и каждый факт входят не больше чем в одну пару.
+
+Ссылки записываются одним UPDATE ... FROM (VALUES ...) на пачку из MATCH_UPDATE_CHUNK пар
+(в остальных БД — executemany); факт, который успели связать параллельно, не перезаписывается.
+"""
+from __future__ import annotations
+
+import os
+from bisect import bisect_left
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Sequence
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, aliased
+
+from app.db import models
+from app.src import partitions
+
+MATCH_AMOUNT_TOLERANCE = Decimal(os.getenv("MATCH_AMOUNT_TOLERANCE", "0.1"))
+MATCH_DATE_WINDOW_DAYS = int(os.getenv("MATCH_DATE_WINDOW_DAYS", "10"))
+MATCH_MAX_CANDIDATES = int(os.getenv("MATCH_MAX_CANDIDATES", "16"))
+MATCH_UPDATE_CHUNK = int(os.getenv("MATCH_UPDATE_CHUNK", "5000"))
+
+
+@dataclass(frozen=True)
+class Link:
+    actual_id: int
+    planned_ref_id: int
+    amount_diff: Decimal    # сумма факта минус сумма плана
+    days: int               # разница дат, дней
+
+
+def load(db: Session, step_id: int) -> tuple[list, list]:
+    """(планы без фактов, факты без плана) шага: строки id, kind, sign, amount, currency, date, счета, категория."""
+    op = models.Operation
+    ref = aliased(models.Operation)
+    has_actual = sa.select(ref.id).where(ref.planned_ref_id == op.id, ref.budget_id == op.budget_id).exists()
+    rows = db.execute(
+        sa.select(
+            op.id, op.kind, op.sign, op.amount, op.currency, op.date,
+            op.account_id, op.account_id_to, op.category_id,
+        )
+        .where(
+            partitions.by_step(step_id),
+            sa.or_(
+                sa.and_(op.kind == "planned", ~has_actual),
+                sa.and_(op.kind == "actual", op.planned_ref_id.is_(None)),
+            ),
+        )
+        .order_by(op.id)
+    ).all()
+    return [r for r in rows if r.kind == "planned"], [r for r in rows if r.kind == "actual"]
+
+
+def _bucket(r) -> tuple:
+    return r.sign, r.currency, r.account_id, r.account_id_to
+
+
+def _nearest(group: tuple[list[float], list], amount: float, lo: float, hi: float,
+             day: int, window: int, limit: int) -> list[tuple]:
+    """
+    До limit планов группы с суммой в [lo, hi] и датой в окне — в порядке удаления суммы от amount:
+    (отклонение суммы, дни, id плана, план).
+    """
+    amounts, rows = group
+    j = bisect_left(amounts, amount)
+    i = j - 1
+    found = []
+    while len(found) < limit:
+        left = i >= 0 and amounts[i] >= lo
+        right = j < len(amounts) and amounts[j] <= hi
+        if not left and not right:
+            break
+        if right and (not left or amounts[j] - amount <= amount - amounts[i]):
+            k = j
+            j += 1
+        else:
+            k = i
+            i -= 1
+        p_day, p_id, p = rows[k]
+        days = abs(p_day - day)
+        if days <= window:
+            found.append((abs(amounts[k] - amount) / amount, days, p_id, p))
+    return found
+
+
+def match(planned: Sequence, actual: Sequence, amount_tolerance: Decimal, date_window_days: int) -> list[Link]:
+    """Пары факт -> план (см. правила в описании модуля), по возрастанию id факта."""
+    # в проходе — float, номера дней и кортежи: Decimal, datetime и атрибуты Row в горячем цикле
+    # в разы медленнее; точная разница сумм считается только для выбранных пар
+    tol = float(amount_tolerance)
+    # (знак, валюта, счета) -> категория -> (суммы по возрастанию, (день, id, план) в том же порядке)
+    index: dict[tuple, dict[int | None, tuple[list[float], list]]] = {}
+    for p in sorted(planned, key=lambda r: (r.amount, r.id)):
+        amounts, rows = index.setdefault(_bucket(p), {}).setdefault(p.category_id, ([], []))
+        amounts.append(float(p.amount))
+        rows.append((p.date.toordinal(), p.id, p))
+
+    candidates = []
+    for a in actual:
+        groups = index.get(_bucket(a))
+        if not groups:
+            continue
+        # факт без категории подходит к плану любой категории, с категорией — к той же или к плану без неё
+        category_id = a.category_id
+        cats = groups if category_id is None else (category_id, None)
+        amount, day, a_id = float(a.amount), a.date.toordinal(), a.id
+        lo, hi = amount * (1 - tol), amount * (1 + tol)
+        own = []
+        for cat in cats:
+            if cat in groups:
+                mismatch = cat != category_id
+                own.extend(
+                    (mismatch, diff, days, a_id, p_id, a, p)
+                    for diff, days, p_id, p in _nearest(groups[cat], amount, lo, hi, day,
+                                                        date_window_days, MATCH_MAX_CANDIDATES)
+                )
+        # у факта — не больше MATCH_MAX_CANDIDATES лучших вариантов: память не растёт с плотностью планов
+        if len(own) > MATCH_MAX_CANDIDATES:
+            own.sort(key=_score)
+            del own[MATCH_MAX_CANDIDATES:]
+        candidates.extend(own)
+
+    candidates.sort(key=_score)
+    used_actual: set[int] = set()
+    used_planned: set[int] = set()
+    links: list[Link] = []
+    for _, _, days, a_id, p_id, a, p in candidates:
+        if a_id in used_actual or p_id in used_planned:
+            continue
+        used_actual.add(a_id)
+        used_planned.add(p_id)
+        links.append(Link(a_id, p_id, a.amount - p.amount, days))
+    links.sort(key=lambda link: link.actual_id)
+    return links
+
+
+def _score(c: tuple) -> tuple:
+    # (другая категория, отклонение суммы, дни, id факта, id плана) — детерминированный порядок
+    return c[:5]
+
+
+def write(db: Session, budget_id: int, links: Sequence[Link]) -> int:
+    """Проставить planned_ref_id фактам (только ещё не связанным). Без commit. Возвращает число обновлённых строк."""
+    t = models.Operation.__table__
+    pairs = [(link.actual_id, link.planned_ref_id) for link in links]
+    n = 0
+    for start in range(0, len(pairs), MATCH_UPDATE_CHUNK):
+        chunk = pairs[start:start + MATCH_UPDATE_CHUNK]
+        if db.get_bind().dialect.name == "postgresql":
+            v = sa.values(sa.column("id", t.c.id.type), sa.column("planned_id", t.c.id.type), name="v").data(chunk)
+            stmt = (
+                sa.update(t)
+                .where(t.c.id == v.c.id, t.c.budget_id == budget_id, t.c.planned_ref_id.is_(None))
+                .values(planned_ref_id=v.c.planned_id)
+            )
+            n += db.execute(stmt).rowcount
+        else:
+            stmt = (
+                sa.update(t)
+                .where(t.c.id == sa.bindparam("b_id"), t.c.budget_id == budget_id, t.c.planned_ref_id.is_(None))
+                .values(planned_ref_id=sa.bindparam("b_planned"))
+            )
+            n += db.execute(stmt, [{"b_id": a, "b_planned": p} for a, p in chunk]).rowcount
+    return n
@@ -0,0 +1,272 @@
+"""
+Метрики запросов: время обработчика, число SQL-запросов и время в БД на каждый запрос.
+
+- MetricsMiddleware (чистый ASGI) заводит RequestStats в contextvar на время запроса,
+  добавляет заголовок Server-Timing и копит агрегаты по маршруту (шаблон пути, не URL).
+- Слушатели before/after_cursor_execute на всех Engine (sync и sync_engine async-движка)
+  пишут в RequestStats текущего запроса: contextvar переезжает и в threadpool, и в greenlet run_sync.
+- render_prometheus() — текст для GET /metrics; туда же попадают метрики пулов.
+- Запросы медленнее SLOW_REQUEST_MS, с запросом к БД дольше SLOW_QUERY_MS или с числом
+  SQL-запросов больше N1_QUERY_THRESHOLD логируются (logger "app.requests") — признак N+1.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.db import pool_metrics
+from app.src import response_cache
+
+log = logging.getLogger("app.requests")
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").strip().lower() in {"1", "true", "yes", "y", "on"}
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+N1_QUERY_THRESHOLD = int(os.getenv("N1_QUERY_THRESHOLD", "20"))
+
+# Границы корзин гистограммы длительности запроса, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: str | None = None
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+# ---------- SQL ----------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = perf_counter() - starts.pop()
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    if elapsed > stats.slowest_seconds:
+        stats.slowest_seconds = elapsed
+        stats.slowest_statement = statement
+
+
+def _handle_error(ctx):
+    # запрос упал — after_cursor_execute не будет, снимаем отметку времени
+    starts = ctx.connection.info.get("query_start") if ctx.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+_instrumented = False
+
+
+def instrument_sql() -> None:
+    """Подписаться на выполнение запросов всеми движками процесса (один раз)."""
+    global _instrumented
+    if _instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
+    _instrumented = True
+
+
+# ---------- Агрегаты по маршрутам ----------
+class _RouteStats:
+    __slots__ = ("count", "errors", "seconds", "db_seconds", "queries", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+
+_routes: dict[tuple[str, str], _RouteStats] = {}
+_lock = threading.Lock()
+
+
+def _observe(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+    with _lock:
+        r = _routes.get((method, route))
+        if r is None:
+            r = _routes[(method, route)] = _RouteStats()
+        r.count += 1
+        if status >= 500:
+            r.errors += 1
+        r.seconds += seconds
+        r.db_seconds += stats.db_seconds
+        r.queries += stats.queries
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                r.buckets[i] += 1
+                break
+
+
+def _log_if_slow(method: str, route: str, status: int, seconds: float, stats: RequestStats) -> None:
+    reasons = []
+    if seconds * 1000 > SLOW_REQUEST_MS:
+        reasons.append("slow request")
+    if stats.slowest_seconds * 1000 > SLOW_QUERY_MS:
+        reasons.append("slow query")
+    if stats.queries > N1_QUERY_THRESHOLD:
+        reasons.append("too many queries")
+    if not reasons:
+        return
+    log.warning(
+        "%s: %s %s -> %s in %.1fms, %d queries, db %.1fms, slowest %.1fms: %s",
+        ", ".join(reasons), method, route, status, seconds * 1000, stats.queries,
+        stats.db_seconds * 1000, stats.slowest_seconds * 1000,
+        " ".join((stats.slowest_statement or "").split())[:500],
+    )
+
+
+def _server_timing(seconds: float, stats: RequestStats) -> bytes:
+    return (
+        f'app;dur={seconds * 1000:.1f}, db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"'
+    ).encode("latin-1")
+
+
+def _route_template(scope) -> str:
+    """
+    Шаблон пути маршрута (/api/steps/{step_id}/feed) — метка с ограниченным числом значений.
+    Берётся path_format совпавшего маршрута. У маршрутов вложенных роутеров он относительный,
+    а префиксы include_router в scope не попадают; префиксы в приложении — без параметров,
+    поэтому это начальные сегменты фактического пути перед сегментами шаблона.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "<unmatched>"
+    template = [seg for seg in getattr(route, "path_format", "").split("/") if seg]
+    path = [seg for seg in scope.get("path", "").split("/") if seg]
+    return "/" + "/".join(path[:max(len(path) - len(template), 0)] + template)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        t0 = perf_counter()
+        status = 500
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # SSE-поток и выгрузки файлом живут минутами — это не медленный запрос
+                streaming = any(
+                    k == b"content-type" and v.startswith(b"text/event-stream")
+                    or k == b"content-disposition" and v.startswith(b"attachment")
+                    for k, v in message.get("headers", [])
+                )
+                if SERVER_TIMING:
+                    # для потоковых ответов — время до первого байта
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(perf_counter() - t0, stats)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            seconds = perf_counter() - t0
+            route = _route_template(scope)
+            method = scope.get("method", "")
+            _observe(method, route, status, seconds, stats)
+            if not streaming:
+                _log_if_slow(method, route, status, seconds, stats)
+
+
+# ---------- Prometheus ----------
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus() -> str:
+    lines: list[str] = []
+
+    def metric(name: str, kind: str, help_: str):
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    with _lock:
+        routes = sorted(_routes.items())
+        snapshot = [
+            (method, route, r.count, r.errors, r.seconds, r.db_seconds, r.queries, list(r.buckets))
+            for (method, route), r in routes
+        ]
+
+    metric("http_request_duration_seconds", "histogram", "Request handling time by route.")
+    for method, route, count, _, seconds, _, _, buckets in snapshot:
+        labels = f'method="{method}",route="{_escape(route)}"'
+        acc = 0
+        for bound, n in zip(LATENCY_BUCKETS, buckets):
+            acc += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{le}"}} {acc}')
+        lines.append(f"http_request_duration_seconds_sum{{{labels}}} {seconds:.6f}")
+        lines.append(f"http_request_duration_seconds_count{{{labels}}} {count}")
+
+    for name, idx, help_ in (
+        ("http_requests_5xx_total", 3, "Requests answered with 5xx."),
+        ("http_request_db_seconds_total", 5, "Time spent in SQL statements."),
+        ("http_request_db_queries_total", 6, "SQL statements executed."),
+    ):
+        metric(name, "counter", help_)
+        for row in snapshot:
+            labels = f'method="{row[0]}",route="{_escape(row[1])}"'
+            value = row[idx]
+            lines.append(f"{name}{{{labels}}} {value:.6f}" if isinstance(value, float) else f"{name}{{{labels}}} {value}")
+
+    pools = pool_metrics.pool_status()
+    for name, key, kind, help_ in (
+        ("db_pool_checked_out", "checked_out", "gauge", "Connections currently checked out."),
+        ("db_pool_overflow", "overflow", "gauge", "Current pool overflow."),
+        ("db_pool_waits_total", "waits", "counter", "Checkouts that had to wait for a connection."),
+        ("db_pool_timeouts_total", "timeouts", "counter", "Checkouts that timed out."),
+        ("db_pool_wait_seconds_total", "wait_seconds_total", "counter", "Total time spent getting connections."),
+    ):
+        metric(name, kind, help_)
+        for pool, info in sorted(pools.items()):
+            if key in info:
+                lines.append(f'{name}{{pool="{pool}"}} {info[key]}')
+
+    cache = response_cache.counters()
+    for name, key, help_ in (
+        ("response_cache_hits_total", "hits", "Read responses served from the response cache."),
+        ("response_cache_misses_total", "misses", "Response cache misses."),
+        ("response_cache_invalidations_total", "invalidations", "Response cache invalidations by writes."),
+    ):
+        metric(name, "counter", help_)
+        for kind, c in cache.items():
+            lines.append(f'{name}{{kind="{kind}"}} {c[key]}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,24 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+
+def encode_cursor(*parts) -> str:
+    """
+    Непрозрачный курсор для keyset-пагинации: значения ключа последней строки страницы.
+    datetime и Decimal сериализуются строкой, разбирает их вызывающая сторона.
+    """
+    raw = json.dumps(list(parts), default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        parts = json.loads(raw)
+    except (ValueError, TypeError):
+        raise HTTPException(400, "invalid cursor")
+    if not isinstance(parts, list) or len(parts) != size:
+        raise HTTPException(400, "invalid cursor")
+    return parts
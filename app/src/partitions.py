@@ -0,0 +1,25 @@
+"""
+Условия для секционированной таблицы operation.
+
+В Postgres operation секционирована PARTITION BY HASH (budget_id) (миграция d4a8f3e1b9c2).
+Планировщик отбрасывает лишние секции, только если в запросе есть условие на budget_id;
+запросы по шагу получают его через подзапрос к budget_step — значение вычисляется один раз
+при выполнении, и остальные секции не сканируются (runtime pruning). В SQLite условие просто лишнее.
+"""
+from __future__ import annotations
+
+import sqlalchemy as sa
+
+from app.db import models
+
+
+def step_budget(step_id):
+    """(SELECT budget_id FROM budget_step WHERE id = :step_id)"""
+    s = models.BudgetStep
+    return sa.select(s.budget_id).where(s.id == step_id).scalar_subquery()
+
+
+def by_step(step_id):
+    """Операции шага с условием на ключ секционирования."""
+    op = models.Operation
+    return sa.and_(op.step_id == step_id, op.budget_id == step_budget(step_id))
@@ -0,0 +1,66 @@
+"""
+Операции над планом шага, выполняемые на стороне БД одним запросом.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.src import totals, versions, partitions
+
+_COPY_COLUMNS = [
+    "budget_id", "step_id", "kind", "sign", "amount", "currency", "date",
+    "account_id", "account_id_to", "category_id", "comment",
+    "planned_ref_id", "created_by", "created_at",
+]
+
+
+def copy_planned(db: Session, source_step_id: int, target_step_ids: list[int], keep_dates: bool = True) -> int:
+    """
+    Копирует плановые операции шага source_step_id в каждый из target_step_ids:
+    INSERT INTO operation (...) SELECT ... FROM operation JOIN budget_step ... — без загрузки строк в Python.
+    keep_dates=False ставит копиям дату начала целевого шага. Проверки (существование шагов,
+    общий бюджет) — на вызывающей стороне. Возвращает число созданных операций (по RETURNING).
+    """
+    if not target_step_ids:
+        return 0
+    op = models.Operation
+    dst = models.BudgetStep
+
+    planned = sa.and_(partitions.by_step(source_step_id), op.kind == "planned")
+    if keep_dates:
+        date_col = op.date
+    else:
+        # полночь UTC даты начала шага — параметром своего типа: CAST(date AS DATETIME) в SQLite
+        # дал бы число (2026), а не дату
+        starts = db.execute(sa.select(dst.id, dst.date_start).where(dst.id.in_(target_step_ids))).all()
+        date_type = op.__table__.c.date.type
+        date_col = sa.case(
+            *((dst.id == step_id, sa.literal(datetime(d.year, d.month, d.day, tzinfo=timezone.utc), date_type))
+              for step_id, d in starts),
+        )
+    # итоги — до INSERT: при копировании в тот же шаг выборка иначе увидела бы и сами копии
+    totals.add_totals_from_select(
+        db,
+        sa.select(dst.id.label("step_id"), op.kind, op.sign, op.currency, op.amount)
+        .select_from(op)
+        .join(dst, dst.id.in_(target_step_ids))
+        .where(planned),
+    )
+    source = (
+        sa.select(
+            dst.budget_id, dst.id, op.kind, op.sign, op.amount, op.currency, date_col,
+            op.account_id, op.account_id_to, op.category_id, op.comment,
+            sa.null(), sa.null(), sa.func.now(),
+        )
+        .select_from(op)
+        .join(dst, dst.id.in_(target_step_ids))
+        .where(planned)
+        .order_by(dst.id, op.id)
+    )
+    inserted = db.execute(sa.insert(op).from_select(_COPY_COLUMNS, source).returning(op.id)).scalars().all()
+    versions.bump_steps(db, target_step_ids)
+    return len(inserted)
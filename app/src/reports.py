@@ -0,0 +1,245 @@
+"""
+Сводный отчёт по бюджету: суммы по шагам и категориям, план против факта.
+
+Все операции агрегируются одним запросом GROUP BY step_id, category_id, kind, sign;
+разрезы по шагам, категориям и итог собираются из его строк в памяти.
+Суммы пересчитываются в валюту бюджета внутри этого запроса по курсу на конец шага —
+то же правило, что у сводки шага (app/src/fx.py).
+Дерево категорий шага (category_tree) сворачивает суммы по category_closure тем же способом.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.src import schemas, fx
+
+_PCT = Decimal("0.01")
+
+
+class _Acc:
+    """Накопитель сумм (kind, sign) -> amount для одного разреза."""
+    __slots__ = ("sums",)
+
+    def __init__(self):
+        self.sums: dict[tuple[str, str], Decimal] = defaultdict(Decimal)
+
+    def add(self, kind: str, sign: str, amount: Decimal) -> None:
+        self.sums[(kind, sign)] += amount
+
+    def fields(self) -> dict:
+        s = self.sums
+        inc, exp = s[("actual", "income")], s[("actual", "expense")]
+        p_inc, p_exp = s[("planned", "income")], s[("planned", "expense")]
+        return dict(
+            income=inc,
+            expense=exp,
+            net=inc - exp,
+            planned_income=p_inc,
+            planned_expense=p_exp,
+            planned_net=p_inc - p_exp,
+            income_execution_pct=_pct(inc, p_inc),
+            expense_execution_pct=_pct(exp, p_exp),
+        )
+
+
+def _pct(actual: Decimal, planned: Decimal) -> Decimal | None:
+    if not planned:
+        return None
+    return (actual * 100 / planned).quantize(_PCT, rounding=ROUND_HALF_UP)
+
+
+def _steps_in_range(budget_id: int, date_from: date | None, date_to: date | None):
+    """Условие на шаги бюджета, пересекающиеся с [date_from, date_to]."""
+    s = models.BudgetStep
+    cond = [s.budget_id == budget_id]
+    if date_from is not None:
+        cond.append(s.date_end >= date_from)
+    if date_to is not None:
+        cond.append(s.date_start <= date_to)
+    return sa.and_(*cond)
+
+
+def _converted_ops(budget: models.Budget, *cond):
+    """
+    Суммы операций бюджета без переводов по (шаг, категория, kind, sign, валюта) — amount в валюте
+    бюджета по курсу на конец шага, как в сводке шага (NULL — курса нет), n — число операций.
+    cond — условия на operation и budget_step. Курс вычисляется один раз на группу.
+    """
+    op = models.Operation
+    s = models.BudgetStep
+    per_currency = (
+        sa.select(
+            op.step_id, op.category_id, op.kind, op.sign, op.currency, s.date_end,
+            sa.func.sum(op.amount).label("amount"), sa.func.count().label("n"),
+        )
+        .join(s, s.id == op.step_id)
+        .where(op.budget_id == budget.id, op.sign != "transfer", *cond)
+        .group_by(op.step_id, op.category_id, op.kind, op.sign, op.currency, s.date_end)
+        .subquery()
+    )
+    c = per_currency.c
+    return sa.select(
+        c.step_id, c.category_id, c.kind, c.sign, c.currency,
+        fx.convert_sql(c.amount, c.currency, budget.currency, c.date_end).label("amount"), c.n,
+    )
+
+
+def _missing(converted):
+    """Ключ группировки: валюта операции без курса, иначе NULL — такие группы в суммы не входят."""
+    return sa.case((converted.c.amount.is_(None), converted.c.currency)).label("missing")
+
+
+def budget_report(
+    db: Session,
+    budget: models.Budget,
+    date_from: date | None = None,
+    date_to: date | None = None,
+) -> schemas.BudgetReport:
+    s = models.BudgetStep
+    c = models.Category
+    in_range = _steps_in_range(budget.id, date_from, date_to)
+
+    steps = db.execute(
+        sa.select(s.id, s.name, s.date_start, s.date_end).where(in_range).order_by(s.date_start, s.id)
+    ).all()
+
+    converted = _converted_ops(budget, in_range).subquery()
+    missing = _missing(converted)
+    rows = db.execute(
+        sa.select(
+            converted.c.step_id, converted.c.category_id, converted.c.kind, converted.c.sign, missing,
+            sa.func.sum(converted.c.amount), sa.func.sum(converted.c.n),
+        )
+        .group_by(converted.c.step_id, converted.c.category_id, converted.c.kind, converted.c.sign, missing)
+    ).all()
+
+    cat_ids = {r.category_id for r in rows if r.category_id is not None}
+    cat_names = dict(db.execute(sa.select(c.id, c.name).where(c.id.in_(cat_ids))).all()) if cat_ids else {}
+
+    total = _Acc()
+    by_step: dict[int, _Acc] = defaultdict(_Acc)
+    by_cat: dict[int | None, _Acc] = defaultdict(_Acc)
+    by_step_cat: dict[int, dict[int | None, _Acc]] = defaultdict(lambda: defaultdict(_Acc))
+    unconverted_ops = 0
+    unconverted_currencies: set[str] = set()
+    for step_id, cat_id, kind, sign, missing_currency, amount, n in rows:
+        if missing_currency is not None:
+            unconverted_ops += n
+            unconverted_currencies.add(missing_currency)
+            continue
+        amount = Decimal(amount).quantize(fx.CENT)
+        for acc in (total, by_step[step_id], by_cat[cat_id], by_step_cat[step_id][cat_id]):
+            acc.add(kind, sign, amount)
+
+    def categories(accs: dict[int | None, _Acc]) -> list[schemas.CategoryReport]:
+        # категории по id, «без категории» — последней
+        keys = sorted(accs, key=lambda k: (k is None, k or 0))
+        return [
+            schemas.CategoryReport(category_id=k, name=cat_names.get(k), **accs[k].fields())
+            for k in keys
+        ]
+
+    return schemas.BudgetReport(
+        budget_id=budget.id,
+        currency=budget.currency,
+        date_from=date_from,
+        date_to=date_to,
+        unconverted_operations=unconverted_ops,
+        unconverted_currencies=sorted(unconverted_currencies),
+        totals=schemas.ReportTotals(**total.fields()),
+        steps=[
+            schemas.StepReport(
+                step_id=st.id,
+                name=st.name,
+                date_start=st.date_start,
+                date_end=st.date_end,
+                categories=categories(by_step_cat.get(st.id, {})),
+                **by_step[st.id].fields(),
+            )
+            for st in steps
+        ],
+        categories=categories(by_cat),
+    )
+
+
+def category_tree(db: Session, budget: models.Budget, step: models.BudgetStep) -> schemas.CategoryTree:
+    """
+    Дерево категорий бюджета с суммами шага: own — операции самой категории, total — всего поддерева.
+    Операции агрегируются по категориям, затем одно соединение с category_closure прибавляет
+    сумму каждой категории ко всем её предкам (depth 0 — сама категория).
+    """
+    op = models.Operation
+    c = models.Category
+    cc = models.CategoryClosure
+
+    converted = _converted_ops(budget, op.step_id == step.id).subquery()
+    missing = _missing(converted)
+    per_cat = (
+        sa.select(
+            converted.c.category_id, converted.c.kind, converted.c.sign, missing,
+            sa.func.sum(converted.c.amount).label("amount"), sa.func.sum(converted.c.n).label("n"),
+        )
+        .group_by(converted.c.category_id, converted.c.kind, converted.c.sign, missing)
+        .subquery()
+    )
+    own = cc.depth == 0
+    rows = db.execute(
+        sa.select(
+            cc.ancestor_id, per_cat.c.kind, per_cat.c.sign, per_cat.c.missing,
+            sa.func.sum(per_cat.c.amount), sa.func.sum(sa.case((own, per_cat.c.amount))),
+            sa.func.sum(per_cat.c.n), sa.func.sum(sa.case((own, per_cat.c.n))),
+        )
+        .select_from(per_cat)
+        # операции без категории остаются одной группой с ancestor_id NULL
+        .outerjoin(cc, cc.descendant_id == per_cat.c.category_id)
+        .group_by(cc.ancestor_id, per_cat.c.kind, per_cat.c.sign, per_cat.c.missing)
+    ).all()
+
+    own_acc: dict[int, _Acc] = defaultdict(_Acc)
+    total_acc: dict[int, _Acc] = defaultdict(_Acc)
+    uncategorized = _Acc()
+    unconverted_ops = 0
+    unconverted_currencies: set[str] = set()
+    for cat_id, kind, sign, missing_currency, total, own_amount, n, own_n in rows:
+        if missing_currency is not None:
+            # операция учитывается один раз — в своей категории
+            unconverted_ops += n if cat_id is None else (own_n or 0)
+            unconverted_currencies.add(missing_currency)
+            continue
+        if cat_id is None:
+            uncategorized.add(kind, sign, Decimal(total).quantize(fx.CENT))
+            continue
+        total_acc[cat_id].add(kind, sign, Decimal(total).quantize(fx.CENT))
+        if own_amount is not None:
+            own_acc[cat_id].add(kind, sign, Decimal(own_amount).quantize(fx.CENT))
+
+    nodes: dict[int, schemas.CategoryTreeNode] = {}
+    roots: list[schemas.CategoryTreeNode] = []
+    cats = db.execute(sa.select(c.id, c.name, c.parent_id).where(c.budget_id == budget.id).order_by(c.id)).all()
+    for cat_id, name, parent_id in cats:
+        nodes[cat_id] = schemas.CategoryTreeNode(
+            id=cat_id,
+            name=name,
+            parent_id=parent_id,
+            own=schemas.ReportTotals(**own_acc[cat_id].fields()),
+            total=schemas.ReportTotals(**total_acc[cat_id].fields()),
+        )
+    for node in nodes.values():
+        parent = nodes.get(node.parent_id) if node.parent_id is not None else None
+        (parent.children if parent is not None else roots).append(node)
+
+    return schemas.CategoryTree(
+        step_id=step.id,
+        budget_id=budget.id,
+        currency=budget.currency,
+        unconverted_operations=unconverted_ops,
+        unconverted_currencies=sorted(unconverted_currencies),
+        uncategorized=schemas.ReportTotals(**uncategorized.fields()),
+        categories=roots,
+    )
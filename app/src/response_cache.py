@@ -0,0 +1,236 @@
+"""
+Кеш готовых ответов GET-эндпоинтов чтения (списки счетов/категорий/шагов, сводка шага).
+
+Ключ — маршрут + отсортированные query-параметры + тег (вид данных и id бюджета/шага) + поколение тега.
+Запись через API вызывает invalidate(тег) после commit: поколение тега увеличивается, и старые
+ответы больше не находятся (доживают до TTL/вытеснения). Поколение читается до запроса к БД,
+поэтому ответ, собранный параллельно с записью, ложится под старое поколение и не всплывёт.
+
+Вместе с телом хранятся ETag/Last-Modified (app/src/versions.py): повторный опрос с If-None-Match
+получает 304 прямо из кеша, без обращения к БД.
+
+Бэкенды (RESPONSE_CACHE_BACKEND): memory — LRU с TTL в процессе (по умолчанию; инвалидация видна
+только этому процессу, остальные воркеры догоняют за TTL), redis — общий для всех воркеров
+(нужен пакет redis; подойдёт и любой объект с get/set(px=)/incr, например fakeredis), off — выключен.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from urllib.parse import urlencode
+
+from fastapi import Request, Response
+
+from app.src import versions
+from app.src.cache import TTLCache
+
+log = logging.getLogger(__name__)
+
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").strip().lower()
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))        # секунды
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))     # ответов (memory)
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_PREFIX = os.getenv("RESPONSE_CACHE_PREFIX", "budget-app:")
+
+Tag = tuple[str, int]  # ("accounts" | "categories" | "steps", budget_id) или ("step", step_id)
+
+
+# ---------- Бэкенды ----------
+class CacheBackend(ABC):
+    """Интерфейс хранилища: байтовые значения с TTL и счётчики поколений."""
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> bytes | None: ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None: ...
+
+    @abstractmethod
+    def generation(self, key: str) -> int: ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int: ...
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryBackend(CacheBackend):
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # поколения — LRU не больше maxsize. Значения берутся из общего счётчика процесса, а у вытесненного
+        # тега поколение — наибольшее из вытесненных (_floor): оно не меньше его последнего, поэтому поколение
+        # тега никогда не уменьшается и старые ответы не «воскресают» (худшее — лишний промах)
+        self.maxsize = maxsize
+        self._gens: OrderedDict[str, int] = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        return self.entries.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.entries.set(key, value, ttl=ttl)
+
+    def generation(self, key: str) -> int:
+        with self._lock:
+            return self._gens.get(key, self._floor)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counter += 1
+            self._gens[key] = self._counter
+            self._gens.move_to_end(key)
+            while len(self._gens) > max(self.maxsize, 1):
+                _, gen = self._gens.popitem(last=False)
+                self._floor = max(self._floor, gen)
+            return self._counter
+
+    def stats(self) -> dict:
+        return {**self.entries.stats(), "generations": len(self._gens)}
+
+
+class RedisBackend(CacheBackend):
+    """Поверх клиента redis-py (или совместимой заглушки). Ошибки хранилища — промах, а не 500."""
+    name = "redis"
+
+    def __init__(self, client, prefix: str = RESPONSE_CACHE_PREFIX):
+        self.client = client
+        self.prefix = prefix
+        self.errors = 0
+
+    def _call(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:  # сеть/таймаут: работаем без кеша
+            self.errors += 1
+            log.warning("response cache backend error: %s", e)
+            return None
+
+    def get(self, key: str) -> bytes | None:
+        return self._call(self.client.get, self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._call(self.client.set, self.prefix + key, value, px=max(int(ttl * 1000), 1))
+
+    def generation(self, key: str) -> int:
+        value = self._call(self.client.get, self.prefix + key)
+        return int(value) if value is not None else 0
+
+    def incr(self, key: str) -> int:
+        return self._call(self.client.incr, self.prefix + key) or 0
+
+    def stats(self) -> dict:
+        return {"url": RESPONSE_CACHE_URL, "prefix": self.prefix, "errors": self.errors}
+
+
+def _make_backend() -> CacheBackend | None:
+    if RESPONSE_CACHE_BACKEND in {"off", "none", "0", ""} or RESPONSE_CACHE_TTL <= 0:
+        return None
+    if RESPONSE_CACHE_BACKEND == "redis":
+        try:
+            import redis  # необязательная зависимость
+        except ImportError:
+            log.warning("RESPONSE_CACHE_BACKEND=redis but redis is not installed; using in-process cache")
+        else:
+            return RedisBackend(redis.Redis.from_url(RESPONSE_CACHE_URL, socket_timeout=0.2))
+    elif RESPONSE_CACHE_BACKEND != "memory":
+        raise RuntimeError(f"RESPONSE_CACHE_BACKEND must be memory, redis or off, got {RESPONSE_CACHE_BACKEND!r}")
+    return MemoryBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+
+
+backend: CacheBackend | None = _make_backend()
+
+
+def set_backend(new: CacheBackend | None) -> None:
+    """Подменить хранилище (стенд с заглушкой внешнего кеша, отключение в скриптах)."""
+    global backend
+    backend = new
+
+
+# ---------- Счётчики ----------
+_counters: dict[str, dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0})
+_counters_lock = threading.Lock()
+
+
+def _count(kind: str, what: str, n: int = 1) -> None:
+    with _counters_lock:
+        _counters[kind][what] += n
+
+
+def counters() -> dict[str, dict[str, int]]:
+    with _counters_lock:
+        return {kind: dict(c) for kind, c in sorted(_counters.items())}
+
+
+def stats() -> dict:
+    return {
+        "backend": backend.name if backend is not None else "off",
+        "ttl": RESPONSE_CACHE_TTL,
+        "by_kind": counters(),
+        **(backend.stats() if backend is not None else {}),
+    }
+
+
+# ---------- Ответы ----------
+def _gen_key(tag: Tag) -> str:
+    return f"gen:{tag[0]}:{tag[1]}"
+
+
+def _encode(response: Response, version: versions.Version | None) -> bytes:
+    etag = version.etag if version is not None else ""
+    modified = version.last_modified.isoformat() if version is not None else ""
+    return f"{etag}\n{modified}\n".encode() + response.body
+
+
+def _decode(value: bytes) -> tuple[versions.Version | None, bytes]:
+    etag, modified, body = value.split(b"\n", 2)
+    if not etag:
+        return None, body
+    return versions.Version(etag=etag.decode(), last_modified=datetime.fromisoformat(modified.decode())), body
+
+
+def lookup(request: Request, tag: Tag) -> tuple[str | None, Response | None]:
+    """
+    (ключ, ответ из кеша или None). Вызывать до запросов к БД; ключ передаётся в store().
+    При совпадении If-None-Match ответ из кеша — 304.
+    """
+    if backend is None:
+        return None, None
+    gen = backend.generation(_gen_key(tag))
+    query = urlencode(sorted(request.query_params.multi_items()))
+    key = f"resp:{tag[0]}:{tag[1]}:{gen}:{request.url.path}?{query}"
+    value = backend.get(key)
+    if value is None:
+        _count(tag[0], "misses")
+        return key, None
+    _count(tag[0], "hits")
+    version, body = _decode(value)
+    if (not_modified := versions.not_modified(request, version)) is not None:
+        return key, not_modified
+    return key, Response(content=body, media_type="application/json", headers=versions.headers(version))
+
+
+def store(key: str | None, response: Response, version: versions.Version | None) -> Response:
+    """Сохранить JSON-ответ (с готовым телом) под ключом из lookup() и вернуть его же."""
+    if key is not None and backend is not None and response.status_code == 200:
+        backend.set(key, _encode(response, version), RESPONSE_CACHE_TTL)
+        _count(key.split(":", 2)[1], "stores")
+    return response
+
+
+def invalidate(*tags: Tag) -> None:
+    """Сбросить закешированные ответы по тегам. Вызывать после commit записи."""
+    if backend is None:
+        return
+    for tag in sorted(set(tags)):
+        backend.incr(_gen_key(tag))
+        _count(tag[0], "invalidations")
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import date, datetime
 from decimal import Decimal
-from pydantic import BaseModel, Field, EmailStr, model_validator
+from pydantic import BaseModel, Field, EmailStr, computed_field, model_validator
 from typing import Optional, Literal
 
 # ------------------ USERS ------------------
@@ -72,7 +72,7 @@ class MeRead(AuthUser):
 class BudgetCreate(BaseModel):
     name: str
     currency: str = Field(min_length=3, max_length=3)
-    owner_user_id: int
+    owner_user_id: Optional[int] = None   # владелец — всегда текущий пользователь
 
 
 class BudgetRead(BaseModel):
@@ -85,6 +85,19 @@ class BudgetRead(BaseModel):
         from_attributes = True
 
 
+class BudgetShareUpdate(BaseModel):
+    role: Literal["viewer", "editor"]
+
+
+class BudgetShareRead(BaseModel):
+    budget_id: int
+    user_id: int
+    role: str
+
+    class Config:
+        from_attributes = True
+
+
 # ------------------ ACCOUNTS ------------------
 class AccountCreate(BaseModel):
     budget_id: int
@@ -102,16 +115,41 @@ class AccountRead(BaseModel):
         from_attributes = True
 
 
+# Баланс счёта на момент at (снимок + операции после него)
+class AccountBalance(BaseModel):
+    account_id: int
+    budget_id: int
+    name: str
+    currency: str
+    balance: Decimal
+    at: datetime
+    snapshot_as_of: Optional[datetime] = None
+    ops_since_snapshot: int = 0
+    # операции в другой валюте: в balance не входят
+    unconverted_ops: int = 0
+
+    class Config:
+        from_attributes = True
+
+
 # ------------------ CATEGORIES ------------------
 class CategoryCreate(BaseModel):
     budget_id: int
     name: str
+    parent_id: Optional[int] = None
+
+
+class CategoryUpdate(BaseModel):
+    # переданное поле меняется; parent_id: null — перенести в корень
+    name: Optional[str] = None
+    parent_id: Optional[int] = None
 
 
 class CategoryRead(BaseModel):
     id: int
     budget_id: int
     name: str
+    parent_id: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -191,11 +229,180 @@ class OperationRead(BaseModel):
         from_attributes = True
 
 
+# Страница ленты шага (keyset-пагинация по (created_at, id))
+class OperationFeedPage(BaseModel):
+    items: list[OperationRead]
+    next_cursor: str | None = None
+
+
+class OperationSearchHit(OperationRead):
+    date: datetime
+    rank: float    # релевантность: больше — выше в выдаче
+
+
+class OperationSearchPage(BaseModel):
+    items: list[OperationSearchHit]
+    next_cursor: str | None = None
+
+
+# Результат пакетной загрузки: ids выровнены по позициям входного списка
+# (None — элемент не создан, причина в errors)
+class BulkItemError(BaseModel):
+    index: int
+    error: str
+
+
+class BulkOperationResult(BaseModel):
+    created: int
+    ids: list[int | None]
+    errors: list[BulkItemError] = []
+
+
+# Сопоставление факта с планом (POST /steps/{id}/match); не заданные пороги — из MATCH_* окружения
+class StepMatchRequest(BaseModel):
+    dry_run: bool = False
+    amount_tolerance: Optional[Decimal] = Field(default=None, ge=0, lt=1)   # доля суммы факта
+    date_window_days: Optional[int] = Field(default=None, ge=0)
+
+
+class MatchLink(BaseModel):
+    actual_id: int
+    planned_ref_id: int
+    amount_diff: Decimal             # факт минус план
+    days: int
+
+
+class StepMatchResult(BaseModel):
+    dry_run: bool
+    planned: int                     # планов без фактов до сопоставления
+    actual: int                      # фактов без плана до сопоставления
+    matched: int                     # записано ссылок (при dry_run — найдено пар)
+    links: list[MatchLink] = []
+
+
+# Импорт выписки: row — номер строки CSV или номер транзакции OFX (0 — ошибка файла целиком)
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ImportJobRead(BaseModel):
+    id: int
+    budget_id: int
+    account_id: int
+    format: str
+    status: str                      # queued | running | done | failed
+    bytes_total: int
+    bytes_read: int
+    rows_read: int
+    created: int                     # новые операции
+    duplicates: int                  # уже импортированные ранее строки
+    failed: int                      # строки с ошибками (первые из них — в errors)
+    errors: list[ImportRowError] = []
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def progress(self) -> float:
+        """Доля прочитанного файла, 0..1."""
+        if self.status == "done":
+            return 1.0
+        return round(self.bytes_read / self.bytes_total, 4) if self.bytes_total else 0.0
+
+    class Config:
+        from_attributes = True
+
+
 # ------------------ STEP SUMMARY ------------------
+class StepTotalRead(BaseModel):
+    kind: str
+    sign: str
+    currency: str
+    amount: Decimal
+    ops_count: int
+
+    class Config:
+        from_attributes = True
+
+
 class StepSummary(BaseModel):
+    # фактические доходы/расходы (переводы не входят)
     total_income: Decimal
     total_expense: Decimal
     net: Decimal
+    total_transfer: Decimal = Decimal(0)
+    # план
+    planned_income: Decimal = Decimal(0)
+    planned_expense: Decimal = Decimal(0)
+    planned_net: Decimal = Decimal(0)
+    # итоги выше — в валюте бюджета; валюты, для которых нет курса (их суммы в итоги не вошли)
+    currency: Optional[str] = None
+    unconverted: list[str] = []
+    # разбивка по kind/sign/currency (без пересчёта)
+    by_currency: list[StepTotalRead] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# ---------- Отчёт по бюджету ----------
+class ReportTotals(BaseModel):
+    # факт (переводы не входят)
+    income: Decimal = Decimal(0)
+    expense: Decimal = Decimal(0)
+    net: Decimal = Decimal(0)
+    # план
+    planned_income: Decimal = Decimal(0)
+    planned_expense: Decimal = Decimal(0)
+    planned_net: Decimal = Decimal(0)
+    # исполнение плана, % (None — если план нулевой)
+    income_execution_pct: Optional[Decimal] = None
+    expense_execution_pct: Optional[Decimal] = None
+
+
+class CategoryReport(ReportTotals):
+    category_id: Optional[int] = None   # None — операции без категории
+    name: Optional[str] = None
+
+
+class StepReport(ReportTotals):
+    step_id: int
+    name: str
+    date_start: date
+    date_end: date
+    categories: list[CategoryReport] = []
+
+
+class CategoryTreeNode(BaseModel):
+    id: int
+    name: str
+    parent_id: Optional[int] = None
+    own: ReportTotals        # операции самой категории
+    total: ReportTotals      # вместе со всеми подкатегориями
+    children: list["CategoryTreeNode"] = []
+
+
+class CategoryTree(BaseModel):
+    step_id: int
+    budget_id: int
+    currency: str
+    # суммы пересчитаны в currency по курсу на дату окончания шага; операции без курса в суммы не вошли
+    unconverted_operations: int = 0
+    unconverted_currencies: list[str] = []
+    uncategorized: ReportTotals
+    categories: list[CategoryTreeNode] = []
+
+
+class BudgetReport(BaseModel):
+    budget_id: int
+    currency: str
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    # суммы пересчитаны в currency по курсу на дату окончания шага; операции без курса в суммы не вошли
+    unconverted_operations: int = 0
+    unconverted_currencies: list[str] = []
+    totals: ReportTotals
+    steps: list[StepReport] = []
+    categories: list[CategoryReport] = []
@@ -0,0 +1,84 @@
+"""
+Поиск операций бюджета по комментарию (GET /api/budgets/{id}/operations/search).
+
+В Postgres (миграция b3f6c1d8e2a7) на каждой секции operation два GIN-индекса:
+- полнотекстовый по выражению to_tsvector(TS_CONFIG, coalesce(comment, '')) — словоформы
+  (конфигурация russian стеммит и русские, и латинские слова);
+- триграммный (pg_trgm) по comment — находит слова с опечатками: q <% comment
+  (word_similarity не ниже pg_trgm.word_similarity_threshold, по умолчанию 0.6).
+Строка подходит по любому из них (BitmapOr двух индексов), условие на budget_id оставляет
+одну секцию. Релевантность — ts_rank + word_similarity; страницы — keyset по (rank, id),
+курсор хранит обе величины последней строки.
+В остальных БД — подстрока comment (LIKE), релевантность 0: порядок по id.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from app.db import models
+from app.src import category_tree, fastjson, schemas
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "50"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "200"))
+
+# должна совпадать с выражением индекса в миграции b3f6c1d8e2a7
+TS_CONFIG = "russian"
+
+
+@dataclass
+class Filters:
+    amount_min: Decimal | None = None
+    amount_max: Decimal | None = None
+    date_from: date | None = None
+    date_to: date | None = None
+    account_id: int | None = None      # счёт списания или зачисления
+    category_id: int | None = None     # категория вместе с подкатегориями
+
+
+def _tsvector(comment):
+    # литералы, а не параметры: выражение должно совпасть с индексным и в generic-плане
+    return sa.func.to_tsvector(sa.literal_column(f"'{TS_CONFIG}'"), sa.func.coalesce(comment, sa.literal_column("''")))
+
+
+def _match_and_rank(dialect: str, q: str):
+    op = models.Operation
+    if dialect != "postgresql":
+        like = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return op.comment.like(like, escape="\\"), sa.literal(0.0, sa.Float)
+    tsv = _tsvector(op.comment)
+    tsq = sa.func.websearch_to_tsquery(sa.literal_column(f"'{TS_CONFIG}'"), q)
+    match = sa.or_(tsv.op("@@")(tsq), sa.literal(q).op("<%")(op.comment))
+    rank = sa.cast(sa.func.ts_rank(tsv, tsq) + sa.func.word_similarity(q, op.comment), sa.Float)
+    return match, rank
+
+
+def search_query(dialect: str, budget_id: int, q: str, f: Filters, after: tuple[float, int] | None, limit: int):
+    """Страница результатов: колонки OperationSearchHit, limit + 1 строк (лишняя — признак продолжения)."""
+    op = models.Operation
+    match, rank = _match_and_rank(dialect, q)
+    rank = rank.label("rank")
+    stmt = (
+        sa.select(*fastjson.columns(op, schemas.OperationRead), op.date, rank)
+        .where(op.budget_id == budget_id, match)
+    )
+    if f.amount_min is not None:
+        stmt = stmt.where(op.amount >= f.amount_min)
+    if f.amount_max is not None:
+        stmt = stmt.where(op.amount <= f.amount_max)
+    if f.date_from is not None:
+        stmt = stmt.where(op.date >= datetime.combine(f.date_from, time.min, tzinfo=timezone.utc))
+    if f.date_to is not None:
+        stmt = stmt.where(op.date < datetime.combine(f.date_to + timedelta(days=1), time.min, tzinfo=timezone.utc))
+    if f.account_id is not None:
+        stmt = stmt.where(sa.or_(op.account_id == f.account_id, op.account_id_to == f.account_id))
+    if f.category_id is not None:
+        stmt = stmt.where(op.category_id.in_(category_tree.subtree_ids(f.category_id)))
+    if after is not None:
+        last_rank, last_id = after
+        stmt = stmt.where(sa.or_(rank < last_rank, sa.and_(rank == last_rank, op.id < last_id)))
+    return stmt.order_by(rank.desc(), op.id.desc()).limit(limit + 1)
@@ -1,35 +1,111 @@
+import asyncio
 import base64
 import hashlib
+import logging
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
 from typing import Optional
 
 from jose import jwt
-from passlib.hash import bcrypt
+from passlib.context import CryptContext
 
 JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME_SECRET")  # override in ENV
 JWT_ALG = os.getenv("JWT_ALG", "HS256")
 JWT_TTL_MIN = int(os.getenv("JWT_TTL_MIN", str(60 * 24 * 14)))  # minutes
 
+# ---------- Хеширование паролей ----------
+# Схема для новых хешей: bcrypt (по умолчанию) или argon2 (нужен пакет argon2-cffi).
+# Хеши другой схемы или с другими параметрами проверяются как раньше и пересчитываются при входе.
+PASSWORD_SCHEME = os.getenv("PASSWORD_SCHEME", "bcrypt").strip().lower()
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "1"))
+# Потоки для хеширования (отдельно от threadpool обработчиков) и предел ожидающих задач
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+
+log = logging.getLogger(__name__)
+
+try:
+    import argon2  # noqa: F401  # argon2-cffi — необязательная зависимость
+    _HAS_ARGON2 = True
+except ImportError:
+    _HAS_ARGON2 = False
+
+if PASSWORD_SCHEME not in {"bcrypt", "argon2"}:
+    raise RuntimeError(f"PASSWORD_SCHEME must be bcrypt or argon2, got {PASSWORD_SCHEME!r}")
+if PASSWORD_SCHEME == "argon2" and not _HAS_ARGON2:
+    log.warning("PASSWORD_SCHEME=argon2 but argon2-cffi is not installed; using bcrypt")
+    PASSWORD_SCHEME = "bcrypt"
+
+pwd_context = CryptContext(
+    schemes=["bcrypt", "argon2"] if _HAS_ARGON2 else ["bcrypt"],
+    default=PASSWORD_SCHEME,
+    deprecated="auto",  # всё, кроме default, считается устаревшим -> rehash при входе
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    argon2__type="ID",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_KIB,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь на хеширование заполнена (PASSWORD_HASH_MAX_PENDING)."""
+
+
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="pwhash")
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+async def _offload(fn, *args):
+    # bcrypt/argon2 отпускают GIL, так что пул из нескольких потоков реально параллелен;
+    # event loop и threadpool обработчиков при этом не заняты
+    if not _hash_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_slots.release()
+
+
 def hash_password(p: str) -> str:
-    return bcrypt.hash(p)
+    return pwd_context.hash(p)
 
 def verify_password(p: str, ph: str) -> bool:
-    return bcrypt.verify(p, ph)
+    return pwd_context.verify(p, ph)
+
+def verify_and_update(p: str, ph: str) -> tuple[bool, Optional[str]]:
+    """(пароль верен, новый хеш или None) — новый хеш, если ph устарел по схеме/параметрам."""
+    return pwd_context.verify_and_update(p, ph)
+
+async def hash_password_async(p: str) -> str:
+    return await _offload(hash_password, p)
+
+async def verify_and_update_async(p: str, ph: str) -> tuple[bool, Optional[str]]:
+    return await _offload(verify_and_update, p, ph)
 
 def create_jwt(user_id: int) -> str:
     now = datetime.utcnow()
     payload = {"sub": str(user_id), "iat": now, "exp": now + timedelta(minutes=JWT_TTL_MIN)}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
-def decode_jwt(token: str) -> Optional[int]:
+def decode_jwt_claims(token: str) -> Optional[tuple[int, int]]:
+    """(user_id, exp в unix-секундах) либо None, если токен невалиден/просрочен."""
     try:
         data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        return int(data["sub"])
+        return int(data["sub"]), int(data["exp"])
     except Exception:
         return None
 
+def decode_jwt(token: str) -> Optional[int]:
+    claims = decode_jwt_claims(token)
+    return claims[0] if claims else None
+
 _SSH_HEADER_FP = re.compile(r"^SHA256:([A-Za-z0-9+/=]+)$")
 
 def ssh_fingerprint_sha256(pubkey: str) -> str:
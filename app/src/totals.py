@@ -0,0 +1,112 @@
+"""
+Инкрементальные агрегаты операций по шагам (таблица step_totals).
+
+Каждый путь записи операций вызывает add_totals/add_totals_from_select в той же
+транзакции, что и саму запись, поэтому /steps/{id}/summary читает готовые суммы
+по первичному ключу. rebuild() пересчитывает таблицу с нуля (python -m app.src.admin).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+_KEY = ("step_id", "kind", "sign", "currency")
+
+
+class _DictRow:
+    __slots__ = ("step_id", "kind", "sign", "currency", "amount")
+
+    def __init__(self, d: dict):
+        for k in self.__slots__:
+            setattr(self, k, d[k])
+
+
+def _upsert(db: Session):
+    table = models.StepTotal.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise RuntimeError(f"step_totals upsert is not supported for {dialect}")
+
+
+def _on_conflict_add(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=list(_KEY),
+        set_={
+            "amount": models.StepTotal.__table__.c.amount + stmt.excluded.amount,
+            "ops_count": models.StepTotal.__table__.c.ops_count + stmt.excluded.ops_count,
+        },
+    )
+
+
+def add_totals(db: Session, rows: Iterable, factor: int = 1) -> None:
+    """
+    Прибавляет к step_totals операции rows: ORM-объекты/строки или dict
+    с ключами step_id, kind, sign, currency, amount.
+    factor=-1 — вычесть (удаление операции, старая версия при изменении).
+    Строки агрегируются в памяти и пишутся одним upsert в порядке ключа (без взаимных блокировок).
+    """
+    acc: dict[tuple, list] = defaultdict(lambda: [Decimal(0), 0])
+    for r in rows:
+        if isinstance(r, dict):
+            r = _DictRow(r)
+        cell = acc[(r.step_id, r.kind, r.sign, r.currency)]
+        cell[0] += Decimal(r.amount) * factor
+        cell[1] += factor
+    if not acc:
+        return
+    values = [
+        dict(zip(_KEY, key), amount=amount, ops_count=count)
+        for key, (amount, count) in sorted(acc.items())
+    ]
+    db.execute(_on_conflict_add(_upsert(db).values(values)))
+
+
+def add_totals_from_select(db: Session, ops_select) -> None:
+    """
+    То же для set-based путей (INSERT ... SELECT): ops_select — select по operation
+    с колонками step_id, kind, sign, currency, amount; агрегация выполняется в БД.
+    """
+    src = ops_select.subquery()
+    grouped = (
+        sa.select(src.c.step_id, src.c.kind, src.c.sign, src.c.currency,
+                  sa.func.sum(src.c.amount), sa.func.count())
+        .group_by(src.c.step_id, src.c.kind, src.c.sign, src.c.currency)
+        .order_by(src.c.step_id, src.c.kind, src.c.sign, src.c.currency)
+    )
+    stmt = _upsert(db).from_select(list(_KEY) + ["amount", "ops_count"], grouped)
+    db.execute(_on_conflict_add(stmt))
+
+
+def step_totals(db: Session, step_id: int) -> list[models.StepTotal]:
+    t = models.StepTotal
+    return db.query(t).filter(t.step_id == step_id).order_by(t.kind, t.sign, t.currency).all()
+
+
+def rebuild(db: Session, step_ids: list[int] | None = None) -> int:
+    """Пересчитать step_totals по operation (целиком или для указанных шагов). Возвращает число строк."""
+    t = models.StepTotal
+    op = models.Operation
+    if db.get_bind().dialect.name == "postgresql":
+        # писатели ждут окончания пересчёта, иначе их дельты потеряются при DELETE
+        db.execute(sa.text("LOCK TABLE step_totals IN EXCLUSIVE MODE"))
+
+    delete = sa.delete(t)
+    source = sa.select(op.step_id, op.kind, op.sign, op.currency, sa.func.sum(op.amount), sa.func.count())
+    if step_ids:
+        delete = delete.where(t.step_id.in_(step_ids))
+        source = source.where(op.step_id.in_(step_ids))
+    source = source.group_by(op.step_id, op.kind, op.sign, op.currency)
+
+    db.execute(delete)
+    stmt = sa.insert(t).from_select(list(_KEY) + ["amount", "ops_count"], source).returning(t.step_id)
+    return len(db.execute(stmt).all())
@@ -0,0 +1,120 @@
+"""
+Версии бюджетов и шагов для условных GET (ETag / Last-Modified / 304).
+
+budget.version растёт при изменении состава бюджета (счета, категории, шаги),
+budget_step.version — при записи операций шага. Пути записи вызывают bump_budget/bump_steps
+в той же транзакции, что и саму запись (как totals.add_totals), поэтому версия
+не может «отстать» от данных.
+
+Обработчик сначала читает версию одним запросом по первичному ключу и, если клиент прислал
+совпадающий If-None-Match (или If-Modified-Since не старше updated_at), отвечает 304,
+не загружая строки. Версия читается до строк: если запись вклинится между ними, клиент получит
+более новые данные со старым ETag и просто перезапросит их при следующем опросе.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable
+
+import sqlalchemy as sa
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from app.db import models
+
+# клиент всегда перепроверяет ответ (дёшево — 304), но может хранить его у себя
+CACHE_CONTROL = "private, no-cache"
+
+
+# ---------- Запись ----------
+def bump_budget(db: Session, budget_id: int) -> None:
+    b = models.Budget
+    db.execute(sa.update(b).where(b.id == budget_id).values(version=b.version + 1, updated_at=sa.func.now()))
+
+
+def bump_steps(db: Session, step_ids: Iterable[int] | None) -> None:
+    """
+    Увеличить версии шагов (None — всех); id сортируются, чтобы блокировки строк
+    брались в одном порядке и параллельные записи не ловили взаимную блокировку.
+    """
+    s = models.BudgetStep
+    stmt = sa.update(s).values(version=s.version + 1, updated_at=sa.func.now())
+    if step_ids is not None:
+        ids = sorted(set(step_ids))
+        if not ids:
+            return
+        stmt = stmt.where(s.id.in_(ids))
+    db.execute(stmt)
+
+
+# ---------- Чтение ----------
+@dataclass(frozen=True)
+class Version:
+    etag: str
+    last_modified: datetime
+
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True),
+            "Cache-Control": CACHE_CONTROL,
+        }
+
+
+def _version(db: Session, model, prefix: str, obj_id: int) -> Version | None:
+    row = db.execute(sa.select(model.version, model.updated_at).where(model.id == obj_id)).first()
+    if row is None:
+        return None
+    updated_at = row.updated_at
+    # SQLite возвращает naive datetime; в Postgres — timestamptz
+    if updated_at.tzinfo is None:
+        updated_at = updated_at.replace(tzinfo=timezone.utc)
+    updated_at = updated_at.astimezone(timezone.utc)
+    return Version(etag=f'W/"{prefix}{obj_id}.{row.version}"', last_modified=updated_at)
+
+
+def budget_version(db: Session, budget_id: int | None) -> Version | None:
+    """Версия бюджета; None — бюджета нет или список не ограничен бюджетом (без ETag)."""
+    return None if budget_id is None else _version(db, models.Budget, "b", budget_id)
+
+
+def step_version(db: Session, step_id: int) -> Version | None:
+    return _version(db, models.BudgetStep, "s", step_id)
+
+
+def headers(version: Version | None) -> dict:
+    return version.headers() if version is not None else {}
+
+
+def _opaque(tag: str) -> str:
+    # слабое сравнение (RFC 9110, 13.1.2): префикс W/ не учитывается
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request: Request, version: Version | None) -> Response | None:
+    """
+    Ответ 304, если у клиента актуальная версия, иначе None.
+    If-None-Match приоритетнее If-Modified-Since (у последнего точность — секунда).
+    """
+    if version is None:
+        return None
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = {_opaque(t) for t in inm.split(",")}
+        if "*" in tags or _opaque(version.etag) in tags:
+            return Response(status_code=304, headers=version.headers())
+        return None
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        if version.last_modified.replace(microsecond=0) <= since:
+            return Response(status_code=304, headers=version.headers())
+    return None
@@ -58,7 +58,6 @@ const ui = {
   budgetSelect: $('#budgetSelect'),
   budgetName: $('#budgetName'),
   budgetCurrency: $('#budgetCurrency'),
-  budgetOwnerId: $('#budgetOwnerId'),
   btnCreateBudget: $('#btnCreateBudget'),
 
   accountsList: $('#accountsList'),
@@ -186,8 +185,8 @@ async function loadSummaryFeed() {
     API.get(`/steps/${state.currentStepId}/summary`),
     API.get(`/steps/${state.currentStepId}/feed`),
   ]);
-  const feed = asArray(feedRaw);
-  if (!Array.isArray(feedRaw)) console.warn('Unexpected /feed payload:', feedRaw);
+  const feed = asArray(feedRaw?.items);
+  if (!Array.isArray(feedRaw?.items)) console.warn('Unexpected /feed payload:', feedRaw);
 
   ui.summaryBox.textContent =
     `Доходы: ${sum?.total_income ?? 0}\nРасходы: ${sum?.total_expense ?? 0}\nСальдо: ${sum?.net ?? 0}`;
@@ -273,9 +272,8 @@ ui.btnCreateBudget.addEventListener('click', async () => {
   try {
     const name = ui.budgetName.value.trim();
     const currency = ui.budgetCurrency.value.trim() || 'EUR';
-    const owner_user_id = Number(ui.budgetOwnerId.value || 1);
     if (!name) throw new Error('Введите название бюджета');
-    await API.post('/budgets', { name, currency, owner_user_id });
+    await API.post('/budgets', { name, currency });  // владелец — текущий пользователь
     await reloadAll();
     setStatus('Бюджет создан');
   } catch (e) {
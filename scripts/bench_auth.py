@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Пропускная способность /api/auth/login под параллельной нагрузкой и отзывчивость
+остального API в это время (GET /health раз в --probe-interval секунд).
+
+Если хеширование блокирует event loop, задержка /health растёт вместе с числом логинов;
+при выносе в пул хеширования она остаётся на уровне миллисекунд.
+
+    DATABASE_URL=sqlite:///bench_auth.db python scripts/bench_auth.py --concurrency 1 8 32
+    BCRYPT_ROUNDS=10 python scripts/bench_auth.py --json auth.json
+    PASSWORD_SCHEME=argon2 python scripts/bench_auth.py
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+PASSWORD = "bench-auth-password"
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+def _summary(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "max_ms": round((latencies[-1] if latencies else 0.0) * 1000, 2),
+    }
+
+
+async def run(client: httpx.AsyncClient, email: str, concurrency: int, duration: float, probe_interval: float) -> dict:
+    deadline = time.perf_counter() + duration
+    logins: list[float] = []
+    probes: list[float] = []
+    errors: dict[str, int] = {}
+
+    async def login_worker():
+        body = {"email": email, "password": PASSWORD}
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            r = await client.post("/api/auth/login", json=body)
+            if r.status_code == 200:
+                logins.append(time.perf_counter() - t0)
+            else:
+                errors[str(r.status_code)] = errors.get(str(r.status_code), 0) + 1
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            await client.get("/health")
+            probes.append(time.perf_counter() - t0)
+            await asyncio.sleep(probe_interval)
+
+    started = time.perf_counter()
+    await asyncio.gather(probe(), *(login_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "login_rps": round(len(logins) / elapsed, 2),
+        "login": _summary(logins),
+        "health": _summary(probes),
+        "errors": errors,
+    }
+
+
+async def main_async(args) -> dict:
+    transport, security = None, None
+    if not args.base_url:
+        from app.src.main import app
+        from app.db.base import Base, engine
+        from app.src import security
+
+        if engine.dialect.name == "sqlite":
+            Base.metadata.create_all(engine)
+        transport = httpx.ASGITransport(app=app)
+        # под нагрузкой каждый логин — «медленный запрос»; не засоряем вывод
+        logging.getLogger("app.requests").setLevel(logging.ERROR)
+
+    async with httpx.AsyncClient(base_url=args.base_url or "http://bench", transport=transport,
+                                 timeout=args.timeout) as client:
+        email = f"bench-auth-{int(time.time() * 1000)}@example.com"
+        r = await client.post("/api/auth/register", json={"email": email, "name": "bench", "password": PASSWORD})
+        r.raise_for_status()
+
+        results = []
+        for n in args.concurrency:
+            res = await run(client, email, n, args.duration, args.probe_interval)
+            results.append(res)
+            print(f"{n:>5} {res['login_rps']:>9.1f} {res['login']['p50_ms']:>9.1f} {res['login']['p99_ms']:>9.1f} "
+                  f"{res['health']['p50_ms']:>10.2f} {res['health']['p99_ms']:>10.2f} {sum(res['errors'].values()):>7}")
+
+    return {
+        # параметры хеширования известны только для приложения в этом процессе
+        "scheme": getattr(security, "PASSWORD_SCHEME", None),
+        "bcrypt_rounds": getattr(security, "BCRYPT_ROUNDS", None),
+        "hash_workers": getattr(security, "PASSWORD_HASH_WORKERS", None),
+        "target": args.base_url or "in-process",
+        "results": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base-url", help="URL запущенного сервера; по умолчанию приложение в этом процессе")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    ap.add_argument("--duration", type=float, default=5.0, help="секунд на каждый уровень параллельности")
+    ap.add_argument("--probe-interval", type=float, default=0.01)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--json", help="сохранить результат в файл")
+    args = ap.parse_args()
+
+    print(f"{'conc':>5} {'login/s':>9} {'p50, ms':>9} {'p99, ms':>9} {'health p50':>10} {'health p99':>10} {'errors':>7}")
+    report = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
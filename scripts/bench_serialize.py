@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""
+Сравнение двух путей отдачи списка операций (как в GET /api/operations):
+
+  orm  — ORM-объекты -> OperationRead(from_attributes) -> JSON (то, что делает FastAPI с response_model);
+  fast — select только колонок OperationRead -> dict -> app.src.fastjson.dumps.
+
+Время включает чтение строк из БД. По умолчанию — SQLite в памяти (данные генерируются),
+с --database-url — существующая база и шаг --step-id.
+
+    python scripts/bench_serialize.py
+    python scripts/bench_serialize.py --sizes 1000 10000 --repeat 5 --json bench.json
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+from decimal import Decimal
+from time import perf_counter
+
+import sqlalchemy as sa
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# app.db.base требует DATABASE_URL при импорте; для SQLite-режима движок приложения не используется
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.db import models  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.src import fastjson  # noqa: E402
+from app.src.schemas import OperationRead  # noqa: E402
+
+_ADAPTER = TypeAdapter(list[OperationRead])
+
+
+def seed_sqlite(sizes: list[int]):
+    engine = sa.create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    now = datetime.now(timezone.utc)
+    next_id = 1
+    with engine.begin() as conn:
+        for step_id, n in enumerate(sizes, start=1):
+            rows = [
+                dict(
+                    id=next_id + i, budget_id=1, step_id=step_id,
+                    kind="planned" if i % 4 == 0 else "actual",
+                    sign="income" if i % 10 == 0 else "expense",
+                    amount=Decimal(i % 10000) / 100 + 1, currency="EUR", date=now,
+                    account_id=1, account_id_to=None, category_id=(i % 20) or None,
+                    comment=None if i % 3 else f"comment {i}", planned_ref_id=None, created_at=now,
+                )
+                for i in range(n)
+            ]
+            conn.execute(sa.insert(models.Operation), rows)
+            next_id += n
+    return engine, {n: step_id for step_id, n in enumerate(sizes, start=1)}
+
+
+def orm_path(db: Session, step_id: int) -> bytes:
+    ops = (
+        db.query(models.Operation)
+        .filter(models.Operation.step_id == step_id)
+        .order_by(models.Operation.id.asc())
+        .all()
+    )
+    validated = _ADAPTER.validate_python(ops, from_attributes=True)
+    return json.dumps(_ADAPTER.dump_python(validated, mode="json"), separators=(",", ":")).encode()
+
+
+def fast_path(db: Session, step_id: int) -> bytes:
+    q = (
+        sa.select(*fastjson.columns(models.Operation, OperationRead))
+        .where(models.Operation.step_id == step_id)
+        .order_by(models.Operation.id.asc())
+    )
+    return fastjson.dumps(fastjson.records(db.execute(q).all(), OperationRead))
+
+
+def measure(engine, fn, step_id: int, repeat: int) -> tuple[float, int]:
+    best, size = float("inf"), 0
+    for _ in range(repeat):
+        with Session(engine) as db:
+            t0 = perf_counter()
+            body = fn(db, step_id)
+            best = min(best, perf_counter() - t0)
+            size = len(body)
+    return best, size
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    ap.add_argument("--repeat", type=int, default=3, help="число прогонов, берётся лучший")
+    ap.add_argument("--database-url", help="существующая база вместо SQLite в памяти")
+    ap.add_argument("--step-id", type=int, help="шаг для --database-url")
+    ap.add_argument("--json", help="сохранить результаты в файл")
+    args = ap.parse_args()
+
+    if args.database_url:
+        if not args.step_id:
+            ap.error("--step-id is required with --database-url")
+        engine = sa.create_engine(args.database_url)
+        steps = {"db": args.step_id}
+    else:
+        engine, steps = seed_sqlite(args.sizes)
+
+    encoder = "orjson" if fastjson.orjson is not None else "json"
+    print(f"encoder: {encoder}")
+    print(f"{'rows':>8} {'orm, ms':>10} {'fast, ms':>10} {'speedup':>8} {'bytes':>10}")
+    results = []
+    for label, step_id in steps.items():
+        orm_s, size = measure(engine, orm_path, step_id, args.repeat)
+        fast_s, fast_size = measure(engine, fast_path, step_id, args.repeat)
+        if size != fast_size:
+            print(f"warning: body sizes differ ({size} vs {fast_size})", file=sys.stderr)
+        results.append(dict(rows=label, orm_ms=orm_s * 1000, fast_ms=fast_s * 1000,
+                            speedup=orm_s / fast_s, bytes=size))
+        print(f"{label:>8} {orm_s * 1000:>10.1f} {fast_s * 1000:>10.1f} {orm_s / fast_s:>7.1f}x {size:>10}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"encoder": encoder, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Планы запросов горячих путей до/после индексов миграции 048a93199e14.
+
+"До" снимается в той же базе: индексы удаляются внутри транзакции,
+выполняется EXPLAIN ANALYZE и транзакция откатывается (на это время таблицы
+блокируются — запускать на стенде, не на проде).
+
+    DATABASE_URL=postgresql+psycopg://... python scripts/explain_indexes.py --seed 200000
+    python scripts/explain_indexes.py --json plans.json
+"""
+import argparse
+import json
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+
+INDEXES = [
+    "ix_operation_step_kind",
+    "ix_operation_step_created",
+    "ix_operation_budget",
+    "ix_operation_planned_ref",
+    "ix_budget_step_budget_start",
+    "ix_account_budget",
+    "ix_category_budget",
+    "ix_budget_owner",
+]
+
+# Повторяют запросы из app/src/api/steps.py и operations.py
+QUERIES = {
+    "step_feed": """
+        SELECT id, step_id, kind, sign, amount, currency, account_id, account_id_to,
+               category_id, comment, planned_ref_id, created_at
+        FROM operation WHERE step_id = :step_id
+        ORDER BY created_at DESC, id DESC LIMIT 101
+    """,
+    "step_summary": """
+        SELECT coalesce(sum(CASE WHEN sign = 'income' THEN amount ELSE 0 END), 0),
+               coalesce(sum(CASE WHEN sign = 'expense' THEN amount ELSE 0 END), 0)
+        FROM operation WHERE step_id = :step_id AND kind = 'actual'
+    """,
+    "list_operations_kind": """
+        SELECT * FROM operation WHERE step_id = :step_id AND kind = 'planned' ORDER BY id
+    """,
+    "copy_planned_source": """
+        SELECT * FROM operation WHERE step_id = :step_id AND kind = 'planned'
+    """,
+    "list_steps": """
+        SELECT * FROM budget_step WHERE budget_id = :budget_id ORDER BY date_start DESC, id DESC
+    """,
+    "list_accounts": "SELECT * FROM account WHERE budget_id = :budget_id ORDER BY id DESC",
+    "list_categories": "SELECT * FROM category WHERE budget_id = :budget_id ORDER BY id DESC",
+}
+
+SEED_SQL = [
+    """INSERT INTO "user" (email, name, created_at)
+       VALUES ('explain-' || md5(random()::text) || '@example.com', 'explain', now())""",
+    """INSERT INTO budget (owner_user_id, name, currency, created_at)
+       SELECT max(id), 'EXPLAIN', 'EUR', now() FROM "user" """,
+    """INSERT INTO budget_step (budget_id, granularity, name, date_start, date_end, created_at)
+       SELECT (SELECT max(id) FROM budget), 'month', 'm' || g,
+              (date '2020-01-01' + (g || ' month')::interval)::date,
+              (date '2020-01-01' + ((g + 1) || ' month')::interval)::date - 1, now()
+       FROM generate_series(0, :steps - 1) g""",
+    """INSERT INTO account (budget_id, name, currency, is_archived, created_at)
+       SELECT (SELECT max(id) FROM budget), 'acc' || g, 'EUR', false, now() FROM generate_series(1, 5) g""",
+    """INSERT INTO category (budget_id, name, created_at)
+       SELECT (SELECT max(id) FROM budget), 'cat' || g, now() FROM generate_series(1, 20) g""",
+    """INSERT INTO operation (budget_id, step_id, kind, sign, amount, currency, date,
+                              account_id, category_id, created_at)
+       SELECT b.id, s.ids[1 + g % array_length(s.ids, 1)],
+              'actual', 'expense', round((random() * 500 + 1)::numeric, 2), 'EUR', now(),
+              a.ids[1 + g % array_length(a.ids, 1)], c.ids[1 + g % array_length(c.ids, 1)],
+              now() - (g || ' seconds')::interval
+       FROM generate_series(1, :ops) g,
+            (SELECT max(id) AS id FROM budget) b,
+            (SELECT array_agg(id) AS ids FROM budget_step WHERE budget_id = (SELECT max(id) FROM budget)) s,
+            (SELECT array_agg(id) AS ids FROM account WHERE budget_id = (SELECT max(id) FROM budget)) a,
+            (SELECT array_agg(id) AS ids FROM category WHERE budget_id = (SELECT max(id) FROM budget)) c""",
+    # kind/sign в схеме миграций — enum-типы, поэтому литералами, а не через CASE (text)
+    """UPDATE operation SET kind = 'planned'
+       WHERE budget_id = (SELECT max(id) FROM budget) AND id % 4 = 0""",
+    """UPDATE operation SET sign = 'income'
+       WHERE budget_id = (SELECT max(id) FROM budget) AND id % 5 = 0""",
+]
+
+
+def seed(conn, ops: int, steps: int):
+    for sql in SEED_SQL:
+        conn.execute(text(sql), {"ops": ops, "steps": steps})
+
+
+def pick_params(conn) -> dict:
+    # самый «тяжёлый» шаг — на нём разница заметнее всего
+    row = conn.execute(text("""
+        SELECT step_id, budget_id FROM operation
+        GROUP BY step_id, budget_id ORDER BY count(*) DESC LIMIT 1
+    """)).first()
+    if not row:
+        sys.exit("no operations found: run with --seed N")
+    return {"step_id": row.step_id, "budget_id": row.budget_id}
+
+
+def explain_all(conn, params: dict) -> dict:
+    plans = {}
+    for name, sql in QUERIES.items():
+        res = conn.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()
+        plan = res[0] if isinstance(res, list) else json.loads(res)[0]
+        plans[name] = plan
+    return plans
+
+
+def summarize(plan: dict) -> str:
+    nodes = []
+
+    def walk(node):
+        label = node["Node Type"]
+        if node.get("Index Name"):
+            label += f" [{node['Index Name']}]"
+        nodes.append(label)
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan["Plan"])
+    return f"{plan['Execution Time']:9.3f} ms  " + " -> ".join(nodes)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seed", type=int, default=0, help="сгенерировать N операций в новом бюджете")
+    ap.add_argument("--steps", type=int, default=24, help="число шагов для --seed")
+    ap.add_argument("--json", help="сохранить полные планы в файл")
+    args = ap.parse_args()
+
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        sys.exit("DATABASE_URL is not set")
+    engine = create_engine(url, future=True)
+
+    if args.seed:
+        with engine.begin() as conn:
+            seed(conn, args.seed, args.steps)
+        # VACUUM заполняет visibility map — без неё не будет index-only scan по INCLUDE-колонкам
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM ANALYZE"))
+
+    with engine.connect() as conn:
+        params = pick_params(conn)
+        conn.rollback()
+
+        # DROP INDEX транзакционен: после rollback индексы на месте
+        for name in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        before = explain_all(conn, params)
+        conn.rollback()
+
+        after = explain_all(conn, params)
+        conn.rollback()
+
+    print(f"params: {params}")
+    for name in QUERIES:
+        print(f"\n== {name}")
+        print(f"  before {summarize(before[name])}")
+        print(f"  after  {summarize(after[name])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": params, "before": before, "after": after}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+"""
+Нагрузочный прогон API: RPS и перцентили задержек по горячим эндпоинтам.
+
+Данные создаются через сам API (register, budgets, accounts, categories, steps,
+operations/bulk), затем каждый сценарий по очереди нагружается --concurrency
+параллельными клиентами в течение --duration секунд.
+
+Цель — либо запущенный сервер (--base-url), либо приложение в этом же процессе
+(по умолчанию, через httpx.ASGITransport) поверх DATABASE_URL: Postgres с применёнными
+миграциями или SQLite-стенд (схема создаётся через metadata.create_all).
+
+    DATABASE_URL=sqlite:///loadtest.db python scripts/loadtest.py --ops-per-step 2000
+    python scripts/loadtest.py --base-url http://127.0.0.1:8000 --json before.json
+    python scripts/loadtest.py --json after.json --compare before.json
+
+scripts/smoke.sh остаётся для ручной проверки ответов; для замеров — этот скрипт.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+PASSWORD = "loadtest-password"
+
+
+# ---------- Данные ----------
+@dataclass
+class Fixture:
+    email: str = ""
+    user_id: int = 0
+    budget_id: int = 0
+    accounts: list[int] = field(default_factory=list)
+    categories: list[int] = field(default_factory=list)
+    steps: list[int] = field(default_factory=list)
+    copy_source: int = 0
+    copy_targets: list[int] = field(default_factory=list)
+
+
+async def _post(client: httpx.AsyncClient, path: str, body) -> dict:
+    r = await client.post(path, json=body)
+    if r.status_code >= 400:
+        raise RuntimeError(f"seed: POST {path} -> {r.status_code} {r.text[:200]}")
+    return r.json()
+
+
+def _operation(rng: random.Random, fx: Fixture, step_id: int, kind: str) -> dict:
+    sign = rng.choices(("expense", "income", "transfer"), weights=(8, 1, 1))[0]
+    op = {
+        "step_id": step_id,
+        "kind": kind,
+        "sign": sign,
+        "amount": f"{rng.randint(100, 100000) / 100:.2f}",
+        "currency": "EUR",
+        "account_id": fx.accounts[0],
+    }
+    if sign == "transfer":
+        op["account_id_to"] = fx.accounts[1]
+    else:
+        op["category_id"] = rng.choice(fx.categories)
+    return op
+
+
+async def seed(client: httpx.AsyncClient, args, rng: random.Random) -> Fixture:
+    fx = Fixture(email=f"loadtest-{int(time.time())}-{rng.randint(0, 10**6)}@example.com")
+    user = await _post(client, "/api/auth/register", {"email": fx.email, "name": "loadtest", "password": PASSWORD})
+    fx.user_id = user["id"]
+    # cookie сессии по умолчанию Secure и по http не отправляется — токен передаём заголовком
+    r = await client.post("/api/auth/login", json={"email": fx.email, "password": PASSWORD})
+    if r.status_code >= 400 or "session" not in r.cookies:
+        raise RuntimeError(f"seed: login -> {r.status_code} {r.text[:200]}")
+    client.headers["Authorization"] = f"Bearer {r.cookies['session']}"
+    fx.budget_id = (await _post(client, "/api/budgets", {"name": "LOADTEST", "currency": "EUR"}))["id"]
+    for i in range(2):
+        fx.accounts.append((await _post(client, "/api/accounts",
+                                        {"budget_id": fx.budget_id, "name": f"acc{i}", "currency": "EUR"}))["id"])
+    for i in range(args.categories):
+        fx.categories.append((await _post(client, "/api/categories",
+                                          {"budget_id": fx.budget_id, "name": f"cat{i}"}))["id"])
+
+    start = date(2020, 1, 1)
+
+    async def step(name: str, n: int) -> int:
+        d = start + timedelta(days=31 * n)
+        return (await _post(client, "/api/steps", {
+            "budget_id": fx.budget_id, "granularity": "month", "name": name,
+            "date_start": d.isoformat(), "date_end": (d + timedelta(days=30)).isoformat(),
+        }))["id"]
+
+    for i in range(args.steps):
+        fx.steps.append(await step(f"step{i}", i))
+    # отдельные шаги для copy_planned, чтобы копии не раздували шаги остальных сценариев
+    fx.copy_source = await step("copy-source", args.steps)
+    for i in range(args.copy_targets):
+        fx.copy_targets.append(await step(f"copy-target{i}", args.steps + 1 + i))
+
+    ops = [
+        _operation(rng, fx, step_id, "planned" if rng.random() < 0.25 else "actual")
+        for step_id in fx.steps
+        for _ in range(args.ops_per_step)
+    ]
+    ops += [_operation(rng, fx, fx.copy_source, "planned") for _ in range(args.copy_plan_size)]
+    for i in range(0, len(ops), args.seed_chunk):
+        res = await _post(client, "/api/operations/bulk", ops[i:i + args.seed_chunk])
+        if res["errors"]:
+            raise RuntimeError(f"seed: bulk errors {res['errors'][:3]}")
+    return fx
+
+
+# ---------- Сценарии ----------
+# сценарий: (fixture, rng) -> (method, path, json)
+Request = tuple[str, str, dict | None]
+
+SCENARIOS: dict[str, Callable[[Fixture, random.Random], Request]] = {
+    "operations": lambda fx, rng: ("GET", f"/api/operations?step_id={rng.choice(fx.steps)}", None),
+    "step_feed": lambda fx, rng: ("GET", f"/api/steps/{rng.choice(fx.steps)}/feed?limit=100", None),
+    "step_summary": lambda fx, rng: ("GET", f"/api/steps/{rng.choice(fx.steps)}/summary", None),
+    "copy_planned": lambda fx, rng: (
+        "POST", f"/api/steps/{fx.copy_source}/copy_planned", {"to_step_id": rng.choice(fx.copy_targets)},
+    ),
+    "login": lambda fx, rng: ("POST", "/api/auth/login", {"email": fx.email, "password": PASSWORD}),
+}
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    k = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, fx: Fixture, args) -> dict:
+    make = SCENARIOS[name]
+    latencies: list[float] = []
+    errors: dict[str, int] = {}
+    deadline = time.perf_counter() + args.warmup + args.duration
+    measure_from = time.perf_counter() + args.warmup
+
+    async def worker(seed_: int):
+        rng = random.Random(seed_)
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                return
+            method, path, body = make(fx, rng)
+            try:
+                r = await client.request(method, path, json=body)
+                err = None if r.status_code < 400 else str(r.status_code)
+            except httpx.HTTPError as e:
+                err = type(e).__name__
+            t1 = time.perf_counter()
+            if t0 < measure_from:
+                continue
+            if err:
+                errors[err] = errors.get(err, 0) + 1
+            else:
+                latencies.append(t1 - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(args.seed * 1000 + i) for i in range(args.concurrency)))
+    elapsed = max(time.perf_counter() - max(started, measure_from), 1e-9)
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": ms(_percentile(latencies, 50)),
+        "p95_ms": ms(_percentile(latencies, 95)),
+        "p99_ms": ms(_percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else 0.0),
+        "mean_ms": ms(sum(latencies) / len(latencies) if latencies else 0.0),
+    }
+
+
+# ---------- Цель ----------
+def _in_process_transport():
+    from app.src.main import app
+    from app.db.base import Base, engine
+
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(engine)
+
+    return httpx.ASGITransport(app=app), engine.dialect.name
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(__file__),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(results: dict, baseline: dict | None) -> None:
+    head = f"{'scenario':<14} {'rps':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'errors':>7}"
+    if baseline:
+        head += f" {'Δrps':>8} {'Δp99':>8}"
+    print(head)
+    for name, r in results.items():
+        line = (f"{name:<14} {r['rps']:>9.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                f"{r['p99_ms']:>8.2f} {r['max_ms']:>8.2f} {sum(r['errors'].values()):>7}")
+        base = (baseline or {}).get(name)
+        if base:
+            for key in ("rps", "p99_ms"):
+                line += f" {(r[key] / base[key] - 1) * 100:>+7.1f}%" if base[key] else f" {'-':>8}"
+        print(line)
+
+
+async def main_async(args) -> dict:
+    rng = random.Random(args.seed)
+    if args.base_url:
+        transport, dialect = None, None
+    else:
+        transport, dialect = _in_process_transport()
+    base_url = args.base_url or "http://loadtest"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=args.timeout) as client:
+        t0 = time.perf_counter()
+        fx = await seed(client, args, rng)
+        seed_s = time.perf_counter() - t0
+        print(f"seeded budget {fx.budget_id}: {len(fx.steps)} steps x {args.ops_per_step} ops in {seed_s:.1f}s")
+
+        results = {}
+        for name in args.scenarios:
+            results[name] = await run_scenario(client, name, fx, args)
+
+    return {
+        "meta": {
+            "git": _git_rev(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "target": args.base_url or "in-process",
+            "dialect": dialect,
+            "python": platform.python_version(),
+            "params": {k: getattr(args, k) for k in (
+                "concurrency", "duration", "warmup", "steps", "ops_per_step", "categories",
+                "copy_plan_size", "copy_targets", "seed",
+            )},
+            "seed_seconds": round(seed_s, 2),
+        },
+        "results": results,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base-url", help="URL запущенного сервера; по умолчанию приложение в этом процессе")
+    ap.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    ap.add_argument("--concurrency", type=int, default=16, help="параллельных клиентов")
+    ap.add_argument("--duration", type=float, default=10.0, help="секунд на сценарий")
+    ap.add_argument("--warmup", type=float, default=1.0, help="секунд прогрева (не учитываются)")
+    ap.add_argument("--timeout", type=float, default=30.0, help="таймаут запроса, сек.")
+    ap.add_argument("--steps", type=int, default=12)
+    ap.add_argument("--ops-per-step", type=int, default=1000)
+    ap.add_argument("--categories", type=int, default=20)
+    ap.add_argument("--copy-plan-size", type=int, default=20, help="плановых операций в шаге-источнике copy_planned")
+    ap.add_argument("--copy-targets", type=int, default=8)
+    ap.add_argument("--seed-chunk", type=int, default=5000, help="операций в одном запросе /operations/bulk")
+    ap.add_argument("--seed", type=int, default=1, help="seed генератора случайных чисел")
+    ap.add_argument("--json", help="сохранить результат в файл")
+    ap.add_argument("--compare", help="JSON предыдущего прогона: показать изменения rps/p99")
+    args = ap.parse_args()
+
+    report = asyncio.run(main_async(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    _print_table(report["results"], baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Тесты на SQLite-стенде: схема — metadata.create_all заново на каждый тест, запросы — через
+TestClient без lifespan (фоновые циклы не запускаются, пул импорта не останавливается).
+Настройки окружения задаются до импорта приложения: движок создаётся при импорте app.db.base.
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+from datetime import date
+from types import SimpleNamespace
+
+_TMP = tempfile.mkdtemp(prefix="budget-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ["DB_ASYNC"] = "0"
+os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["COOKIE_SECURE"] = "0"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import models
+from app.db.base import Base, SessionLocal, engine
+from app.src import acl, auth_cache, fx
+from app.src.main import app
+from app.src.security import create_jwt
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    # кеши процесса переживают пересоздание схемы, а id начинаются заново
+    for cache in (acl.roles_cache, acl.resources, auth_cache.tokens, fx._cache):
+        cache.clear()
+    yield
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def make_user(db, email: str) -> SimpleNamespace:
+    user = models.User(email=email, name=email.split("@")[0])
+    db.add(user)
+    db.commit()
+    return SimpleNamespace(id=user.id, headers={"Authorization": f"Bearer {create_jwt(user.id)}"})
+
+
+@pytest.fixture
+def owner(db):
+    return make_user(db, "owner@example.com")
+
+
+@pytest.fixture
+def budget(client, owner):
+    """Бюджет владельца owner в RUB: счёт RUB и шаг «март 2026»."""
+    h = owner.headers
+    b = client.post("/api/budgets", json={"name": "home", "currency": "RUB"}, headers=h).json()
+    acc = client.post("/api/accounts", json={"budget_id": b["id"], "name": "card", "currency": "RUB"}, headers=h).json()
+    step = client.post("/api/steps", headers=h, json={
+        "budget_id": b["id"], "granularity": "month", "name": "march",
+        "date_start": "2026-03-01", "date_end": "2026-03-31",
+    }).json()
+    return SimpleNamespace(id=b["id"], account_id=acc["id"], step_id=step["id"], headers=h)
+
+
+def add_step(client, budget, name: str, start: date, end: date) -> int:
+    resp = client.post("/api/steps", headers=budget.headers, json={
+        "budget_id": budget.id, "granularity": "month", "name": name,
+        "date_start": start.isoformat(), "date_end": end.isoformat(),
+    })
+    assert resp.status_code == 200, resp.text
+    return resp.json()["id"]
+
+
+def add_op(client, budget, *, step_id=None, kind="actual", sign="expense", amount="100.00",
+           currency="RUB", account_id=None, date="2026-03-10T12:00:00+00:00", **extra) -> dict:
+    resp = client.post("/api/operations", headers=budget.headers, json={
+        "step_id": step_id or budget.step_id, "kind": kind, "sign": sign, "amount": amount,
+        "currency": currency, "account_id": account_id or budget.account_id, "date": date, **extra,
+    })
+    assert resp.status_code == 201, resp.text
+    return resp.json()
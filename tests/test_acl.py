@@ -0,0 +1,88 @@
+import pytest
+import sqlalchemy as sa
+
+from app.db import models
+from app.db.base import engine
+from conftest import add_op, make_user
+
+
+@pytest.fixture
+def queries():
+    """Тексты SQL, выполненных во время теста."""
+    seen: list[str] = []
+
+    def record(conn, cursor, statement, *args):
+        seen.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    sa.event.remove(engine, "before_cursor_execute", record)
+
+
+def _share(client, budget, user, role):
+    resp = client.put(f"/api/budgets/{budget.id}/shares/{user.id}", json={"role": role}, headers=budget.headers)
+    assert resp.status_code == 200, resp.text
+
+
+def _create_op(client, budget, user):
+    return client.post("/api/operations", headers=user.headers, json={
+        "step_id": budget.step_id, "kind": "actual", "sign": "expense", "amount": "1.00",
+        "currency": "RUB", "account_id": budget.account_id,
+    })
+
+
+def _summary(client, budget, user):
+    return client.get(f"/api/steps/{budget.step_id}/summary", headers=user.headers)
+
+
+def test_roles(client, budget, db):
+    viewer, editor, stranger = (make_user(db, f"{n}@example.com") for n in ("viewer", "editor", "stranger"))
+    _share(client, budget, viewer, "viewer")
+    _share(client, budget, editor, "editor")
+
+    assert _summary(client, budget, viewer).status_code == 200
+    assert _create_op(client, budget, viewer).status_code == 403
+    assert _create_op(client, budget, editor).status_code == 201
+    # нет доступа — как будто шага нет
+    assert _summary(client, budget, stranger).status_code == 404
+    assert _create_op(client, budget, stranger).status_code == 400
+    # делиться бюджетом может только владелец
+    resp = client.put(f"/api/budgets/{budget.id}/shares/{stranger.id}", json={"role": "viewer"},
+                      headers=editor.headers)
+    assert resp.status_code == 403
+
+
+def test_roles_and_resources_are_cached(client, budget, db, queries):
+    viewer = make_user(db, "viewer@example.com")
+    _share(client, budget, viewer, "viewer")
+    assert _summary(client, budget, viewer).status_code == 200
+
+    queries.clear()
+    assert _summary(client, budget, viewer).status_code == 200
+    assert not [q for q in queries if "budget_share" in q]
+    # budget_id шага для проверки доступа — из кеша ресурсов
+    assert not [q for q in queries if q.startswith("SELECT budget_step.budget_id \nFROM budget_step")]
+
+
+def test_share_changes_apply_immediately(client, budget, db):
+    user = make_user(db, "user@example.com")
+    _share(client, budget, user, "viewer")
+    assert _create_op(client, budget, user).status_code == 403   # карта ролей закеширована
+
+    _share(client, budget, user, "editor")
+    assert _create_op(client, budget, user).status_code == 201
+
+    resp = client.delete(f"/api/budgets/{budget.id}/shares/{user.id}", headers=budget.headers)
+    assert resp.status_code == 204
+    assert _summary(client, budget, user).status_code == 404
+
+
+def test_owner_change_through_orm_resets_both_users(client, budget, db, owner):
+    heir = make_user(db, "heir@example.com")
+    add_op(client, budget)
+    assert _summary(client, budget, heir).status_code == 404
+
+    db.get(models.Budget, budget.id).owner_user_id = heir.id
+    db.commit()
+    assert _create_op(client, budget, heir).status_code == 201
+    assert _summary(client, budget, owner).status_code == 404
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+import sqlalchemy as sa
+
+from app.db.base import engine
+
+
+@pytest.fixture
+def sql_on_event_loop():
+    """Запросы, выполненные в потоке event loop (а не в threadpool)."""
+    seen = []
+
+    def record(conn, cursor, statement, *args):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        seen.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    sa.event.remove(engine, "before_cursor_execute", record)
+
+
+def test_register_then_login(client, sql_on_event_loop):
+    body = {"name": "Ann", "email": " Ann@Example.com ", "password": "secret-pass"}
+    resp = client.post("/api/auth/register", json=body)
+    assert resp.status_code == 201, resp.text
+    assert resp.json()["email"] == "ann@example.com"
+
+    assert client.post("/api/auth/register", json=body).status_code == 409
+    assert client.post("/api/auth/login", json={"email": "ann@example.com", "password": "nope"}).status_code == 401
+    resp = client.post("/api/auth/login", json={"email": "ann@example.com", "password": "secret-pass"})
+    assert resp.status_code == 200
+    assert client.get("/api/auth/me").json()["email"] == "ann@example.com"
+    # register и login — async-обработчики: запросы к БД не должны останавливать event loop
+    assert sql_on_event_loop == []
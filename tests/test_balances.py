@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from app.src import balances
+from conftest import add_op
+
+AS_OF = datetime(2026, 3, 15, tzinfo=timezone.utc)
+
+
+def _balance(client, budget, account_id=None, **params):
+    resp = client.get(f"/api/accounts/{account_id or budget.account_id}/balance", params=params,
+                      headers=budget.headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def _second_account(client, budget, currency="RUB"):
+    resp = client.post("/api/accounts", json={"budget_id": budget.id, "name": "cash", "currency": currency},
+                       headers=budget.headers)
+    return resp.json()["id"]
+
+
+def test_balance_without_snapshot_sums_actual_operations(client, budget):
+    cash = _second_account(client, budget)
+    add_op(client, budget, sign="income", amount="1000.00")
+    add_op(client, budget, sign="expense", amount="300.00")
+    add_op(client, budget, sign="transfer", amount="200.00", account_id_to=cash)
+    add_op(client, budget, kind="planned", sign="expense", amount="999.00")
+
+    card = _balance(client, budget)
+    assert Decimal(card["balance"]) == Decimal("500.00")
+    assert card["snapshot_as_of"] is None
+    assert card["ops_since_snapshot"] == 3
+    assert Decimal(_balance(client, budget, cash)["balance"]) == Decimal("200.00")
+
+
+def test_snapshot_plus_delta_matches_full_history(client, budget, db):
+    add_op(client, budget, sign="income", amount="1000.00", date="2026-03-05T00:00:00+00:00")
+    add_op(client, budget, sign="expense", amount="100.00", date="2026-03-10T00:00:00+00:00")
+    assert balances.snapshot(db, min_ops=1, as_of=AS_OF) == (1, 0)
+
+    add_op(client, budget, sign="expense", amount="40.00", date="2026-03-20T00:00:00+00:00")
+    # записана после снимка, но задним числом — должна попасть в дельту
+    add_op(client, budget, sign="expense", amount="60.00", date="2026-03-12T00:00:00+00:00")
+
+    card = _balance(client, budget)
+    assert Decimal(card["balance"]) == Decimal("800.00")
+    assert card["snapshot_as_of"].startswith("2026-03-15")
+    assert card["ops_since_snapshot"] == 2
+
+    # на момент до снимка он не используется
+    early = _balance(client, budget, at="2026-03-11T00:00:00+00:00")
+    assert Decimal(early["balance"]) == Decimal("900.00")
+    assert early["snapshot_as_of"] is None
+
+
+def test_latest_snapshot_before_at_is_used(client, budget, db):
+    add_op(client, budget, sign="income", amount="100.00", date="2026-03-05T00:00:00+00:00")
+    balances.snapshot(db, min_ops=1, as_of=datetime(2026, 3, 6, tzinfo=timezone.utc))
+    add_op(client, budget, sign="income", amount="10.00", date="2026-03-20T00:00:00+00:00")
+    balances.snapshot(db, min_ops=1, as_of=datetime(2026, 3, 21, tzinfo=timezone.utc))
+
+    mid = _balance(client, budget, at="2026-03-10T00:00:00+00:00")
+    assert mid["snapshot_as_of"].startswith("2026-03-06")
+    assert Decimal(mid["balance"]) == Decimal("100.00")
+    assert Decimal(_balance(client, budget)["balance"]) == Decimal("110.00")
+
+
+def test_foreign_currency_operations_are_counted_not_summed(client, budget, db):
+    add_op(client, budget, sign="income", amount="1000.00", date="2026-03-05T00:00:00+00:00")
+    add_op(client, budget, sign="expense", amount="10.00", currency="USD", date="2026-03-06T00:00:00+00:00")
+    balances.snapshot(db, min_ops=1, as_of=AS_OF)
+    add_op(client, budget, sign="expense", amount="5.00", currency="EUR", date="2026-03-20T00:00:00+00:00")
+
+    card = _balance(client, budget)
+    assert Decimal(card["balance"]) == Decimal("1000.00")
+    assert card["unconverted_ops"] == 2
+
+    resp = client.get(f"/api/budgets/{budget.id}/balances", headers=budget.headers)
+    assert [b["unconverted_ops"] for b in resp.json()] == [2]
@@ -0,0 +1,76 @@
+import io
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from app.db import models
+from app.src import imports
+
+STATEMENT = (
+    "date,amount,comment\n"
+    "2026-03-02,-12.50,coffee\n"
+    "2026-03-02,-12.50,coffee\n"   # вторая такая же покупка за день — не дубль
+    "2026-03-05,1000.00,salary\n"
+    "2026-03-07,oops,broken\n"
+).encode()
+
+
+def _import(db, budget, data: bytes) -> models.ImportJob:
+    job = imports.create_job(db, budget.id, budget.account_id, "csv", len(data))
+    imports._run_job(job.id, io.BytesIO(data), imports.Options())
+    db.expire_all()
+    return db.get(models.ImportJob, job.id)
+
+
+def _actual_ops(db, budget):
+    op = models.Operation
+    return db.execute(
+        sa.select(op.sign, op.amount, op.step_id).where(op.budget_id == budget.id).order_by(op.id)
+    ).all()
+
+
+def test_reimport_creates_no_duplicates(db, budget):
+    first = _import(db, budget, STATEMENT)
+    assert (first.status, first.created, first.duplicates, first.failed) == ("done", 3, 0, 1)
+    assert first.errors[0]["row"] == 5  # строка файла, считая заголовок
+
+    # пересекающаяся выписка: старые строки пропускаются, новая добавляется
+    second = _import(db, budget, STATEMENT + b"2026-03-09,-3.00,bus\n")
+    assert (second.status, second.created, second.duplicates) == ("done", 1, 3)
+
+    ops = _actual_ops(db, budget)
+    assert [(sign, amount) for sign, amount, _ in ops] == [
+        ("expense", Decimal("12.50")), ("expense", Decimal("12.50")),
+        ("income", Decimal("1000.00")), ("expense", Decimal("3.00")),
+    ]
+    assert {step_id for *_, step_id in ops} == {budget.step_id}
+
+
+def test_stopping_fails_job_at_chunk_boundary(db, budget):
+    imports._stopping.set()
+    try:
+        job = _import(db, budget, STATEMENT)
+    finally:
+        imports._stopping.clear()
+    assert job.status == "failed"
+    assert job.errors[-1] == {"row": 0, "error": imports._INTERRUPTED}
+    assert _actual_ops(db, budget) == []
+
+
+def test_fail_orphaned_fails_queued_and_running_jobs(db, budget):
+    jobs = {}
+    for status in ("queued", "running", "done"):
+        job = models.ImportJob(budget_id=budget.id, account_id=budget.account_id, format="csv",
+                               status=status, errors=[])
+        db.add(job)
+        db.commit()
+        jobs[status] = job.id
+
+    assert imports.fail_orphaned(db) == 2
+    db.expire_all()
+    for status in ("queued", "running"):
+        job = db.get(models.ImportJob, jobs[status])
+        assert job.status == "failed"
+        assert job.errors == [{"row": 0, "error": imports._INTERRUPTED}]
+        assert job.finished_at is not None
+    assert db.get(models.ImportJob, jobs["done"]).status == "done"
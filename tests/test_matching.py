@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from types import SimpleNamespace
+
+import sqlalchemy as sa
+
+from app.db import models
+from app.src import matching
+from conftest import add_op, make_user
+
+_ids = iter(range(1, 10_000))
+
+
+def _row(kind, amount, day, *, category_id=None, sign="expense", currency="RUB", account_id=1):
+    return SimpleNamespace(
+        id=next(_ids), kind=kind, sign=sign, amount=Decimal(amount), currency=currency,
+        date=datetime(2026, 3, day, tzinfo=timezone.utc), account_id=account_id, account_id_to=None,
+        category_id=category_id,
+    )
+
+
+def _pairs(planned, actual, tolerance="0.1", window=10):
+    return {(link.actual_id, link.planned_ref_id) for link in matching.match(planned, actual, Decimal(tolerance), window)}
+
+
+def test_match_picks_closest_plan_once():
+    p100, p120 = _row("planned", "100", 1), _row("planned", "120", 1)
+    a98, a101, a118 = _row("actual", "98", 2), _row("actual", "101", 3), _row("actual", "118", 2)
+    # 98 и 101 хотят один план 100: он достаётся ближайшему, для 98 другого плана в допуске нет
+    assert _pairs([p100, p120], [a98, a101, a118]) == {(a101.id, p100.id), (a118.id, p120.id)}
+
+
+def test_match_respects_tolerance_window_and_bucket():
+    plan = _row("planned", "100", 1)
+    assert _pairs([plan], [_row("actual", "112", 1)]) == set()               # сумма вне допуска (доля суммы факта)
+    assert _pairs([plan], [_row("actual", "100", 20)]) == set()              # дата вне окна
+    assert _pairs([plan], [_row("actual", "100", 1, currency="USD")]) == set()
+    assert _pairs([plan], [_row("actual", "100", 1, account_id=2)]) == set()
+    assert _pairs([plan], [_row("actual", "100", 1, sign="income")]) == set()
+    near = _row("actual", "100", 11)
+    assert _pairs([plan], [near]) == {(near.id, plan.id)}
+
+
+def test_match_prefers_same_category():
+    food, anything, rent = _row("planned", "100", 1, category_id=1), _row("planned", "100", 1), \
+        _row("planned", "100", 1, category_id=2)
+    fact = _row("actual", "100", 1, category_id=1)
+    assert _pairs([anything, food], [fact]) == {(fact.id, food.id)}
+    # план другой категории не подходит, план без категории — подходит
+    assert _pairs([rent], [fact]) == set()
+    assert _pairs([rent, anything], [fact]) == {(fact.id, anything.id)}
+
+
+def _refs(db, budget):
+    op = models.Operation
+    db.expire_all()
+    return dict(db.execute(sa.select(op.id, op.planned_ref_id).where(op.kind == "actual")).all())
+
+
+def test_match_endpoint(client, budget, db):
+    plan = add_op(client, budget, kind="planned", amount="500.00", date="2026-03-01T00:00:00+00:00")
+    fact = add_op(client, budget, amount="490.00", date="2026-03-03T00:00:00+00:00")
+    linked_plan = add_op(client, budget, kind="planned", amount="70.00")
+    add_op(client, budget, amount="70.00", planned_ref_id=linked_plan["id"])
+    url = f"/api/steps/{budget.step_id}/match"
+
+    viewer = make_user(db, "viewer@example.com")
+    client.put(f"/api/budgets/{budget.id}/shares/{viewer.id}", json={"role": "viewer"}, headers=budget.headers)
+    dry = client.post(url, json={"dry_run": True}, headers=viewer.headers).json()
+    # уже связанные план и факт в сопоставлении не участвуют
+    assert (dry["planned"], dry["actual"], dry["matched"]) == (1, 1, 1)
+    assert dry["links"] == [{"actual_id": fact["id"], "planned_ref_id": plan["id"], "amount_diff": "-10.00", "days": 2}]
+    assert _refs(db, budget)[fact["id"]] is None
+    assert client.post(url, json={}, headers=viewer.headers).status_code == 403
+
+    resp = client.post(url, json={"amount_tolerance": "0.01"}, headers=budget.headers).json()
+    assert resp["matched"] == 0
+
+    resp = client.post(url, headers=budget.headers).json()
+    assert resp["matched"] == 1
+    assert _refs(db, budget)[fact["id"]] == plan["id"]
+    assert client.post(url, headers=budget.headers).json()["actual"] == 0
@@ -0,0 +1,76 @@
+import json
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+
+from app.db.base import engine
+from app.src.api import operations
+from conftest import make_user
+
+
+def _op(budget, amount, **extra):
+    return {"step_id": budget.step_id, "kind": "actual", "sign": "expense", "amount": amount,
+            "currency": "RUB", "account_id": budget.account_id, "date": "2026-03-10T12:00:00+00:00", **extra}
+
+
+def _total_expense(client, budget):
+    resp = client.get(f"/api/steps/{budget.step_id}/summary", headers=budget.headers)
+    return Decimal(resp.json()["total_expense"])
+
+
+@pytest.fixture
+def failing_insert():
+    """Триггер SQLite: INSERT операции с комментарием 'boom' падает в базе, уже после проверок ссылок."""
+    with engine.begin() as conn:
+        conn.execute(sa.text(
+            "CREATE TRIGGER op_boom BEFORE INSERT ON operation WHEN NEW.comment = 'boom' "
+            "BEGIN SELECT RAISE(ABORT, 'boom'); END"
+        ))
+
+
+def test_bulk_failed_chunk_rolls_back_only_itself(client, budget, monkeypatch, failing_insert):
+    monkeypatch.setattr(operations, "BULK_CHUNK_SIZE", 2)
+    items = [
+        _op(budget, "10.00"), _op(budget, "20.00"),               # пачка 1
+        _op(budget, "30.00", comment="boom"), _op(budget, "40.00"),  # пачка 2 — INSERT падает
+        _op(budget, "-1"),                                         # не проходит валидацию
+        _op(budget, "60.00", step_id=999), _op(budget, "50.00"),   # пачка 3
+    ]
+    resp = client.post("/api/operations/bulk", json=items, headers=budget.headers)
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+
+    assert body["created"] == 3
+    assert [i for i, x in enumerate(body["ids"]) if x is not None] == [0, 1, 6]
+    errors = {e["index"]: e["error"] for e in body["errors"]}
+    assert sorted(errors) == [2, 3, 4, 5]
+    assert errors[2].startswith("insert failed") and errors[3].startswith("insert failed")
+    assert errors[5] == "step_id not found"
+    # итоги шага откатились вместе с пачкой
+    assert _total_expense(client, budget) == Decimal("80.00")
+
+
+def test_bulk_ndjson_reports_bad_lines(client, budget):
+    body = "\n".join([json.dumps(_op(budget, "10.00")), "{not json", json.dumps(_op(budget, "5.00"))]) + "\n"
+    resp = client.post("/api/operations/bulk", content=body, headers={
+        **budget.headers, "Content-Type": "application/x-ndjson",
+    })
+    assert resp.status_code == 200, resp.text
+    result = resp.json()
+    assert result["created"] == 2
+    assert [e["index"] for e in result["errors"]] == [1]
+    assert result["errors"][0]["error"].startswith("invalid json")
+    assert _total_expense(client, budget) == Decimal("15.00")
+
+
+def test_bulk_checks_access_per_item(client, budget, db):
+    viewer = make_user(db, "viewer@example.com")
+    stranger = make_user(db, "stranger@example.com")
+    client.put(f"/api/budgets/{budget.id}/shares/{viewer.id}", json={"role": "viewer"}, headers=budget.headers)
+
+    resp = client.post("/api/operations/bulk", json=[_op(budget, "10.00")], headers=viewer.headers)
+    assert resp.json()["errors"] == [{"index": 0, "error": "forbidden"}]
+    resp = client.post("/api/operations/bulk", json=[_op(budget, "10.00")], headers=stranger.headers)
+    assert resp.json()["errors"] == [{"index": 0, "error": "step_id not found"}]
+    assert _total_expense(client, budget) == 0
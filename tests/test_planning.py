@@ -0,0 +1,70 @@
+from datetime import date
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from app.db import models
+from conftest import add_op, add_step
+
+
+def _summary(client, budget, step_id):
+    resp = client.get(f"/api/steps/{step_id}/summary", headers=budget.headers)
+    assert resp.status_code == 200, resp.text
+    return resp.json()
+
+
+def test_copy_planned_to_other_step_keeps_dates_and_totals(client, budget):
+    april = add_step(client, budget, "april", date(2026, 4, 1), date(2026, 4, 30))
+    add_op(client, budget, kind="planned", amount="100.00")
+    add_op(client, budget, kind="planned", amount="50.00")
+    add_op(client, budget, kind="actual", amount="70.00")
+
+    resp = client.post(f"/api/steps/{budget.step_id}/copy_planned", json={"to_step_id": april}, headers=budget.headers)
+    assert resp.json() == {"copied": 2}
+
+    summary = _summary(client, budget, april)
+    assert summary["planned_expense"] == "150.00"
+    assert Decimal(summary["total_expense"]) == 0
+    assert [t["ops_count"] for t in summary["by_currency"]] == [2]
+    # исходный шаг не изменился
+    assert _summary(client, budget, budget.step_id)["planned_expense"] == "150.00"
+
+
+def test_copy_planned_into_same_step_is_rejected(client, budget):
+    add_op(client, budget, kind="planned", amount="100.00")
+    resp = client.post(f"/api/steps/{budget.step_id}/copy_planned", json={"to_step_id": budget.step_id},
+                       headers=budget.headers)
+    assert resp.status_code == 400
+    assert _summary(client, budget, budget.step_id)["planned_expense"] == "100.00"
+
+
+def test_copy_planned_into_source_step_counts_only_source_rows(db, client, budget):
+    # сам planning.copy_planned допускает цель = источник: итоги — по строкам до копирования
+    from app.src import planning, totals
+
+    add_op(client, budget, kind="planned", amount="100.00")
+    assert planning.copy_planned(db, budget.step_id, [budget.step_id]) == 1
+    db.commit()
+    (row,) = totals.step_totals(db, budget.step_id)
+    assert (row.amount, row.ops_count) == (200, 2)
+
+
+def test_copy_planned_with_step_start_dates_reads_back(db, client, budget):
+    april = add_step(client, budget, "april", date(2026, 4, 1), date(2026, 4, 30))
+    add_op(client, budget, kind="planned", amount="100.00", comment="rent")
+
+    resp = client.post("/api/operations/copy_planned", headers=budget.headers,
+                       params={"source_step_id": budget.step_id, "target_step_id": april})
+    assert resp.status_code == 201
+    assert resp.json() == {"copied": 1}
+
+    # даты копий читаются обратно как datetime (в SQLite раньше записывалось число 2026)
+    op = models.Operation
+    assert [d.date() for d in db.scalars(sa.select(op.date).where(op.step_id == april))] == [date(2026, 4, 1)]
+    found = client.get(f"/api/budgets/{budget.id}/operations/search", params={"q": "rent"},
+                       headers=budget.headers)
+    assert found.status_code == 200
+    assert sorted(o["date"][:10] for o in found.json()["items"]) == ["2026-03-10", "2026-04-01"]
+    export = client.get(f"/api/budgets/{budget.id}/export", params={"format": "csv"}, headers=budget.headers)
+    assert export.status_code == 200
+    assert "2026-04-01" in export.text
@@ -0,0 +1,67 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import sqlalchemy as sa
+
+from app.db import models
+from app.src import imports, totals
+from conftest import add_op, add_step
+
+
+def _totals(db) -> dict:
+    t = models.StepTotal
+    rows = db.execute(sa.select(t.step_id, t.kind, t.sign, t.currency, t.amount, t.ops_count)).all()
+    return {tuple(r[:4]): (Decimal(r[4]), r[5]) for r in rows if r[5]}
+
+
+def test_every_write_path_matches_rebuild(client, budget, db):
+    april = add_step(client, budget, "april", date(2026, 4, 1), date(2026, 4, 30))
+    cash = client.post("/api/accounts", json={"budget_id": budget.id, "name": "cash", "currency": "RUB"},
+                       headers=budget.headers).json()["id"]
+    add_op(client, budget, sign="income", amount="1000.00")
+    add_op(client, budget, amount="12.34", currency="USD")
+    add_op(client, budget, sign="transfer", amount="50.00", account_id_to=cash)
+    add_op(client, budget, kind="planned", amount="300.00")
+    add_op(client, budget, kind="planned", amount="0.01")
+    client.post("/api/operations/bulk", headers=budget.headers, json=[
+        {"step_id": s, "kind": "actual", "sign": "expense", "amount": "7.00", "currency": "RUB",
+         "account_id": budget.account_id, "date": "2026-03-11T00:00:00+00:00"}
+        for s in (budget.step_id, april, april)
+    ])
+    data = b"date,amount,comment\n2026-03-02,-1.50,tea\n2026-04-02,2.50,refund\n"
+    job = imports.create_job(db, budget.id, budget.account_id, "csv", len(data))
+    imports._run_job(job.id, io.BytesIO(data), imports.Options())
+    client.post(f"/api/steps/{budget.step_id}/copy_planned", json={"to_step_id": april}, headers=budget.headers)
+
+    db.expire_all()
+    incremental = _totals(db)
+    assert incremental[(budget.step_id, "actual", "expense", "RUB")] == (Decimal("8.50"), 2)
+    assert incremental[(april, "planned", "expense", "RUB")] == (Decimal("300.01"), 2)
+
+    totals.rebuild(db)
+    db.commit()
+    assert _totals(db) == incremental
+
+
+def test_add_totals_subtracts_with_negative_factor(budget, db):
+    op = dict(step_id=budget.step_id, kind="actual", sign="expense", currency="RUB")
+    totals.add_totals(db, [dict(op, amount=Decimal("10.00")), dict(op, amount=Decimal("5.00"))])
+    totals.add_totals(db, [dict(op, amount=Decimal("10.00"))], factor=-1)
+    db.commit()
+    assert _totals(db) == {(budget.step_id, "actual", "expense", "RUB"): (Decimal("5.00"), 1)}
+
+
+def test_rebuild_of_given_steps_leaves_others(client, budget, db):
+    april = add_step(client, budget, "april", date(2026, 4, 1), date(2026, 4, 30))
+    add_op(client, budget, amount="10.00")
+    add_op(client, budget, step_id=april, amount="20.00", date="2026-04-10T00:00:00+00:00")
+    db.execute(sa.update(models.StepTotal).values(amount=Decimal("999.00")))
+    db.commit()
+
+    totals.rebuild(db, [budget.step_id])
+    db.commit()
+    assert _totals(db) == {
+        (budget.step_id, "actual", "expense", "RUB"): (Decimal("10.00"), 1),
+        (april, "actual", "expense", "RUB"): (Decimal("999.00"), 1),
+    }